@@ -1,7 +1,5 @@
 import streamlit as st
-import pandas as pd
 import ssl
-from openai import OpenAI
 import re
 from datetime import date
 import json
@@ -9,6 +7,14 @@ import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from riplo.autosave import load_namespace
+from riplo.calendar_pipeline import load_calendar
+from riplo.feed import export_url, feed_available
+from riplo.ideas import parse_post_idea
+from riplo.jobs import is_active
+from riplo.post_builder import EXPORT_DOWNLOAD_MAX_BYTES, POST_PARTS, export_path, post_file
+from riplo.session import current_workspace, follow_job, job_newly_finished, job_progress, start_job, workspace_sidebar
+
 
 
 # Load environment variables from .env
@@ -19,108 +25,17 @@ load_dotenv()
 
 
 
-# Define functions to save and load data
-def save_data(data, filename='sessiondata.json'):
-    with open(filename, 'w') as file:
-        json.dump(data, file)
-
-def load_data(filename='sessiondata.json'):
-    if not os.path.exists(filename):
-        # Create an empty JSON file if it doesn't exist
-        with open(filename, 'w') as file:
-            json.dump({}, file)
-    try:
-        with open(filename, 'r') as file:
-            content = file.read().strip()  # Read file content and strip any whitespace
-            if content:
-                return json.loads(content)  # Load JSON data if the content is not empty
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    return {}  # Return an empty dictionary if the file is not found or if there's a JSON decode error
-
-# Load existing data
-data = load_data()
-
-# Initialize SessionState for inputs
-if 'inputs' not in st.session_state:
-    st.session_state.inputs = data.get('inputs', {})
-
-def auto_save_inputs():
-    # Directly assign the entire inputs dictionary to the data dictionary
-    data['inputs'] = st.session_state.inputs
-    save_data(data)
-
-
-
-
-# Fetch data from Google Sheets
-def fetch_google_sheet_data(sheet_url):
-    df = pd.read_csv(sheet_url, header=None)
-    df = df.transpose()
-    return df
-
-# Define the URLs of the Google Sheet tabs (CSV export links)
-primary_sheet_url = "https://docs.google.com/spreadsheets/d/1saYSGXsYJqnGQ5jIoH_feXgBKk41aDEMZIRuQEQXl6c/export?format=csv&gid=78226312"
-questionnaire_sheet_url = "https://docs.google.com/spreadsheets/d/1saYSGXsYJqnGQ5jIoH_feXgBKk41aDEMZIRuQEQXl6c/export?format=csv&gid=470780055"
-summaries_sheet_url = "https://docs.google.com/spreadsheets/d/1saYSGXsYJqnGQ5jIoH_feXgBKk41aDEMZIRuQEQXl6c/export?format=csv&gid=1055847394"
-
-# Fetch data from both sheets
-primary_df = fetch_google_sheet_data(primary_sheet_url)
-questionnaire_df = fetch_google_sheet_data(questionnaire_sheet_url)
-summaries_df = fetch_google_sheet_data(summaries_sheet_url)
-
-# Extract variables from dataframes
-business_name_primary = primary_df.iloc[1, 0]
-industry_primary = primary_df.iloc[1, 1]
-locations_primary = primary_df.iloc[1, 2]
-uvp_primary = primary_df.iloc[1, 4]
-usp_primary = primary_df.iloc[1, 5]
-products_overview_primary = primary_df.iloc[1, 6]
-products_details_primary = primary_df.iloc[1, 7]
-ta_specific_primary = primary_df.iloc[1, 8]
-company_history_primary = primary_df.iloc[1, 10]
-employee_details_primary = primary_df.iloc[1, 11]
-org_structure_primary = primary_df.iloc[1, 12]
-seasonality_primary = primary_df.iloc[1, 13]
-customer_journey_primary = primary_df.iloc[1, 14]
-sales_process_primary = primary_df.iloc[1, 15]
-sustainability_primary = primary_df.iloc[1, 18]
-community_primary = primary_df.iloc[1, 19]
-customer_feedback_primary = primary_df.iloc[1, 21]
-pricing_strategy_primary = primary_df.iloc[1, 23]
-marketing_strategies_primary = primary_df.iloc[1, 24]
-loyalty_primary = primary_df.iloc[1, 25]
-competetive_advantage_primary = primary_df.iloc[1, 26]
-problems_solved_primary = primary_df.iloc[1, 27]
-needs_fulfilled_primary = primary_df.iloc[1, 28]
-impact_customers_primary = primary_df.iloc[1, 29]
-brand_visual_elements = primary_df.iloc[1, 30]
-caption_style_primary = primary_df.iloc[1, 31]
-caption_examples_primary = primary_df.iloc[1, 32]
-key_publicdates_primary = primary_df.iloc[1, 33]
-opening_hours_primary = primary_df.iloc[1, 34]
-
-
-values_form = questionnaire_df.iloc[1, 0]
-brand_personality_form = questionnaire_df.iloc[1, 1]
-brand_voice_form = questionnaire_df.iloc[1, 2]
-company_purpose_form = questionnaire_df.iloc[1, 3]
-positioning_form = questionnaire_df.iloc[1, 4]
-ta_general_form = questionnaire_df.iloc[1, 5]
-competitors_general_form = questionnaire_df.iloc[1, 6]
-customer_psychographics_form = questionnaire_df.iloc[1, 7]
-marketing_budget_form = questionnaire_df.iloc[1, 10]
-customer_experience_form = questionnaire_df.iloc[1, 19]
-resources_form = questionnaire_df.iloc[1, 20]
-key_tone_form = questionnaire_df.iloc[1, 23]
-
-company_overview_summary = summaries_df.iloc[1, 0]
-products_overview_summary = summaries_df.iloc[1, 1]
-market_audience_summary = summaries_df.iloc[1, 2]
-marketing_summary = summaries_df.iloc[1, 3]
-brand_essence_summary = summaries_df.iloc[1, 9]
-audience_summary = summaries_df.iloc[1, 10]
-content_style_summary = summaries_df.iloc[1, 11]
+# Resolve which business (workspace) this session is working on
+workspace = current_workspace()
+
+# Load the latest saved inputs (shared by every session through the app database)
+st.session_state.inputs = load_namespace(workspace.id, 'inputs')
+
+
+
+
+# Load the brand profile (built once per sheet revision and shared by every page and session)
+brand = workspace.brand_profile()
 
 
 
@@ -131,6 +46,7 @@ st.set_page_config(page_title="Post Builder", page_icon="📣")
 logo_large = "images/Riplo Beta Text Logo 1.svg"
 logo_small = "images/Riplo Beta Text Logo Small.svg"
 st.logo(logo_large, size="large", icon_image=logo_small)
+workspace_sidebar(workspace)
 
 
 st.markdown(
@@ -150,7 +66,7 @@ st.markdown(
 
 
 # Streamlit app layout
-st.caption(f"{business_name_primary}")
+st.caption(f"{brand.business_name_primary}")
 st.title("Post Builder")
 st.text("")
 
@@ -177,92 +93,128 @@ input_specificinfo = st.text_input('Specific Information For The Post')
 st.text("")
 
 
-# Conditional logic for running LangChain and extracting summaries
-if st.button('Create Post'):
-
+# Panel titles for the parts of a post
+PART_LABELS = {
+    "caption": "Caption",
+    "media_description": "Media Description",
+    "media_instructions": "Media Instructions",
+}
 
-    post_filetitle = "Wrap and Roll"
-    
-    caption_final_output = """Who's ready for a summer of wrap-and-roll adventures? 🌞🌯 Our zesty, freshly made Chicken Caesar or Falafel & Hummus wraps are your picnic’s perfect plus one. Light, satisfying, and full of flavour - they won't weigh down your summer fun! Ready, set, wrap! Drop by for your perfect picnic bite today. Bon Appétit! 🍽️"""
 
-    mediadescription_final_output = """Media Type: Short Video
 
-    Media Overview: A joyful and dynamic summer video showcasing the rolling and slicing of Short Black Café’s signature wraps against a backdrop of a vibrant summer picnic scene. The video aims to draw viewers in with its playful, light-hearted tone, highlighting the cafe's mouth-watering wraps as the ideal food choice for a summer picnic.
+# Show the parts of a post: each is waiting, being written (its text so far) or written (with its time)
+def show_post_parts(progress):
+    for part in POST_PARTS:
+        text = progress['parts'].get(part)
+        seconds = progress['seconds'].get(part)
+        if text is None:
+            st.caption(f"{PART_LABELS[part]}: waiting…")
+        elif seconds is None:
+            st.caption(f"{PART_LABELS[part]}: writing…")
+            st.text(text)
+        else:
+            st.caption(f"Written in {seconds:.1f}s")
+            st.text_area(PART_LABELS[part], text, height=280)
+        st.text("")
 
-    Detailed Description:
 
-    Scene 1: Close-up shot of the pristine, fresh ingredients for the Chicken Caesar and Falafel & Hummus wraps laid out on a wooden tabletop. Overlaid text reads "Wrap and Roll: Your Perfect Picnic Starts Here!" The FONT should be a modern sans-serif, such as Helvetica or Open Sans, aligned centrally.
+# Posts are built by a background job, so a post being written isn't lost when this page is rerun or left
+post_job = follow_job(workspace.id, 'post')
 
-    Scene 2: A pair of hands expertly start assembling the wraps one by one, first the Chicken Caesar, then the Falafel & Hummus, on a wooden cutting board. The camera follows every move, giving off a feel of genuine warmth, and locally sourced ingredients.
+# Conditional logic for running LangChain and extracting summaries
+if st.button('Create Post', disabled=is_active(post_job)):
+    start_job(workspace.id, 'post', {"post_idea": input_postidea, "specific_info": input_specificinfo})
+    st.rerun()
 
-    Scene 3: Both wraps get rolled tightly, and the hands slice them diagonally with a large knife. The inner layers of the wraps, featuring a perfect blend of ingredients, are visible and look tempting. Overlay text reads "Freshly Made Just for You!" in the same modern sans-serif font, aligned centrally.
+if post_job is not None and (is_active(post_job) or post_job['status'] == 'done'):
+    post_filetitle = parse_post_idea(post_job['params']['post_idea']).display_title
 
-    Scene 4: A quick transition to a sunny outdoor setting: a laid-out picnic blanket, a vintage wicker basket, and a pair of sunglasses. The cut wraps land gently on a plate next to the basket.
+    st.divider()
 
-    Scene 5: A hand reaches out to grab a wrap slice, lifting it towards the camera. The frame freezes for a moment, and overlay text appears: "Ready, Set, Wrap! Grab Yours for the Perfect Picnic Bite!" Once again, use the sans-serif font, aligned centrally.
+    # Final Output (the caption and media description are written at the same time, and the
+    # instructions as soon as the description is done; each panel fills in as its part streams in)
+    if is_active(post_job):
+        job_progress(post_job['id'], f"Writing {post_filetitle}…", show_post_parts)
+    else:
+        show_post_parts(post_job['result'])
+        st.caption(f"Post built in {post_job['finished_at'] - post_job['started_at']:.1f}s")
+        post_parts = post_job['result']['parts']
+        caption_final_output = post_parts["caption"]
+        mediadescription_final_output = post_parts["media_description"]
+        mediainstructions_final_output = post_parts["media_instructions"]
 
-    The video ends with a fade to a black frame carrying the White Short Black Café logo and the store address in a clean, modern sans-serif font.
 
-    Throughout the video, a light-hearted and charming tune, epitomising summer holidays, plays in the background, enhancing the narrative's vibrancy and energy.
+        # Download Post Idea As File
+        download_file = post_file(post_filetitle, caption_final_output, mediadescription_final_output, mediainstructions_final_output)
 
-    The video's tone and aesthetics should match Short Black Café's visual style - a balance between minimalism and approachability using a monochrome palette of black and white, complemented by natural brown wood textures for warmth. The playful and engaging brand voice, along with the authentic local charm, should resonate in each frame."""
-    
-    mediainstructions_final_output = """Preparation:  
-    - Gather fresh ingredients for Chicken Caesar and Falafel & Hummus wraps. Have a wooden table or cutting board available, which will be your working area.
-    - Ensure you have a set for the picnic scene, including a picnic blanket, vintage wicker basket, a pair of sunglasses and plates.
-    - Prepare your smartphone camera or a digital camera equipped. 
-    - For the background tune, select a royalty-free light-hearted, charming tune that symbolizes summer holidays.
 
-    Capturing the Media:  
-    - Scene 1: Arrange ingredients on the wooden table/cutting board and capture a close-up shot. Point the camera downwards and keep everything in focus. 
-    - Scene 2: Hands should assemble wraps as the camera films from the side-view, close enough to capture the process, yet not too close to obscure the movement. Keep movement smooth and precise.
-    - Scene 3: After rolling the wraps, slice them diagonally in full view of the camera. The camera should be positioned to capture the delicious layers within the wrap.
-    - Scene 4: After slicing, move the scene to an outdoor setting. Place the plate with wrap slices on the picnic blanket and capture the whole scene including the basket and sunglasses. 
-    - Scene 5: Have a hand reach for a wrap slice and lift it towards the camera. Freeze this frame for a moment before closing the shot.
 
-    Editing and Final Touches:
-    - Import video clips into a video editing app on your smartphone or computer. Trim each clip to keep only the necessary footage and connect scenes smoothly.
-    - In Scene 1, add the text "Wrap and Roll: Your Perfect Picnic Starts Here!" in a modern sans-serif font (e.g., Helvetica or Open Sans). Place the text centrally in the frame.
-    - After Scene 3 completes, overlay the text "Freshly Made Just for You!" in the same sans-serif font as before, centrally aligned with the existing footage.
-    - When the frame freezes in Scene 5, add the final overlay text: "Ready, Set, Wrap! Grab Yours for the Perfect Picnic Bite!" in the same style as previous scenes.
-    - Continue with the black frame carrying the Short Black Café logo and the store address in a clean, modern, and centered sans-serif font.
-    - Add the light-hearted and charming background tune, making sure it is properly synchronized with the footage's movement and change of scenes.
+        # Download button
+        st.text("")
+        st.divider()
+        st.text("")
+        st.download_button(
+            label=f"Download Post – {post_filetitle}",
+            data=download_file,
+            file_name=f"{post_filetitle}.txt",
+            mime="text/plain"
+        )
 
-    Tips:  
-    - Ensure there is ample natural light, especially when filming food. This will help your ingredients look vibrant. If natural light is not available, use a good quality artificial light source.
-    - Keep all movements in the shot slow and deliberate to make them easier to follow for your audience.
-    - Experiment with the volume levels of the background music to ensure it harmonizes with, rather than detracts from, the video footage.
-    - If overlay text seems to blend with the scene, try adding a subtle shadow or outline for improved readability."""
+elif job_newly_finished('post', post_job):
+    st.error(f"The post couldn't be created right now, please try again in a minute. ({post_job['error']})")
 
 
 
-    st.divider()
+# Build every post on the content calendar at once
+st.text("")
+st.divider()
+st.subheader("Build All Calendar Posts")
+st.text("")
 
-    # Final Output
-    st.text_area("Caption", caption_final_output, height=280)
-    st.text("")
-    st.text_area("Media Description", mediadescription_final_output, height=280)
-    st.text("")
-    st.text_area("Media Instructions", mediainstructions_final_output, height=280)
+calendar_entries = load_calendar(workspace.id)
+all_posts_job = follow_job(workspace.id, 'all_posts')
 
+if not calendar_entries:
+    st.info("Create a calendar on the Content Calendar page to build all of its posts at once.")
+elif st.button(f"Build All {len(calendar_entries)} Posts", disabled=is_active(all_posts_job)):
+    start_job(workspace.id, 'all_posts', {})
+    st.rerun()
 
-    # Download Post Idea As File
-    download_file = (
-        f"{post_filetitle}\n\n"
-        f"Caption:\n\n{caption_final_output}\n\n"
-        f"Media Description:\n\n{mediadescription_final_output}\n\n"
-        f"Media Instructions:\n\n{mediainstructions_final_output}\n"
+if is_active(all_posts_job):
+    job_progress(
+        all_posts_job['id'], "Building posts…",
+        lambda progress: st.progress(progress['done'] / progress['total'], text=f"Built {progress['done']} of {progress['total']} posts"),
     )
 
-
-
-    # Download button
-    st.text("")
-    st.divider()
-    st.text("")
-    st.download_button(
-        label=f"Download Post – {post_filetitle}",
-        data=download_file,
-        file_name=f"{post_filetitle}.txt",
-        mime="text/plain"
-    )
+elif all_posts_job is not None and all_posts_job['status'] == 'done':
+    # The zip was written to disk as posts finished, rather than kept in memory
+    export_name = all_posts_job['result']['export']
+    manifest = all_posts_job['result']['manifest']
+    failed = [record for record in manifest if "error" in record]
+    st.caption(f"Built {len(manifest) - len(failed)} posts in {all_posts_job['finished_at'] - all_posts_job['started_at']:.1f}s")
+    if failed:
+        st.warning(f"{len(failed)} post(s) couldn't be built right now and are listed in the manifest: " + ", ".join(record["title"] for record in failed))
+
+    # Streamed from disk by the feed server when it is running; otherwise st.download_button
+    # reads the whole zip into memory, so only zips up to EXPORT_DOWNLOAD_MAX_BYTES are offered that way
+    zip_path = export_path(export_name)
+    if zip_path is None:
+        st.info("This download has expired, build the posts again to get a new one.")
+    elif feed_available():
+        st.link_button("Download All Posts (.zip)", export_url(export_name))
+    elif os.path.getsize(zip_path) > EXPORT_DOWNLOAD_MAX_BYTES:
+        st.warning(
+            f"The zip is {os.path.getsize(zip_path) / 1024 / 1024:.0f} MB, too large to download through the app "
+            f"(the limit is {EXPORT_DOWNLOAD_MAX_BYTES / 1024 / 1024:.0f} MB). Set up the feed server (RIPLO_FEED_URL) to download it."
+        )
+    else:
+        with open(zip_path, "rb") as zip_file:
+            st.download_button(
+                label="Download All Posts (.zip)",
+                data=zip_file,
+                file_name=f"{brand.business_name_primary or 'posts'} posts.zip",
+                mime="application/zip",
+            )
+
+elif job_newly_finished('all_posts', all_posts_job):
+    st.error(f"The posts couldn't be built right now, please try again in a minute. ({all_posts_job['error']})")
@@ -1,119 +1,97 @@
 import streamlit as st
 import ssl
 import json
+import math
 import os
 
+from riplo import duplicates, search, vault
+from riplo.autosave import flush, load_namespace
+from riplo.session import current_workspace, workspace_sidebar
+from riplo.storage import save_values, transaction
 
 
-# Define functions to save and load data
-def save_data(data, filename='sessiondata.json'):
-    with open(filename, 'w') as file:
-        json.dump(data, file, indent=4)
 
-def load_data(filename='sessiondata.json'):
-    if not os.path.exists(filename):
-        with open(filename, 'w') as file:
-            json.dump({}, file)
-    try:
-        with open(filename, 'r') as file:
-            content = file.read().strip()
-            if content:
-                return json.loads(content)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    return {}
+# Ideas shown per page of the vault
+VAULT_PAGE_SIZE = int(os.getenv("RIPLO_VAULT_PAGE_SIZE", "10"))
+VAULT_PAGE_SIZES = sorted({5, 10, 20, 50, VAULT_PAGE_SIZE})
 
-# Load existing data
-data = load_data()
+# Characters of each idea shown on its card
+PREVIEW_LENGTH = 160
 
 
-# Initialize SessionState for inputs
-st.session_state.inputs = data.get('inputs', {})
 
-# Initialize SessionState for repo
-if 'repo' not in st.session_state:
-    st.session_state.repo = data.get('repo', {})
-    
-    
-# Initialize 'cal' in session state if not present
-if 'cal' not in st.session_state:
-    st.session_state['cal'] = data.get('cal', {f'calpost_{i}': '' for i in range(1, 11)})
+# Resolve which business (workspace) this session is working on
+workspace = current_workspace()
+
+# Load the latest saved inputs and calendar posts (shared by every session through the app database)
+st.session_state.inputs = load_namespace(workspace.id, 'inputs')
+st.session_state['cal'] = load_namespace(workspace.id, 'cal') or {f'calpost_{i}': '' for i in range(1, 11)}
 
     
 
 def auto_save_cal():
-    # Save all 'cal' data from session state into 'cal' in the data dictionary and save it to file
-    data['cal'] = st.session_state['cal']
-    save_data(data)
+    # Save the calendar slots that changed
+    save_values(workspace.id, 'cal', st.session_state['cal'])
     
 
 
-def save_repo():
-    # Update the `data` dictionary to reflect changes in repo
-    data['repo'] = st.session_state.repo
-    save_data(data)
+# Short one-paragraph preview of an idea for its card
+def entry_preview(post_idea):
+    if post_idea.is_structured:
+        preview = " ".join(filter(None, (post_idea.idea, post_idea.call_to_action, post_idea.purpose)))
+    else:
+        preview = " ".join(line.strip() for line in post_idea.text.splitlines() if line.strip())
+    return preview if len(preview) <= PREVIEW_LENGTH else preview[:PREVIEW_LENGTH].rstrip() + "…"
 
 
-# Callback function to update `repo` in session state and auto-save
-def update_and_save_repo(key):
-    # Save the current value of the key in `repo`
-    st.session_state.repo[key] = st.session_state[key]
-    # Trigger auto-save after updating
-    save_repo()
 
+# Callback function to save an edited vault entry
+def update_and_save_entry(entry_id):
+    vault.update(workspace.id, entry_id, st.session_state[f'vault_{entry_id}'])
 
 
 
-def auto_save_repo():
-    # Extract all non-empty values and store them in a list
-    non_empty_data = [v for v in st.session_state.repo.values() if v.strip()]
-    
-    # Create a new organized dictionary with compacted data
-    # Fill the upper slots with non-empty data, and the rest with empty strings
-    for i in range(1, 41):
-        if i <= len(non_empty_data):
-            # Assign non-empty data to the top variables (repopostidea_1, repopostidea_2, etc.)
-            st.session_state.repo[f'repopostidea_{i}'] = non_empty_data[i-1]
-        else:
-            # Assign empty strings to the remaining slots
-            st.session_state.repo[f'repopostidea_{i}'] = ""
+def add_to_calpost(entry_id):
+    # Get the current text of the vault entry
+    entry = vault.get(workspace.id, entry_id)
+    repopostidea_value = entry["text"] if entry else ""
 
-    # Save the compacted repo to sessiondata.json
-    data['repo'] = st.session_state.repo
-    save_data(data)
+    # Write any queued edits, then read-modify-write in one transaction so concurrent sessions don't lose each other's posts
+    flush()
+    with transaction():
+        st.session_state['cal'] = load_namespace(workspace.id, 'cal')
 
+        # Create a list to hold the current calpost values
+        calposts = [st.session_state['cal'].get(f'calpost_{i}', "") for i in range(1, 11)]
 
+        # Extract all non-empty values and store them in a list
+        non_empty_data = [v for v in calposts if v.strip()]
 
-def add_to_calpost(repopostidea_key):
-    # Get the data from the specified repopostidea variable
-    repopostidea_value = st.session_state.get(repopostidea_key, "")
+        # Don't add the same idea to the calendar twice
+        if repopostidea_value and duplicates.find_duplicate_in(non_empty_data, repopostidea_value) is not None:
+            st.warning(f"This post idea is already in the Calendar.")
+            return
 
-    # Create a list to hold the current calpost values
-    calposts = [st.session_state['cal'].get(f'calpost_{i}', "") for i in range(1, 11)]
+        # Reorganize the calpost values, filling the upper slots with non-empty data
+        for i in range(1, 11):
+            if i <= len(non_empty_data):
+                st.session_state['cal'][f'calpost_{i}'] = non_empty_data[i-1]
+            else:
+                st.session_state['cal'][f'calpost_{i}'] = ""
 
-    # Extract all non-empty values and store them in a list
-    non_empty_data = [v for v in calposts if v.strip()]
+        # Shift existing calpost data down by one slot, from calpost_10 to calpost_2
+        for i in range(10, 1, -1):
+            st.session_state['cal'][f'calpost_{i}'] = st.session_state['cal'].get(f'calpost_{i-1}', "")
 
-    # Reorganize the calpost values, filling the upper slots with non-empty data
-    for i in range(1, 11):
-        if i <= len(non_empty_data):
-            st.session_state['cal'][f'calpost_{i}'] = non_empty_data[i-1]
+        if repopostidea_value:
+            # Insert the new data into calpost_1
+            st.session_state['cal']['calpost_1'] = repopostidea_value
+            st.success(f"Post idea added to Calendar.")
         else:
-            st.session_state['cal'][f'calpost_{i}'] = ""
-
-    # Shift existing calpost data down by one slot, from calpost_10 to calpost_2
-    for i in range(10, 1, -1):
-        st.session_state['cal'][f'calpost_{i}'] = st.session_state['cal'].get(f'calpost_{i-1}', "")
+            st.warning(f"No data found in this post idea to add.")
 
-    if repopostidea_value:
-        # Insert the new data into calpost_1
-        st.session_state['cal']['calpost_1'] = repopostidea_value
-        st.success(f"Post idea added to Calendar.")
-    else:
-        st.warning(f"No data found in {repopostidea_key} to add.")
-
-    # Save the updated calpost variables
-    auto_save_cal()
+        # Save the updated calpost variables
+        auto_save_cal()
 
 
 
@@ -125,6 +103,7 @@ st.set_page_config(page_title="Idea Vault", page_icon="📣")
 logo_large = "images/Riplo Beta Text Logo 1.svg"
 logo_small = "images/Riplo Beta Text Logo Small.svg"
 st.logo(logo_large, size="large", icon_image=logo_small)
+workspace_sidebar(workspace)
 
 
 st.markdown(
@@ -158,39 +137,113 @@ st.info("Add post ideas to the Idea Vault from the Idea Generator.")
 st.text("")
 
 
-# Display and capture user input in the text_area fields
-for i in range(1, 41):
-    post_key = f'repopostidea_{i}'
+# Compact read-only card per entry; the editor is only rendered for the opened entry
+def show_entry_card(label, entry):
+    with st.container(border=True):
+        st.markdown(f"**{label}** – {entry['post_idea'].display_title}")
+        st.caption(entry_preview(entry["post_idea"]))
 
-    # Display the text area only if the key exists in repo
-    if post_key in st.session_state.repo:
-        # Display the text area and allow the user to edit the value
-        st.text_area(
-            f"Post Idea {i}",
-            value=st.session_state.repo[post_key],
-            key=post_key,
-            label_visibility="visible",
-            height=300,
-            on_change=update_and_save_repo,  # Trigger auto-save when text changes
-            args=(post_key,)
-        )
+        if st.session_state.get('vault_open') == entry["id"]:
+            # Display the text area and allow the user to edit the value
+            st.text_area(
+                label,
+                value=entry["text"],
+                key=f'vault_{entry["id"]}',
+                label_visibility="collapsed",
+                height=300,
+                on_change=update_and_save_entry,  # Save the entry when its text changes
+                args=(entry["id"],)
+            )
 
-        # Create two columns for buttons
-        col1, col2 = st.columns([1, 1])
+        col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
 
-        # Add a delete button in the first column
         with col1:
-            if st.button("Add to Calendar", key=f"add_cal_button_{i}"):
-                add_to_calpost(post_key)  # Call your function to add to calendar repo
+            if st.session_state.get('vault_open') == entry["id"]:
+                if st.button("Close", key=f"close_button_{entry['id']}"):
+                    st.session_state.vault_open = None
+                    st.rerun()
+            elif st.button("Open", key=f"open_button_{entry['id']}"):
+                st.session_state.vault_open = entry["id"]
+                st.rerun()
 
-        # Add an "Add to Calendar" button in the second column
         with col2:
-            if st.button("Delete", key=f"delete_button_{i}"):
-                # Set the post idea to an empty string on delete and auto-save
-                st.session_state.repo[post_key] = ""
-                auto_save_repo()
-                st.success(f"Post {i} deleted.")
+            if st.button("Add to Calendar", key=f"add_cal_button_{entry['id']}"):
+                add_to_calpost(entry["id"])
+
+        with col3:
+            if st.button("Similar", key=f"similar_button_{entry['id']}"):
+                st.session_state.vault_similar = entry["id"]
+                st.rerun()
+
+        with col4:
+            if st.button("Delete", key=f"delete_button_{entry['id']}"):
+                vault.delete(workspace.id, entry["id"])
+                st.success(f"{label} deleted.")
                 st.rerun()  # Force page reload to reflect the changes
-        st.text("")
-        st.text("")
 
+
+
+# Search the vault (titles, purpose, creative focus and dates count for more than the body)
+vault_query = st.text_input("Search ideas", key='vault_query', placeholder="e.g. summer picnic")
+st.text("")
+
+
+if st.session_state.get('vault_similar'):
+    # Ideas similar to the chosen one
+    similar_to = vault.get(workspace.id, st.session_state.vault_similar)
+    if similar_to is None:
+        st.session_state.vault_similar = None
+        st.rerun()
+    st.markdown(f"Ideas similar to **{similar_to['post_idea'].display_title}**")
+    if st.button("Back to all ideas"):
+        st.session_state.vault_similar = None
+        st.rerun()
+
+    similar_entries = [vault.get(workspace.id, entry_id) for entry_id, score in search.similar(workspace.id, similar_to["id"])]
+    if not similar_entries:
+        st.info("No similar ideas found.")
+    for i, entry in enumerate(similar_entries, start=1):
+        show_entry_card(f"Similar Idea {i}", entry)
+
+
+elif vault_query.strip():
+    # Search results, best match first
+    results = search.search(workspace.id, vault_query)
+    if not results:
+        st.info("No ideas match your search.")
+    for i, entry in enumerate(results, start=1):
+        show_entry_card(f"Result {i}", entry)
+
+
+else:
+    # Page through the vault, loading only the entries on the current page
+    if 'vault_page_size' not in st.session_state:
+        st.session_state.vault_page_size = VAULT_PAGE_SIZE
+    if 'vault_page' not in st.session_state:
+        st.session_state.vault_page = 1
+
+    total_entries = vault.count(workspace.id)
+    page_count = max(1, math.ceil(total_entries / st.session_state.vault_page_size))
+    st.session_state.vault_page = min(st.session_state.vault_page, page_count)
+    first_index = (st.session_state.vault_page - 1) * st.session_state.vault_page_size
+
+    page_entries = vault.entries(workspace.id, limit=st.session_state.vault_page_size, offset=first_index)
+    for i, entry in enumerate(page_entries, start=first_index + 1):
+        show_entry_card(f"Post Idea {i}", entry)
+
+
+    # Pagination controls
+    st.text("")
+    col1, col2, col3, col4 = st.columns([1, 2, 1, 2])
+    with col1:
+        if st.button("Previous", disabled=st.session_state.vault_page <= 1):
+            st.session_state.vault_page -= 1
+            st.rerun()
+    with col2:
+        st.markdown(f"Page {st.session_state.vault_page} of {page_count} ({total_entries} ideas)")
+    with col3:
+        if st.button("Next", disabled=st.session_state.vault_page >= page_count):
+            st.session_state.vault_page += 1
+            st.rerun()
+    with col4:
+        st.selectbox("Ideas per page", VAULT_PAGE_SIZES, key='vault_page_size', label_visibility="collapsed")
@@ -1,32 +1,29 @@
 import streamlit as st
-import pandas as pd
 import ssl
-from openai import OpenAI
 import re
+import calendar as month_calendar
+import html
 from datetime import date
 import json
 import os
-from datetime import datetime, timedelta, timezone
-from dateutil import parser
-from icalendar import Calendar, Event
+import time
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from riplo import duplicates, ics, vault
+from riplo.autosave import load_namespace, save_later
+from riplo.calendar_pipeline import calendar_span, load_calendar, load_calendar_range, reschedule_event
+from riplo.feed import feed_available, feed_url, reset_feed_token
+from riplo.jobs import is_active
+from riplo.session import current_workspace, follow_job, job_newly_finished, job_progress, start_job, workspace_sidebar
+from riplo.storage import get_value, save_value, save_values
+
 
 
 
 # Load environment variables from .env
 load_dotenv()
 
-# Get the API key from the environment variable
-api_key = os.getenv("OPENAI_API_KEY")
-
-# Check if the API key is available
-if not api_key:
-    raise ValueError("API key not found. Please set OPENAI_API_KEY in your .env file.")
-
-# Set your OpenAI API key
-client = OpenAI(api_key=api_key)
-
 
 
 
@@ -94,87 +91,37 @@ current_season, next_season = get_seasons(today_date)
 
 
 
-# Define functions to save and load data
-def save_data(data, filename='sessiondata.json'):
-    with open(filename, 'w') as file:
-        json.dump(data, file, indent=4)
+# Resolve which business (workspace) this session is working on
+workspace = current_workspace()
 
-def load_data(filename='sessiondata.json'):
-    if not os.path.exists(filename):
-        # Create an empty JSON file if it doesn't exist
-        with open(filename, 'w') as file:
-            json.dump({}, file)
-    try:
-        with open(filename, 'r') as file:
-            content = file.read().strip()  # Read file content and strip any whitespace
-            if content:
-                return json.loads(content)  # Load JSON data if the content is not empty
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    return {}  # Return an empty dictionary if the file is not found or if there's a JSON decode error
-
-# Load existing data
-data = load_data()
-
-# # Initialize SessionState for inputs
-# st.session_state.inputs = data.get('inputs', {})
-
-# Initialize SessionState for inputs
-if 'inputs' not in st.session_state:
-    st.session_state.inputs = data.get('inputs', {})
-    
+# Load the latest saved inputs and calendar (shared by every session through the app database)
+st.session_state.inputs = load_namespace(workspace.id, 'inputs')
+st.session_state.cal = load_namespace(workspace.id, 'cal')
 
 # Initialize SessionState for outputs
 if 'outputs' not in st.session_state:
-    st.session_state.outputs = data.get('outputs', {})
-
-# Initialize SessionState for repo
-if 'repo' not in st.session_state:
-    st.session_state.repo = data.get('repo', {})
-
+    st.session_state.outputs = load_namespace(workspace.id, 'outputs')
 
-# Initialize SessionState for cal
-if 'cal' not in st.session_state:
-    st.session_state.cal = data.get('cal', {})
-
-# Ensure calpost_ variables from sessiondata.json are properly initialized in session state
+# Ensure calpost_ variables are properly initialized in session state
 for i in range(1, 11):
     calpost_key = f'calpost_{i}'
     
-    # If the key exists in sessiondata.json, it will be loaded, otherwise initialize to empty string
+    # If the key exists in the saved calendar, it will be loaded, otherwise initialize to empty string
     if calpost_key not in st.session_state.cal:
         st.session_state.cal[calpost_key] = ""
 
 
-# Initialize 'uid_counter' within 'cal' only if it doesn't already exist in sessiondata.json or session state
-if 'uid_counter' not in st.session_state.cal:
-    st.session_state.cal['uid_counter'] = data.get('cal', {}).get('uid_counter', 1)
-
-
 
-def auto_save_inputs():
-    # Directly assign the entire inputs dictionary to the data dictionary
-    data['inputs'] = st.session_state.inputs
-    save_data(data)
+# Callback function to update `inputs` in session state and save the edited key
+def update_and_save_inputs(key):
+    st.session_state.inputs[key] = st.session_state[key]
+    save_later(workspace.id, 'inputs', key, st.session_state[key])
 
     
 
-def auto_save_outputs():
-    # Directly assign the entire outputs dictionary to the data dictionary
-    data['outputs'] = st.session_state.outputs
-    save_data(data)
-
-
-def auto_save_repository():
-    # Directly assign the entire repo dictionary to the data dictionary
-    data['repo'] = st.session_state.repo
-    save_data(data)
-    
-    
 def auto_save_cal():
-    # Directly assign the entire cal dictionary to the data dictionary
-    data['cal'] = st.session_state.cal
-    save_data(data)
+    # Save the calendar slots that changed
+    save_values(workspace.id, 'cal', st.session_state.cal)
     
     
 def reorganize_calposts():
@@ -193,20 +140,100 @@ def reorganize_calposts():
 
 
 
+# Days shown by the calendar view around `anchor` (whole weeks, Monday first)
+def visible_days(anchor, view):
+    if view == "Week":
+        monday = anchor - timedelta(days=anchor.weekday())
+        return [[monday + timedelta(days=d) for d in range(7)]]
+    return month_calendar.Calendar().monthdatescalendar(anchor.year, anchor.month)
+
+
+# Move the view a month or week from `anchor`
+def shift_anchor(anchor, view, step):
+    if view == "Week":
+        return anchor + timedelta(weeks=step)
+    month = anchor.month - 1 + step
+    return date(anchor.year + month // 12, month % 12 + 1, 1)
+
+
+# The visible weeks as an HTML table, with each day's posts
+def calendar_table(weeks, anchor, events, view):
+    by_day = {}
+    for event in events:
+        by_day.setdefault(event["datetime"][:10], []).append(event)
+
+    header = "".join(f"<th>{name}</th>" for name in month_calendar.day_abbr)
+    rows = []
+    for week in weeks:
+        cells = []
+        for day in week:
+            posts = "".join(
+                f'<div class="riplo-post" title="{html.escape(event["description"])}">'
+                f'<b>{event["datetime"][11:16]}</b> {html.escape(event["title"])}'
+                + (f'<br><small>{html.escape(event["description"])}</small>' if view == "Week" else "")
+                + "</div>"
+                for event in by_day.get(day.isoformat(), [])
+            )
+            muted = ' class="riplo-muted"' if view == "Month" and day.month != anchor.month else ""
+            cells.append(f'<td{muted}><div class="riplo-day">{day.day}</div>{posts}</td>')
+        rows.append(f"<tr>{''.join(cells)}</tr>")
+    return f'<table class="riplo-calendar"><tr>{header}</tr>{"".join(rows)}</table>'
+
+
+# Month/week view of the saved calendar; only the visible days are loaded, and
+# paging through it reruns just this part of the page
+@st.fragment
+def calendar_grid(workspace_id, calendar_dates):
+    anchor_key = f'calendar_anchor_{workspace_id}'
+    if anchor_key not in st.session_state:
+        st.session_state[anchor_key] = max(calendar_dates[0], min(get_today_date(), calendar_dates[1]))
+
+    view = st.radio("View:", ["Month", "Week"], horizontal=True, key='calendar_view', label_visibility="collapsed")
+    previous_column, today_column, next_column = st.columns(3)
+    if previous_column.button("◀ Previous", use_container_width=True):
+        st.session_state[anchor_key] = shift_anchor(st.session_state[anchor_key], view, -1)
+    if today_column.button("Today", use_container_width=True):
+        st.session_state[anchor_key] = get_today_date()
+    if next_column.button("Next ▶", use_container_width=True):
+        st.session_state[anchor_key] = shift_anchor(st.session_state[anchor_key], view, 1)
+
+    anchor = st.session_state[anchor_key]
+    weeks = visible_days(anchor, view)
+    events = load_calendar_range(workspace_id, weeks[0][0], weeks[-1][-1])
+
+    st.subheader(anchor.strftime("%B %Y") if view == "Month" else f"Week of {weeks[0][0].day} {weeks[0][0]:%B %Y}")
+    st.markdown(calendar_table(weeks, anchor, events, view), unsafe_allow_html=True)
+    if not events:
+        st.caption(f"No posts this {view.lower()}. The calendar runs from {calendar_dates[0].day} {calendar_dates[0]:%B} to {calendar_dates[1].day} {calendar_dates[1]:%B %Y}.")
+        return
+
+    # Reschedule a single post (only its event is updated; the rest of the calendar stays as it is)
+    st.text("")
+    with st.expander("Move a Post"):
+        events_by_uid = {event["uid"]: event for event in events}
+        uid = st.selectbox(
+            "Post:", list(events_by_uid),
+            format_func=lambda uid: f"{events_by_uid[uid]['datetime'][:10]} {events_by_uid[uid]['datetime'][11:16]} – {events_by_uid[uid]['title']}",
+            key='move_post_uid',
+        )
+        current = datetime.fromisoformat(events_by_uid[uid]["datetime"])
+        date_column, time_column = st.columns(2)
+        new_day = date_column.date_input("New Date:", value=current.date(), key=f'move_post_date_{uid}')
+        new_time = time_column.time_input("New Time:", value=current.time(), key=f'move_post_time_{uid}')
+        if st.button("Move Post"):
+            reschedule_event(workspace_id, uid, new_day, new_time)
+            st.session_state[anchor_key] = new_day
+            st.rerun()
+
+
+
 def store_to_repository():
     # Retrieve new post ideas from the outputs attribute
     new_post_ideas = [st.session_state.outputs.get(f'postidea_{i}', '') for i in range(1, 11)]
-    
-    # Shift existing posts in the repo back by 10 positions
-    for i in range(30, 0, -1):
-        st.session_state.repo[f'repopostidea_{i + 10}'] = st.session_state.repo.get(f'repopostidea_{i}', None)
-    
-    # Add new post ideas to the first 10 positions in the repo
-    for i in range(10):
-        st.session_state.repo[f'repopostidea_{i + 1}'] = new_post_ideas[i]
 
-    # Automatically save the state
-    auto_save_repository()
+    # Add them to the Idea Vault, first idea newest, skipping any the vault already has
+    new_post_ideas = [idea for idea in new_post_ideas if idea.strip() and duplicates.find_duplicate(workspace.id, idea) is None]
+    vault.add_many(workspace.id, new_post_ideas)
     
 
 
@@ -219,175 +246,15 @@ if 'show_transfer_button' not in st.session_state:
     st.session_state.show_transfer_button = False
 
 
-# Fetch data from Google Sheets
-def fetch_google_sheet_data(sheet_url):
-    df = pd.read_csv(sheet_url, header=None)
-    df = df.transpose()
-    return df
-
-# Define the URLs of the Google Sheet tabs (CSV export links)
-primary_sheet_url = "https://docs.google.com/spreadsheets/d/13fGf2XoDKuuY-95UchkgNkkwXVv2_YxcKjR9p2cknZg/export?format=csv&gid=78226312"
+# Load the brand profile (built once per sheet revision and shared by every page and session)
+brand = workspace.brand_profile()
 
-# Fetch data from both sheets
-primary_df = fetch_google_sheet_data(primary_sheet_url)
 
-# Extract variables from dataframes
-business_name_primary = primary_df.iloc[1, 0]
-
-
-
-# Retrieve From Cal
-calpost_1 = st.session_state.cal.get('calpost_1', '')
-calpost_2 = st.session_state.cal.get('calpost_2', '')
-calpost_3 = st.session_state.cal.get('calpost_3', '')
-calpost_4 = st.session_state.cal.get('calpost_4', '')
-calpost_5 = st.session_state.cal.get('calpost_5', '')
-calpost_6 = st.session_state.cal.get('calpost_6', '')
-calpost_7 = st.session_state.cal.get('calpost_7', '')
-calpost_8 = st.session_state.cal.get('calpost_8', '')
-calpost_9 = st.session_state.cal.get('calpost_9', '')
-calpost_10 = st.session_state.cal.get('calpost_10', '')
 
 # Retrieve Inputs
 input_startdate = st.session_state.inputs.get('input_startdate', '')
 input_freq = st.session_state.inputs.get('input_freq', '')
-
-
-
-
-# Define the prompt templates
-
-# Generate Dates
-prompt_template_1 = """
-Your Job: Provide the following list of post ideas in a calendar format to form a content calendar.
-
-Your Instructions
-1. Organise the posts into a logical order.
-2. Assign logical dates and times to each post.
-3. Summarise the Content Theme, Purpose, and Media info into a super concise "Description"
-4. Output the content calendar in a single text output.
-
-Consider the following when ordering and assigning dates/times:
-
-1. The first post should be assigned the date: {input_startdate} 2024.
-2. All other posts should be assigned a date following the first post with a posting frequecy of {input_freq} posts per week.
-2. The times should be in the early evening.
-3. You should consider the following when generating the order:
-3.1 Post Theme/Topic: Ensure varying themes/topics. Avoid posting about the same topic/theme consecutively where possible.
-3.2 Media Difficulty: Ensure the first two posts have "easy to produce" media. For example, a single photo is easy to produce, wheras a short video is harder to produce.
-
-The Output:
-
-Your output should have the following schema for each post idea;
-
-Post Number: [POST 1 NUMBER (EG. '1')]
-Title: [POST 1 TITLE]
-Description: [POST 1 DESCRIPTION]
-Date: [POST 1 DATE EG. "5th December 2025"]
-Time: [POST 1 TIME EG. 7pm]
-
-You should separate each post idea with two line breaks. Do not use any formatting such as bold text, bullet points, or numbering lists.
-
-You must include all information from the Post Ideas as below. Do not alter the Post Ideas in any way.
-
-You should only include posts that contain data. Skip any posts that do not have any data.
-
-Here are the post ideas.
-
-Post 1:
-{calpost_1}
-
-Post 2:
-{calpost_2}
-
-Post 3:
-{calpost_3}
-
-Post 4:
-{calpost_4}
-
-Post 5:
-{calpost_5}
-
-Post 6:
-{calpost_6}
-
-Post 7:
-{calpost_7}
-
-Post 8:
-{calpost_8}
-
-Post 9:
-{calpost_9}
-
-Post 10:
-{calpost_10}
-
-
-"""
-
-
-
-# Format to JSON
-prompt_template_2 = """
-Format the following data in JSON format:
-
-{caledartext_output}
-
-
-The data provided above is one or more post ideas. You must include all of the post ideas in the output.
-
-
-You need to provide the data in valid JSON format like so:
-
-{{
-  "titleone": "<title of Post 1>",
-  "description1": "<description of Post 1>",
-  "datetime1": "<date/time of Post 1>",
-  
-  "title2": "<title of Post 2>",
-  "description2": "<description of Post 2>",
-  "datetime2": "<date/time of Post 2>",
-  
-  "title3": "<title of Post 3>",
-  "description3": "<description of Post 3>",
-  "datetime3": "<date/time of Post 3>"
-}}
-
-
-Here is an example output:
-{{
-  "title1": "Sample Event Title",
-  "description1": "Sample event description."
-  "datetime1": "2025-12-05T19:00:00+12:00",
-}}
-
-
-Handling Dat/Time: Convert the provided date and time into an ISO 8601 format in New Zealand timezone (UTC+12:00). Use this format: "YYYY-MM-DDTHH:MM:SS+12:00". For example, "5th December 2025 at 7pm" would become "2025-12-05T19:00:00+12:00".
-
-Handling Various Number of Posts: You will be given up to 10 post ideas. You must only include the number of posts that are provided in the JSON output.
-
-Separating Key Value Pairs With Commas: It is imperative that you separate each key value pair with a comma. For example, note the comma in this line of the example JSON: "titleone": "Sample Event Title",
-
-Make sure the JSON is properly structured, including commas, and does not contain any extraneous text.
-
-
-"""
-
-
-
-# Function to get response from OpenAI's Chat API and handle response extraction
-def get_chatgpt_response(prompt):
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are part of a prompt chain sequence. You should follow the instructions and generate the output as instructed. This is not a conversation. Your outputs should not include any introductory or explanatory text. Your outputs should be in plain text with a line break on the first line. Ensure that the output is strictly limited to the content requested."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
-
+input_posttimes = st.session_state.inputs.get('input_posttimes', '')
 
 
 
@@ -398,6 +265,7 @@ st.set_page_config(page_title="Content Calendar", page_icon="📣")
 logo_large = "images/Riplo Beta Text Logo 1.svg"
 logo_small = "images/Riplo Beta Text Logo Small.svg"
 st.logo(logo_large, size="large", icon_image=logo_small)
+workspace_sidebar(workspace)
 
 
 st.markdown(
@@ -410,13 +278,37 @@ st.markdown(
     [data-testid="stSidebarContent"] * {
         color: #f6f2e8 !important;
     }
+    .riplo-calendar {
+        width: 100%;
+        table-layout: fixed;
+        font-size: 0.8rem;
+    }
+    .riplo-calendar td {
+        vertical-align: top;
+        height: 5.5rem;
+        padding: 0.25rem;
+        overflow: hidden;
+    }
+    .riplo-muted {
+        opacity: 0.4;
+    }
+    .riplo-day {
+        font-weight: 600;
+    }
+    .riplo-post {
+        margin-top: 0.2rem;
+        padding: 0.1rem 0.25rem;
+        border-radius: 0.25rem;
+        background-color: #e3eadf;
+        overflow-wrap: anywhere;
+    }
     </style>
     """,
     unsafe_allow_html=True
 )
 
 # Streamlit app layout
-st.caption(f"{business_name_primary}")
+st.caption(f"{brand.business_name_primary}")
 st.title("Content Calendar Generator")
 st.text("")
 
@@ -435,53 +327,53 @@ st.text("")
 st.text("")
 
 # User Inputs (Saved)
-st.session_state.inputs['input_startdate'] = st.text_input('Start Date:', value=st.session_state.inputs.get('input_startdate', ''), on_change=auto_save_inputs)
+st.session_state.inputs['input_startdate'] = st.text_input('Start Date:', value=st.session_state.inputs.get('input_startdate', ''), key='input_startdate', on_change=update_and_save_inputs, args=('input_startdate',))
+st.text("")
+st.session_state.inputs['input_freq'] = st.text_input('Posting Frequency:', value=st.session_state.inputs.get('input_freq', ''), key='input_freq', on_change=update_and_save_inputs, args=('input_freq',))
 st.text("")
-st.session_state.inputs['input_feq'] = st.text_input('Posting Frequency:', value=st.session_state.inputs.get('input_freq', ''), on_change=auto_save_inputs)
+st.session_state.inputs['input_posttimes'] = st.text_input('Posting Times:', value=st.session_state.inputs.get('input_posttimes', ''), key='input_posttimes', placeholder="e.g. 12pm, 7pm", on_change=update_and_save_inputs, args=('input_posttimes',))
 st.text("")
 st.text("")
 
 
 
 # Conditional logic for running LangChain and extracting
-if st.button('Create Calendar'):
-    
-    # Generate Times
-    full_prompt_1 = prompt_template_1.format(
-        calpost_1 = calpost_1,
-        calpost_2 = calpost_2,
-        calpost_3 = calpost_3,
-        calpost_4 = calpost_4,
-        calpost_5 = calpost_5,
-        calpost_6 = calpost_6,
-        calpost_7 = calpost_7,
-        calpost_8 = calpost_8,
-        calpost_9 = calpost_9,
-        calpost_10 = calpost_10,
-        input_startdate = input_startdate,
-        input_freq = input_freq
-        
-    )
-    caledartext_output = get_chatgpt_response(full_prompt_1).strip()
-    st.write("Output after Prompt Template 1:", caledartext_output)
+fresh_calendar = st.checkbox('Ignore previous results', help="Reschedule and re-describe every post, not just the new and edited ones.")
 
+# The calendar is built by a background job, so it is finished even if this page is rerun or left
+calendar_job = follow_job(workspace.id, 'calendar')
 
-    # Format to JSON
-    full_prompt_2 = prompt_template_2.format(
-        caledartext_output = caledartext_output
-    )
-    fullcalendar_ical = get_chatgpt_response(full_prompt_2).strip()
-    st.write("Output after Prompt Template 2:", fullcalendar_ical)
-    
-    
-    # Parse the JSON output
-    try:
-        json_calendar = json.loads(fullcalendar_ical)
-        st.write("Formatted JSON Output:")
-        st.json(json_calendar)
-    except json.JSONDecodeError as e:
-        st.error(f"Failed to parse JSON: {e}")
+if st.button('Create Calendar', disabled=is_active(calendar_job)):
     
+    # Update the saved calendar: only new and edited posts are scheduled (locally) and described (concurrently)
+    calposts = [st.session_state.cal.get(f'calpost_{i}', '') for i in range(1, 11)]
+    key_dates = "\n".join([st.session_state.inputs.get('input_keydates', ''), brand.key_publicdates_primary])
+    start_job(workspace.id, 'calendar', {
+        "posts": calposts, "start_text": input_startdate, "frequency_text": input_freq, "times_text": input_posttimes,
+        "opening_hours": brand.opening_hours_primary, "key_dates_text": key_dates, "bypass_cache": fresh_calendar,
+    })
+    st.rerun()
+
+if is_active(calendar_job):
+    job_progress(calendar_job['id'], "Creating the calendar…", lambda progress: st.caption(progress.get('message', '')))
+
+elif job_newly_finished('calendar', calendar_job):
+    if calendar_job['status'] == 'failed':
+        st.error(f"The calendar couldn't be created right now, please try again in a minute. ({calendar_job['error']})")
+    else:
+        # Show the calendar from its start again
+        st.session_state.pop(f'calendar_anchor_{workspace.id}', None)
+        calendar_changes = calendar_job['result']['changes']
+        st.success(
+            f"Calendar updated: {calendar_changes['added']} new, {calendar_changes['updated']} changed, "
+            f"{calendar_changes['unchanged']} unchanged, {calendar_changes['removed']} removed."
+        )
+
+
+# Show the saved calendar (kept between visits; Create Calendar updates it)
+calendar_dates = calendar_span(workspace.id)
+if calendar_dates:
+    calendar_grid(workspace.id, calendar_dates)
 
     st.divider()
     
@@ -492,54 +384,40 @@ if st.button('Create Calendar'):
     
 if st.session_state.show_transfer_button:
     
-    # Convert JSON data to iCalendar format
-    def create_icalendar(json_calendar):
-        cal = Calendar()
-        nz_time = timezone(timedelta(hours=12))
-        
-        # Retrieve UID counter
-        uid_counter = data['cal'].get("uid_counter", 1)
-
-        for i in range(1, 11):  # Loop through potential 10 events
-            datetime_key = f'datetime{i}'
-            title_key = f'title{i}'
-            description_key = f'description{i}'
-
-            # Check for required fields and skip if any are missing
-            if datetime_key in json_calendar and title_key in json_calendar and description_key in json_calendar:
-                datetime_str = json_calendar[datetime_key]
-                
-                # Try parsing the datetime string, with a fallback
-                try:
-                    dtstart = datetime.fromisoformat(datetime_str)
-                except ValueError:
-                    dtstart = parser.parse(datetime_str).replace(tzinfo=nz_time)
-
-                # Create the event
-                event = Event()
-                event.add('uid', str(uid_counter))  # Use the current UID counter value
-                event.add('dtstamp', datetime.now().astimezone())
-                event.add('dtstart', dtstart)
-                event.add('summary', json_calendar[title_key])
-                event.add('description', json_calendar[description_key])
-                cal.add_component(event)
-                
-                # Increment the UID counter in session state for the next event
-                st.session_state.cal['uid_counter'] += 1
-                auto_save_cal()
-
-        return cal.to_ical()
-
-    # Assuming you have already parsed your JSON object into `json_calendar`
-    ical_content = create_icalendar(json_calendar)
+    # Export every event, cancelled ones included, so re-importing updates or removes them in place
+    all_calendar_entries = load_calendar(workspace.id, include_cancelled=True)
+    last_export = get_value(workspace.id, 'calendar', 'exported_at')
+
+    def record_export():
+        save_value(workspace.id, 'calendar', 'exported_at', time.time())
 
     # Allow user to download iCalendar file using Streamlit
     st.download_button(
         label="Download Calendar",
-        data=ical_content,
+        data=ics.to_ics(all_calendar_entries, name=brand.business_name_primary),
         file_name="calendar.ics",
-        mime="text/calendar"
+        mime="text/calendar",
+        on_click=record_export,
     )
+
+    # Only the events added, changed or cancelled since the last download
+    if last_export is not None and ics.count_changes(all_calendar_entries, last_export):
+        st.download_button(
+            label=f"Download Changes Only ({ics.count_changes(all_calendar_entries, last_export)} events)",
+            data=ics.to_ics(all_calendar_entries, name=brand.business_name_primary, since=last_export),
+            file_name="calendar-changes.ics",
+            mime="text/calendar",
+            on_click=record_export,
+        )
+
+    # Subscription link (calendar apps re-fetch it, so they stay up to date without downloads)
+    if feed_available():
+        st.text("")
+        st.markdown("Or subscribe in Google Calendar, Outlook or Apple Calendar with this link:")
+        st.code(feed_url(workspace.id), language=None)
+        if st.button("Reset Calendar Link", help="Stop the current link working and make a new one."):
+            reset_feed_token(workspace.id)
+            st.rerun()
     
         
     # Reset the flag after transferring ideas
@@ -1,13 +1,19 @@
 import streamlit as st
-import pandas as pd
 import ssl
-from openai import OpenAI
 import re
 from datetime import date
 import json
 import os
 from dotenv import load_dotenv
 
+from riplo.autosave import load_namespace, metrics, save_later
+from riplo.brand_profile import BrandSchemaError, accept_brand_schema, invalidate
+from riplo import prompt_cache
+from riplo.jobs import is_active
+from riplo.llm import usage_stats
+from riplo.session import current_workspace, follow_job, job_newly_finished, job_progress, start_job, switch_workspace, workspace_sidebar
+from riplo.workspaces import create_workspace, save_workspace
+
 
 
 
@@ -15,64 +21,29 @@ from dotenv import load_dotenv
 # Load environment variables from .env
 load_dotenv()
 
-# Get the API key from the environment variable
-api_key = os.getenv("OPENAI_API_KEY")
-
-# Check if the API key is available
-if not api_key:
-    raise ValueError("API key not found. Please set OPENAI_API_KEY in your .env file.")
-
-# Set your OpenAI API key
-client = OpenAI(api_key=api_key)
-
-
 
 
-# Fetch data from Google Sheets
-def fetch_google_sheet_data(sheet_url):
-    df = pd.read_csv(sheet_url, header=None)
-    df = df.transpose()
-    return df
 
-# Define the URLs of the Google Sheet tabs (CSV export links)
-primary_sheet_url = "https://docs.google.com/spreadsheets/d/13fGf2XoDKuuY-95UchkgNkkwXVv2_YxcKjR9p2cknZg/export?format=csv&gid=78226312"
+# Resolve which business (workspace) this session is working on
+workspace = current_workspace()
 
-# Fetch data from both sheets
-primary_df = fetch_google_sheet_data(primary_sheet_url)
-
-# Extract variables from dataframes
-business_name_primary = primary_df.iloc[1, 0]
-
-
-# Define functions to save and load data
-def save_data(data, filename='sessiondata.json'):
-    with open(filename, 'w') as file:
-        json.dump(data, file, indent=4)
-
-def load_data(filename='sessiondata.json'):
-    if not os.path.exists(filename):
-        # Create an empty JSON file if it doesn't exist
-        with open(filename, 'w') as file:
-            json.dump({}, file)
-    try:
-        with open(filename, 'r') as file:
-            content = file.read().strip()  # Read file content and strip any whitespace
-            if content:
-                return json.loads(content)  # Load JSON data if the content is not empty
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    return {}  # Return an empty dictionary if the file is not found or if there's a JSON decode error
+# Load the brand profile (built once per sheet revision and shared by every page and session)
+# Settings must still render when the sheet layout has drifted, so the new layout can be accepted
+try:
+    brand = workspace.brand_profile()
+    brand_error = None
+except BrandSchemaError as e:
+    brand = None
+    brand_error = str(e)
 
-# Load existing data
-data = load_data()
 
-# Initialize inputs
-if 'inputs' not in st.session_state:
-    st.session_state.inputs = data.get('inputs', {})
+# Load the latest saved inputs (shared by every session through the app database)
+st.session_state.inputs = load_namespace(workspace.id, 'inputs')
 
-def auto_save_inputs():
-    data['inputs'] = st.session_state.inputs
-    save_data(data)
+# Callback function to update `inputs` in session state and save the edited key
+def update_and_save_inputs(key):
+    st.session_state.inputs[key] = st.session_state[key]
+    save_later(workspace.id, 'inputs', key, st.session_state[key])
 
 # Retrieve values from session state
 input_goals = st.session_state.inputs.get('input_goals', '')
@@ -94,6 +65,7 @@ st.set_page_config(page_title="Settings", page_icon="👾")
 logo_large = "images/Riplo Beta Text Logo 1.svg"
 logo_small = "images/Riplo Beta Text Logo Small.svg"
 st.logo(logo_large, size="large", icon_image=logo_small)
+workspace_sidebar(workspace)
 
 
 st.markdown(
@@ -113,6 +85,9 @@ st.markdown(
 
 st.title("Settings")
 
+if brand_error:
+    st.error(brand_error)
+
 st.text("")
 st.text("")
 
@@ -138,39 +113,116 @@ Partnerships/Collaborations:
 """
 
 
-# Function to get response from OpenAI's Chat API and handle response extraction
-def get_chatgpt_response(prompt):
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are part of a prompt chain sequence. You should follow the instructions and generate the output as instructed. This is not a conversation. Your outputs should not include any introductory or explanatory text. Your outputs should be in plain text with a line break on the first line. Ensure that the output is strictly limited to the content requested."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content.strip()
 
 
 # Collect user inputs and store them in session state
 
-st.session_state.inputs['input_media'] = st.text_input('Media Capabilities', value=st.session_state.inputs.get('input_media'), on_change=auto_save_inputs)
+st.session_state.inputs['input_media'] = st.text_input('Media Capabilities', value=st.session_state.inputs.get('input_media'), key='input_media', on_change=update_and_save_inputs, args=('input_media',))
 st.caption("Describe the types of media you can capture or create for your social media posts. Examples include iPhone photos, reel-style videos, or graphics made with Canva.")
 st.text("")
-st.session_state.inputs['input_partnerships'] = st.text_input('Partnerships and Collaborations:', value=st.session_state.inputs.get('input_partnerships', ''), on_change=auto_save_inputs)
+st.session_state.inputs['input_partnerships'] = st.text_input('Partnerships and Collaborations:', value=st.session_state.inputs.get('input_partnerships', ''), key='input_partnerships', on_change=update_and_save_inputs, args=('input_partnerships',))
 st.caption("List any partnerships or collaborations with other businesses or creatives.")
 st.text("")
 
-# Manually trigger auto_save to store the initial values
-auto_save_inputs()
 
 
-# Conditional logic for running LangChain and extracting summaries
-if st.button('Save'):
+# Conditional logic for running LangChain and extracting summaries (in a background job, saved when it finishes)
+summary_job = follow_job(workspace.id, 'summarise_input')
+
+if st.button('Save', disabled=is_active(summary_job)):
     # Run first prompt
     full_prompt_1 = prompt_template_1.format(input_success=input_success, input_partnerships=input_partnerships, input_stats=input_stats)
-    userinputsummary_partnerships = get_chatgpt_response(full_prompt_1)
-    
-    # Store the summaries in the session state
-    st.session_state.inputs['userinputsummary_partnerships'] = userinputsummary_partnerships
+    start_job(workspace.id, 'summarise_input', {"prompt": full_prompt_1, "model": "gpt-4", "key": 'userinputsummary_partnerships'})
+    st.rerun()
+
+if is_active(summary_job):
+    job_progress(summary_job['id'], "Summarising your settings…")
+
+elif job_newly_finished('summarise_input', summary_job):
+    if summary_job['status'] == 'failed':
+        st.error(f"Your settings couldn't be summarised right now, please try again in a minute. ({summary_job['error']})")
+    else:
+        # The job has saved the summary; store it in the session state too
+        st.session_state.inputs['userinputsummary_partnerships'] = summary_job['result']['summary']
 
-    # Automatically save summaries
-    auto_save_inputs()
+
+
+# Force the brand sheets to be revalidated against Google on the next render
+st.text("")
+if st.button('Reload Brand Profile'):
+    invalidate()
+    st.success("Brand profile will be refreshed from Google Sheets.")
+
+if st.button('Accept Brand Sheet Layout'):
+    accept_brand_schema()
+    st.success("The current brand sheet layout has been accepted.")
+
+
+# Autosave queue health
+with st.expander("Autosave"):
+    autosave_metrics = metrics()
+    st.caption(
+        f"Pending: {autosave_metrics['pending']} · Written: {autosave_metrics['written']} · "
+        f"Coalesced: {autosave_metrics['coalesced']} · Flushes: {autosave_metrics['flushes']} · "
+        f"Errors: {autosave_metrics['errors']}"
+    )
+    st.caption(
+        f"Last flush lag: {autosave_metrics['last_flush_lag']:.2f}s · "
+        f"Max flush lag: {autosave_metrics['max_flush_lag']:.2f}s · "
+        f"Last flush took: {autosave_metrics['last_flush_duration'] * 1000:.1f}ms"
+    )
+
+
+# Prompt cache health
+with st.expander("Prompt Cache"):
+    cache_stats = prompt_cache.stats()
+    st.caption(
+        f"Hits: {cache_stats['hits']} · Misses: {cache_stats['misses']} · "
+        f"Hit rate: {cache_stats['hit_rate']:.0%} · Entries: {cache_stats['entries']} · "
+        f"Size: {cache_stats['bytes'] / 1024:.0f} KB · Evictions: {cache_stats['evictions']}"
+    )
+    if st.button('Clear Prompt Cache'):
+        prompt_cache.clear()
+        st.success("Prompt cache cleared.")
+
+
+# How much of each prompt OpenAI served from its own prefix cache (the brand profile goes first for this)
+with st.expander("OpenAI Prompt Caching"):
+    usage = usage_stats()
+    st.caption(
+        f"Responses: {usage['responses']} · Prompt tokens: {usage['prompt_tokens']} · "
+        f"Cached tokens: {usage['cached_tokens']} ({usage['cached_rate']:.0%})"
+    )
+
+
+
+
+# Workspace (business) configuration
+st.divider()
+st.subheader("Workspace")
+st.text("")
+
+workspace_name = st.text_input('Business Name', value=workspace.name, key=f'workspace_name_{workspace.id}')
+primary_sheet_url = st.text_input('Primary Sheet (CSV export link)', value=workspace.primary_sheet_url, key=f'primary_sheet_url_{workspace.id}')
+questionnaire_sheet_url = st.text_input('Questionnaire Sheet (CSV export link)', value=workspace.questionnaire_sheet_url, key=f'questionnaire_sheet_url_{workspace.id}')
+summaries_sheet_url = st.text_input('Summaries Sheet (CSV export link)', value=workspace.summaries_sheet_url, key=f'summaries_sheet_url_{workspace.id}')
+
+if st.button('Save Workspace'):
+    save_workspace(workspace.id, workspace_name, primary_sheet_url, questionnaire_sheet_url, summaries_sheet_url)
+    st.success("Workspace saved.")
+    st.rerun()
+
+st.text("")
+st.text("")
+
+new_workspace_id = st.text_input('New Workspace ID')
+st.caption("Lowercase letters, numbers, '-' and '_'. The brand sheets can be set once the workspace is created.")
+
+if st.button('Create Workspace'):
+    try:
+        new_workspace = create_workspace(new_workspace_id.strip(), new_workspace_id.strip())
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        switch_workspace(new_workspace.id)
+        st.rerun()
@@ -0,0 +1,212 @@
+import atexit
+import os
+import threading
+import time
+
+from riplo import storage
+
+
+
+# Write-behind autosave for widget edits.
+#
+# Widget callbacks queue the edited key here and return straight away; a
+# background thread writes the queued keys to the app database once a key has
+# been quiet for AUTOSAVE_DEBOUNCE seconds (or has been waiting for
+# AUTOSAVE_MAX_DELAY). Repeated edits to the same key are coalesced into one
+# write, so a fast typist costs one upsert instead of one per keystroke.
+#
+# Reads made through this module see queued edits immediately. Anything that
+# rewrites several keys at once (slot shifts, compaction) should call flush()
+# first so the queued edits land before it reads the database.
+
+
+AUTOSAVE_DEBOUNCE = float(os.getenv("RIPLO_AUTOSAVE_DEBOUNCE", "0.5"))
+AUTOSAVE_MAX_DELAY = float(os.getenv("RIPLO_AUTOSAVE_MAX_DELAY", "2.0"))
+
+# Marks a queued delete
+_DELETED = object()
+
+
+_cond = threading.Condition()
+_pending = {}    # (workspace, namespace, key) -> [value, first_queued, last_queued]
+_inflight = {}   # entries taken by the writer but not yet committed
+_flush_requested = False
+_writer = None
+
+_metrics = {
+    "queued": 0,
+    "coalesced": 0,
+    "written": 0,
+    "flushes": 0,
+    "errors": 0,
+    "last_flush_lag": 0.0,
+    "max_flush_lag": 0.0,
+    "last_flush_duration": 0.0,
+}
+
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=_run_writer, name="riplo-autosave", daemon=True)
+        _writer.start()
+
+
+def _queue(workspace, namespace, key, value):
+    now = time.monotonic()
+    with _cond:
+        entry = _pending.get((workspace, namespace, key))
+        if entry is None:
+            _pending[(workspace, namespace, key)] = [value, now, now]
+        else:
+            entry[0] = value
+            entry[2] = now
+            _metrics["coalesced"] += 1
+        _metrics["queued"] += 1
+        _ensure_writer()
+        _cond.notify_all()
+
+
+# Queue an upsert of one key
+def save_later(workspace, namespace, key, value):
+    _queue(workspace, namespace, key, value)
+
+
+# Queue a delete of one key
+def delete_later(workspace, namespace, key):
+    _queue(workspace, namespace, key, _DELETED)
+
+
+
+def _due_entries(now):
+    if _flush_requested:
+        return list(_pending)
+    return [
+        entry_key for entry_key, (_, first, last) in _pending.items()
+        if now - last >= AUTOSAVE_DEBOUNCE or now - first >= AUTOSAVE_MAX_DELAY
+    ]
+
+
+def _next_deadline(now):
+    return min(
+        min(last + AUTOSAVE_DEBOUNCE, first + AUTOSAVE_MAX_DELAY) - now
+        for _, first, last in _pending.values()
+    )
+
+
+def _write(batch):
+    conn = storage.get_connection()
+    # Commits from this thread are fsynced; the render threads never wait on them
+    conn.execute("PRAGMA synchronous = FULL")
+    with storage.transaction():
+        for (workspace, namespace, key), (value, _, _) in batch.items():
+            if value is _DELETED:
+                storage.delete_value(workspace, namespace, key)
+            else:
+                storage.save_value(workspace, namespace, key, value)
+
+
+def _run_writer():
+    global _flush_requested
+    while True:
+        with _cond:
+            while True:
+                now = time.monotonic()
+                due = _due_entries(now) if _pending else []
+                if due:
+                    break
+                if not _pending:
+                    _flush_requested = False
+                    _cond.notify_all()
+                    _cond.wait()
+                else:
+                    _cond.wait(timeout=max(_next_deadline(now), 0.01))
+            batch = {entry_key: _pending.pop(entry_key) for entry_key in due}
+            _inflight.update(batch)
+
+        started = time.monotonic()
+        try:
+            _write(batch)
+            failed = False
+        except Exception:
+            failed = True
+
+        with _cond:
+            for entry_key in batch:
+                _inflight.pop(entry_key, None)
+            if failed:
+                # Put the batch back (unless the key has been edited again since) and retry later
+                _metrics["errors"] += 1
+                for entry_key, entry in batch.items():
+                    _pending.setdefault(entry_key, entry)
+            else:
+                finished = time.monotonic()
+                lag = max(finished - first for _, first, _ in batch.values())
+                _metrics["written"] += len(batch)
+                _metrics["flushes"] += 1
+                _metrics["last_flush_lag"] = lag
+                _metrics["max_flush_lag"] = max(_metrics["max_flush_lag"], lag)
+                _metrics["last_flush_duration"] = finished - started
+            _cond.notify_all()
+
+        if failed:
+            time.sleep(AUTOSAVE_DEBOUNCE)
+
+
+
+# Write everything queued so far and wait until it is committed
+def flush(timeout=10.0):
+    global _flush_requested
+    deadline = time.monotonic() + timeout
+    with _cond:
+        if not _pending and not _inflight:
+            return True
+        _flush_requested = True
+        _ensure_writer()
+        _cond.notify_all()
+        while _pending or _inflight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _cond.wait(timeout=remaining)
+    return True
+
+
+def _overlay(workspace, namespace, values):
+    with _cond:
+        for source in (_inflight, _pending):
+            for (entry_workspace, entry_namespace, key), (value, _, _) in source.items():
+                if entry_workspace == workspace and entry_namespace == namespace:
+                    if value is _DELETED:
+                        values.pop(key, None)
+                    else:
+                        values[key] = value
+    return values
+
+
+# Read a namespace including edits that are still queued
+def load_namespace(workspace, namespace):
+    return _overlay(workspace, namespace, storage.load_namespace(workspace, namespace))
+
+
+def get_value(workspace, namespace, key, default=None):
+    with _cond:
+        for source in (_pending, _inflight):
+            entry = source.get((workspace, namespace, key))
+            if entry is not None:
+                return default if entry[0] is _DELETED else entry[0]
+    return storage.get_value(workspace, namespace, key, default)
+
+
+# Counters and lag for the autosave queue
+def metrics():
+    with _cond:
+        snapshot = dict(_metrics)
+        snapshot["pending"] = len(_pending) + len(_inflight)
+        now = time.monotonic()
+        snapshot["oldest_pending_age"] = max((now - first for _, first, _ in _pending.values()), default=0.0)
+    return snapshot
+
+
+atexit.register(flush)
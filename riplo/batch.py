@@ -0,0 +1,151 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+from riplo import duplicates, storage, vault
+from riplo.brand_context import brand_prefix
+from riplo.ideas import build_idea_prompt, extract_post_outputs
+from riplo.llm import get_chatgpt_response
+from riplo.workspaces import get_workspace, list_workspaces, save_workspace
+
+
+
+# Headless idea generation for many businesses at once.
+#
+#   python -m riplo.batch jobs.json
+#   python -m riplo.batch --all --goals "Drive foot traffic over summer"
+#
+# The jobs file is a JSON list of businesses:
+#
+#   [{"workspace": "short-black", "name": "Short Black Cafe",
+#     "primary_sheet_url": "...", "questionnaire_sheet_url": "...",
+#     "summaries_sheet_url": "...", "goals": "...", "keydates": "..."}]
+#
+# Sheet URLs and name are optional for workspaces that already exist; goals and
+# key dates default to the workspace's saved inputs. Businesses are processed
+# by a bounded thread pool that shares the app's OpenAI rate limiter, and the
+# generated ideas go straight into each workspace's Idea Vault. Each finished
+# business is recorded under the run name in the same transaction as its
+# vault update, so re-running the same run after a crash skips the businesses
+# that were already done.
+
+
+BATCH_WORKERS = 4
+
+
+
+# Add the new ideas to the workspace's vault (first idea newest) and record the run, atomically
+def _store_ideas(workspace_id, ideas, run, record):
+    with storage.transaction():
+        vault.add_many(workspace_id, ideas)
+        storage.save_value(workspace_id, 'batch', run, record)
+
+
+def _generate_ideas(prompt, prefix, bypass_cache):
+    outputs = extract_post_outputs(get_chatgpt_response(prompt, prefix=prefix, bypass_cache=bypass_cache))
+    return [outputs[f'postidea_{i}'] for i in range(1, len(outputs) // 2 + 1)]
+
+
+def run_job(job, run, bypass_cache=False):
+    workspace_id = job["workspace"]
+    if any(job.get(field) for field in ("name", "primary_sheet_url", "questionnaire_sheet_url", "summaries_sheet_url")):
+        current = storage.get_workspace_config(workspace_id) or {}
+        save_workspace(
+            workspace_id,
+            job.get("name") or current.get("name") or workspace_id,
+            job.get("primary_sheet_url") or current.get("primary_sheet_url", ""),
+            job.get("questionnaire_sheet_url") or current.get("questionnaire_sheet_url", ""),
+            job.get("summaries_sheet_url") or current.get("summaries_sheet_url", ""),
+        )
+    workspace = get_workspace(workspace_id)
+
+    inputs = storage.load_namespace(workspace_id, 'inputs')
+    if job.get("goals"):
+        inputs['input_goals'] = job["goals"]
+    if job.get("keydates"):
+        inputs['input_keydates'] = job["keydates"]
+
+    started = time.monotonic()
+    brand = workspace.brand_profile()
+    prompt = build_idea_prompt(brand, inputs, avoid=duplicates.avoid_hints(workspace_id))
+    ideas = _generate_ideas(prompt, brand_prefix(brand), bypass_cache)
+    if not ideas and not bypass_cache:
+        # Don't keep replaying a cached answer that couldn't be parsed
+        ideas = _generate_ideas(prompt, brand_prefix(brand), bypass_cache=True)
+    if not ideas:
+        raise ValueError("The response did not contain any 'Post N' ideas.")
+
+    # Skip ideas the vault already has
+    new_ideas = [idea for idea in ideas if duplicates.find_duplicate(workspace_id, idea) is None]
+
+    record = {
+        "ideas": len(new_ideas),
+        "duplicates": len(ideas) - len(new_ideas),
+        "seconds": round(time.monotonic() - started, 1),
+        "finished_at": time.time(),
+    }
+    _store_ideas(workspace_id, new_ideas, run, record)
+    return record
+
+
+def load_jobs(path):
+    with open(path, "r", encoding="utf-8") as f:
+        jobs = json.load(f)
+    for job in jobs:
+        if not job.get("workspace"):
+            raise ValueError(f"Every job needs a 'workspace': {job}")
+    return jobs
+
+
+def run_batch(jobs, run, workers=BATCH_WORKERS, bypass_cache=False, log=print):
+    pending = [job for job in jobs if storage.get_value(job["workspace"], 'batch', run) is None]
+    skipped = len(jobs) - len(pending)
+    if skipped:
+        log(f"Skipping {skipped} business(es) already done in run '{run}'.")
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job, run, bypass_cache): job["workspace"] for job in pending}
+        for future in as_completed(futures):
+            workspace_id = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                failures[workspace_id] = str(e)
+                log(f"FAILED {workspace_id}: {e}")
+            else:
+                log(f"done   {workspace_id}: {record['ideas']} ideas ({record['duplicates']} duplicates skipped) in {record['seconds']}s")
+    return failures
+
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m riplo.batch", description="Generate post ideas for many businesses.")
+    arg_parser.add_argument("jobs", nargs="?", help="JSON file listing the businesses to generate ideas for")
+    arg_parser.add_argument("--all", action="store_true", help="run every saved workspace")
+    arg_parser.add_argument("--goals", default="", help="content goals for --all (default: each workspace's saved goals)")
+    arg_parser.add_argument("--keydates", default="", help="key dates for --all (default: each workspace's saved key dates)")
+    arg_parser.add_argument("--run", default=date.today().strftime("%Y-%m"), help="run name used to resume (default: this month)")
+    arg_parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    arg_parser.add_argument("--fresh", action="store_true", help="ignore cached model responses")
+    args = arg_parser.parse_args(argv)
+
+    if args.all:
+        jobs = [{"workspace": workspace.id, "goals": args.goals, "keydates": args.keydates} for workspace in list_workspaces()]
+    elif args.jobs:
+        jobs = load_jobs(args.jobs)
+    else:
+        arg_parser.error("give a jobs file or --all")
+
+    failures = run_batch(jobs, args.run, workers=args.workers, bypass_cache=args.fresh)
+    if failures:
+        print(f"{len(failures)} of {len(jobs)} business(es) failed; re-run with --run {args.run} to retry them.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+import tiktoken
+
+
+
+# Token-budgeted brand context for prompts.
+#
+# The brand sheets hold ~50 free-text answers, some of them as long as a
+# client cares to make them. Instead of pasting a fixed set of them into the
+# prompt, the context is assembled section by section under a token budget:
+# each section (Products, Target Audience, Community, ...) has its detailed
+# answers and, for most, a precomputed *_summary column. Every section that
+# fits starts out as its summary (or its detailed answers cut down to a few
+# sentences), in order of relevance to the request (the goals and key dates,
+# scored by how many of their words the section mentions);
+# the most relevant sections are then upgraded to the full answers while
+# budget remains. Tokens are counted locally with tiktoken, or estimated from
+# the length when its encoding isn't available, and text is cut to a bounded
+# length before it is counted, so prompt size and the time spent building it
+# stay bounded however verbose the answers are.
+#
+# For prompt caching, the brand's profile (chosen without any request) goes
+# at the start of every prompt for that brand, in the system message, via
+# brand_prefix: it only changes when the brand sheets do, so the provider can
+# reuse its cached prefix. Sections that matter to one request but didn't
+# make the profile are added after it with relevant_brand_context.
+
+
+# Tokens the brand section of a prompt may use
+BRAND_CONTEXT_TOKENS = int(os.getenv("RIPLO_BRAND_CONTEXT_TOKENS", "1500"))
+
+# Tokens a request's extra relevant sections may use (after the brand profile)
+RELEVANT_CONTEXT_TOKENS = int(os.getenv("RIPLO_RELEVANT_CONTEXT_TOKENS", "500"))
+
+# Tokens each user input (goals, key dates, past successes, ...) may use
+INPUT_TOKENS = int(os.getenv("RIPLO_INPUT_TOKENS", "300"))
+
+# A section without a summary is cut to this many tokens until it is upgraded
+SECTION_BASE_TOKENS = 120
+
+# Summaries are cut to this many tokens
+SUMMARY_TOKENS = 250
+
+# Sections aren't squeezed into less than this
+SECTION_MIN_TOKENS = 30
+
+# How much relevance to the request counts against a section's base priority
+RELEVANCE_WEIGHT = 4.0
+
+TOKEN_ENCODING = "o200k_base"
+
+# Rough characters per token, for the estimate and for pre-cutting long text
+CHARS_PER_TOKEN = 4
+
+# Only this much of a section is read when scoring its relevance
+RELEVANCE_CHARS = 20000
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our the this that to with your you we".split()
+)
+
+
+@dataclass(frozen=True, slots=True)
+class BrandSection:
+    label: str
+    fields: tuple
+    summary: str = ""
+    priority: float = 1.0
+
+
+# Sections in the order they appear in the prompt. The ones the idea prompt has
+# always had carry a higher priority; the rest come in when they are relevant.
+BRAND_SECTIONS = (
+    BrandSection("Business Overview", ("industry_primary", "locations_primary", "uvp_primary", "usp_primary", "company_history_primary"), "company_overview_summary", 3.0),
+    BrandSection("Products", ("products_overview_primary", "products_details_primary", "pricing_strategy_primary"), "products_overview_summary", 3.0),
+    BrandSection("Target Audience", ("ta_specific_primary", "ta_general_form", "customer_psychographics_form"), "audience_summary", 3.0),
+    BrandSection("Brand Essence", ("values_form", "brand_personality_form", "company_purpose_form", "positioning_form"), "brand_essence_summary", 2.5),
+    BrandSection("Content Pillars", ("contentpillars_form",), "", 3.0),
+    BrandSection("Content Style", ("brand_voice_form", "key_tone_form", "caption_style_primary"), "content_style_summary", 2.5),
+    BrandSection("Seasonality", ("seasonality_primary",), "", 2.0),
+    BrandSection("Key Public Dates", ("key_publicdates_primary",), "", 2.0),
+    BrandSection("Market", ("competitors_general_form", "competetive_advantage_primary", "problems_solved_primary", "needs_fulfilled_primary"), "market_audience_summary", 1.0),
+    BrandSection("Marketing", ("marketing_strategies_primary", "loyalty_primary", "customer_journey_primary"), "marketing_summary", 1.0),
+    BrandSection("Community", ("community_primary",), "", 1.0),
+    BrandSection("Sustainability", ("sustainability_primary",), "", 1.0),
+    BrandSection("Customer Feedback", ("customer_feedback_primary", "impact_customers_primary"), "", 1.0),
+    BrandSection("Customer Experience", ("customer_experience_form",), "", 1.0),
+    BrandSection("Team", ("employee_details_primary",), "", 0.5),
+    BrandSection("Visual Style", ("brand_visual_elements",), "", 0.5),
+)
+
+
+# Brand Profile
+brand_prefix_template = """Brand Profile for {business_name}:
+
+{brand_context}"""
+
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+
+# The tiktoken encoding, or None if it can't be loaded (it is downloaded on first use)
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception:
+                _encoding = None
+    return _encoding
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# Cut text to at most `limit` tokens, at a sentence or word boundary where there is one
+def truncate_tokens(text, limit):
+    text = text.strip()
+    if limit <= 0:
+        return ""
+    # Never count more than a bounded amount of text, however long the answer is
+    text = text[:limit * CHARS_PER_TOKEN * 2]
+    if count_tokens(text) <= limit:
+        return text
+
+    encoding = _get_encoding()
+    if encoding is None:
+        cut = text[:(limit - 1) * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:limit - 1])
+    sentence_end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "), cut.rfind("\n"))
+    if sentence_end > len(cut) // 2:
+        return cut[:sentence_end + 1].rstrip()
+    word_end = cut.rfind(" ")
+    if word_end > len(cut) // 2:
+        cut = cut[:word_end]
+    return cut.rstrip(" ,;:") + "…"
+
+
+def _section_texts(brand, section):
+    detail = " ".join(value for value in (getattr(brand, name).strip() for name in section.fields) if value)
+    summary = getattr(brand, section.summary).strip() if section.summary else ""
+    return detail, summary
+
+
+def _line(section, text):
+    return f"{section.label}: {text}"
+
+
+def _words(text):
+    return {word for word in _WORD_PATTERN.findall(text[:RELEVANCE_CHARS].lower()) if word not in _STOPWORDS}
+
+
+# Pick the sections (position -> text) to include within `budget` tokens, most relevant to `query` first
+def _select_sections(brand, query, budget, exclude=frozenset(), relevant_only=False):
+    query_words = _words(query)
+    candidates = []
+    for position, section in enumerate(BRAND_SECTIONS):
+        detail, summary = _section_texts(brand, section)
+        if position in exclude or (not detail and not summary):
+            continue
+        # Share of the request's words the section mentions
+        relevance = len(query_words & _words(f"{section.label} {summary} {detail}")) / len(query_words) if query_words else 0.0
+        if relevant_only and not relevance:
+            continue
+        candidates.append((section.priority + RELEVANCE_WEIGHT * relevance, position, section, detail, summary))
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+    # Every section that fits, in its short form (most relevant first)
+    remaining = budget
+    chosen = {}
+    for _, position, section, detail, summary in candidates:
+        text = truncate_tokens(summary, SUMMARY_TOKENS) if summary else truncate_tokens(detail, SECTION_BASE_TOKENS)
+        cost = count_tokens(_line(section, text))
+        if cost > remaining:
+            if remaining < SECTION_MIN_TOKENS:
+                continue
+            text = truncate_tokens(text, remaining - count_tokens(_line(section, "")))
+            cost = count_tokens(_line(section, text))
+            if not text or cost > remaining:
+                continue
+        chosen[position] = text
+        remaining -= cost
+
+    # Then the full answers of the most relevant sections, while they fit
+    for _, position, section, detail, summary in candidates:
+        if position not in chosen or not detail:
+            continue
+        text = truncate_tokens(detail, remaining + count_tokens(chosen[position]))
+        if text == detail.strip() and text != chosen[position]:
+            extra = count_tokens(_line(section, text)) - count_tokens(_line(section, chosen[position]))
+            if 0 < extra <= remaining:
+                chosen[position] = text
+                remaining -= extra
+    return chosen
+
+
+def _format_sections(chosen):
+    return "\n".join(_line(BRAND_SECTIONS[position], chosen[position]) for position in sorted(chosen))
+
+
+# The brand sections for a prompt as "Label: text" lines, within `budget` tokens and most relevant to `query` first
+def build_brand_context(brand, query="", budget=BRAND_CONTEXT_TOKENS):
+    return _format_sections(_select_sections(brand, query, budget))
+
+
+@lru_cache(maxsize=64)
+def _profile_sections(brand):
+    return _select_sections(brand, "", BRAND_CONTEXT_TOKENS)
+
+
+# The brand profile every prompt for the brand starts with (the same bytes until the brand sheets change)
+@lru_cache(maxsize=64)
+def brand_prefix(brand):
+    return brand_prefix_template.format(
+        business_name=truncate_tokens(brand.business_name_primary, INPUT_TOKENS),
+        brand_context=_format_sections(_profile_sections(brand)),
+    )
+
+
+# Sections relevant to `query` that the brand profile left out, within `budget` tokens
+def relevant_brand_context(brand, query, budget=RELEVANT_CONTEXT_TOKENS):
+    if not query.strip():
+        return ""
+    return _format_sections(_select_sections(brand, query, budget, frozenset(_profile_sections(brand)), relevant_only=True))
@@ -0,0 +1,417 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, fields
+
+import requests
+
+
+
+# Shared, process-wide cache of the brand Google Sheets.
+#
+# Streamlit re-runs every page script on each widget interaction, but this
+# module is only imported once per process, so the cache below is shared by
+# every page and every browser session. A sheet is downloaded at most once per
+# TTL; after that it is revalidated with ETag/If-Modified-Since in a background
+# thread while the page keeps rendering the copy it already has. Every good
+# download is also written to an on-disk snapshot so a restarted process can
+# render straight away without waiting on Google.
+
+
+# How long (seconds) a fetched sheet is served before it is revalidated
+SHEET_TTL_SECONDS = int(os.getenv("RIPLO_SHEET_TTL", "300"))
+
+# Timeout (seconds) for a single request to Google
+SHEET_FETCH_TIMEOUT = float(os.getenv("RIPLO_SHEET_TIMEOUT", "10"))
+
+# Where the last good copy of every sheet is kept
+SNAPSHOT_DIR = os.getenv("RIPLO_SNAPSHOT_DIR", os.path.join(".cache", "sheets"))
+
+
+class _SheetEntry:
+    __slots__ = ("url", "text", "etag", "last_modified", "fetched_at", "revision", "refreshing", "rows")
+
+    def __init__(self, url, text, etag=None, last_modified=None, fetched_at=0.0):
+        self.url = url
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.revision = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        self.refreshing = False
+        self.rows = None
+
+
+_entries = {}
+_lock = threading.Lock()
+
+
+
+# Snapshot helpers
+def _snapshot_path(url):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def _write_snapshot(entry):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = _snapshot_path(entry.url)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({
+            "url": entry.url,
+            "text": entry.text,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+        }, file)
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot(url):
+    try:
+        with open(_snapshot_path(url), "r") as file:
+            snapshot = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    # Snapshots are loaded as already expired so they get revalidated straight away
+    return _SheetEntry(url, snapshot["text"], snapshot.get("etag"), snapshot.get("last_modified"), fetched_at=0.0)
+
+
+
+# Download a sheet, sending the validators of the copy we already hold
+def _download(url, previous=None):
+    headers = {}
+    if previous is not None:
+        if previous.etag:
+            headers["If-None-Match"] = previous.etag
+        if previous.last_modified:
+            headers["If-Modified-Since"] = previous.last_modified
+
+    response = requests.get(url, headers=headers, timeout=SHEET_FETCH_TIMEOUT)
+
+    if response.status_code == 304 and previous is not None:
+        previous.fetched_at = time.time()
+        return previous
+
+    response.raise_for_status()
+    response.encoding = "utf-8"
+    entry = _SheetEntry(
+        url,
+        response.text,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        fetched_at=time.time(),
+    )
+
+    # Keep the parsed rows if the content did not actually change
+    if previous is not None and previous.revision == entry.revision:
+        entry.rows = previous.rows
+
+    _write_snapshot(entry)
+    return entry
+
+
+def _refresh_in_background(entry):
+    def run():
+        try:
+            fresh = _download(entry.url, entry)
+        except (requests.RequestException, OSError):
+            # Keep serving what we have and try again after another TTL
+            fresh = entry
+            fresh.fetched_at = time.time()
+        with _lock:
+            fresh.refreshing = False
+            entry.refreshing = False
+            _entries[entry.url] = fresh
+
+    thread = threading.Thread(target=run, name="riplo-sheet-refresh", daemon=True)
+    thread.start()
+
+
+
+# Return the cached entry for a sheet, revalidating it in the background when stale
+def get_sheet(url):
+    with _lock:
+        entry = _entries.get(url)
+        if entry is None:
+            entry = _read_snapshot(url)
+            if entry is not None:
+                _entries[url] = entry
+
+    if entry is None:
+        # Nothing in memory or on disk: this is the only time a render waits on Google
+        entry = _download(url)
+        with _lock:
+            _entries[url] = entry
+        return entry
+
+    with _lock:
+        is_stale = time.time() - entry.fetched_at >= SHEET_TTL_SECONDS
+        if is_stale and not entry.refreshing:
+            entry.refreshing = True
+            _refresh_in_background(entry)
+
+    return entry
+
+
+# Mark one sheet (or every sheet) as stale so the next read revalidates it
+def invalidate(url=None):
+    with _lock:
+        if url is None:
+            entries = list(_entries.values())
+        else:
+            entries = [_entries[url]] if url in _entries else []
+        for entry in entries:
+            entry.fetched_at = 0.0
+
+
+# Revision id of the copy currently being served for a sheet
+def sheet_revision(url):
+    return get_sheet(url).revision
+
+
+
+
+# Parse a sheet export into rows of [label, value, ...] (parsed once per revision)
+def sheet_rows(url):
+    entry = get_sheet(url)
+    if entry.rows is None:
+        # Blank lines are skipped, matching how the sheets were read with pandas
+        entry.rows = [row for row in csv.reader(io.StringIO(entry.text)) if row]
+    return entry
+
+
+
+# Where each brand field lives: (sheet, row). Each sheet has one row per
+# question, with the question text in the first cell and the answer in the second.
+BRAND_COLUMNS = {
+    "business_name_primary": ("primary", 0),
+    "industry_primary": ("primary", 1),
+    "locations_primary": ("primary", 2),
+    "uvp_primary": ("primary", 4),
+    "usp_primary": ("primary", 5),
+    "products_overview_primary": ("primary", 6),
+    "products_details_primary": ("primary", 7),
+    "ta_specific_primary": ("primary", 8),
+    "company_history_primary": ("primary", 10),
+    "employee_details_primary": ("primary", 11),
+    "org_structure_primary": ("primary", 12),
+    "seasonality_primary": ("primary", 13),
+    "customer_journey_primary": ("primary", 14),
+    "sales_process_primary": ("primary", 15),
+    "sustainability_primary": ("primary", 18),
+    "community_primary": ("primary", 19),
+    "customer_feedback_primary": ("primary", 21),
+    "pricing_strategy_primary": ("primary", 23),
+    "marketing_strategies_primary": ("primary", 24),
+    "loyalty_primary": ("primary", 25),
+    "competetive_advantage_primary": ("primary", 26),
+    "problems_solved_primary": ("primary", 27),
+    "needs_fulfilled_primary": ("primary", 28),
+    "impact_customers_primary": ("primary", 29),
+    "brand_visual_elements": ("primary", 30),
+    "caption_style_primary": ("primary", 31),
+    "caption_examples_primary": ("primary", 32),
+    "key_publicdates_primary": ("primary", 33),
+    "opening_hours_primary": ("primary", 34),
+
+    "values_form": ("questionnaire", 0),
+    "brand_personality_form": ("questionnaire", 1),
+    "brand_voice_form": ("questionnaire", 2),
+    "company_purpose_form": ("questionnaire", 3),
+    "positioning_form": ("questionnaire", 4),
+    "ta_general_form": ("questionnaire", 5),
+    "competitors_general_form": ("questionnaire", 6),
+    "customer_psychographics_form": ("questionnaire", 7),
+    "marketing_budget_form": ("questionnaire", 10),
+    "customer_experience_form": ("questionnaire", 19),
+    "resources_form": ("questionnaire", 20),
+    "contentpillars_form": ("questionnaire", 22),
+    "key_tone_form": ("questionnaire", 23),
+
+    "company_overview_summary": ("summaries", 0),
+    "products_overview_summary": ("summaries", 1),
+    "market_audience_summary": ("summaries", 2),
+    "marketing_summary": ("summaries", 3),
+    "brand_essence_summary": ("summaries", 9),
+    "audience_summary": ("summaries", 10),
+    "content_style_summary": ("summaries", 11),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class BrandProfile:
+    business_name_primary: str = ""
+    industry_primary: str = ""
+    locations_primary: str = ""
+    uvp_primary: str = ""
+    usp_primary: str = ""
+    products_overview_primary: str = ""
+    products_details_primary: str = ""
+    ta_specific_primary: str = ""
+    company_history_primary: str = ""
+    employee_details_primary: str = ""
+    org_structure_primary: str = ""
+    seasonality_primary: str = ""
+    customer_journey_primary: str = ""
+    sales_process_primary: str = ""
+    sustainability_primary: str = ""
+    community_primary: str = ""
+    customer_feedback_primary: str = ""
+    pricing_strategy_primary: str = ""
+    marketing_strategies_primary: str = ""
+    loyalty_primary: str = ""
+    competetive_advantage_primary: str = ""
+    problems_solved_primary: str = ""
+    needs_fulfilled_primary: str = ""
+    impact_customers_primary: str = ""
+    brand_visual_elements: str = ""
+    caption_style_primary: str = ""
+    caption_examples_primary: str = ""
+    key_publicdates_primary: str = ""
+    opening_hours_primary: str = ""
+
+    values_form: str = ""
+    brand_personality_form: str = ""
+    brand_voice_form: str = ""
+    company_purpose_form: str = ""
+    positioning_form: str = ""
+    ta_general_form: str = ""
+    competitors_general_form: str = ""
+    customer_psychographics_form: str = ""
+    marketing_budget_form: str = ""
+    customer_experience_form: str = ""
+    resources_form: str = ""
+    contentpillars_form: str = ""
+    key_tone_form: str = ""
+
+    company_overview_summary: str = ""
+    products_overview_summary: str = ""
+    market_audience_summary: str = ""
+    marketing_summary: str = ""
+    brand_essence_summary: str = ""
+    audience_summary: str = ""
+    content_style_summary: str = ""
+
+
+# The column map and the dataclass must describe the same fields
+assert set(BRAND_COLUMNS) == {field.name for field in fields(BrandProfile)}
+
+
+class BrandSchemaError(Exception):
+    pass
+
+
+
+# Labels (first cell of each mapped row) are pinned the first time a sheet is
+# read. If a later revision moves or renames a row the profile is not built,
+# instead of every field quietly picking up its neighbour's answer.
+def _labels_path(url):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".labels.json")
+
+
+def _read_pinned_labels(url):
+    try:
+        with open(_labels_path(url), "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _pin_labels(url, labels):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = _labels_path(url)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(labels, file, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _mapped_labels(sheet, rows):
+    return {
+        name: rows[row][0].strip()
+        for name, (column_sheet, row) in BRAND_COLUMNS.items()
+        if column_sheet == sheet and row < len(rows)
+    }
+
+
+def _check_schema(sheet, url, rows):
+    needed = [(name, row) for name, (column_sheet, row) in BRAND_COLUMNS.items() if column_sheet == sheet]
+    missing = [f"{name} (row {row + 1})" for name, row in needed if row >= len(rows)]
+    if missing:
+        raise BrandSchemaError(
+            f"The {sheet} brand sheet has {len(rows)} rows but the brand profile expects at least "
+            f"{max(row for _, row in needed) + 1}. Missing: {', '.join(missing)}."
+        )
+
+    labels = _mapped_labels(sheet, rows)
+    pinned = _read_pinned_labels(url)
+    if pinned is None:
+        _pin_labels(url, labels)
+        return
+
+    moved = [
+        f"{name} (row {BRAND_COLUMNS[name][1] + 1}): expected '{pinned[name]}', found '{label}'"
+        for name, label in labels.items()
+        if name in pinned and pinned[name] != label
+    ]
+    if moved:
+        raise BrandSchemaError(
+            f"The layout of the {sheet} brand sheet has changed: " + "; ".join(moved)
+            + ". Update BRAND_COLUMNS, then accept the new layout from Settings."
+        )
+
+
+# Forget the pinned labels so the current sheet layout is accepted on the next build
+# (used after BRAND_COLUMNS has been updated to match a changed sheet)
+def accept_brand_schema():
+    if os.path.isdir(SNAPSHOT_DIR):
+        for name in os.listdir(SNAPSHOT_DIR):
+            if name.endswith(".labels.json"):
+                os.remove(os.path.join(SNAPSHOT_DIR, name))
+    with _lock:
+        _profiles.clear()
+
+
+
+_profiles = {}
+
+
+# Build (or reuse) the brand profile for the current revision of each sheet
+def load_brand_profile(primary_url, questionnaire_url=None, summaries_url=None):
+    sources = {"primary": primary_url, "questionnaire": questionnaire_url, "summaries": summaries_url}
+    entries = {sheet: sheet_rows(url) for sheet, url in sources.items() if url}
+    revision_key = tuple((sheet, entry.url, entry.revision) for sheet, entry in entries.items())
+
+    profile = _profiles.get(revision_key)
+    if profile is not None:
+        return profile
+
+    values = {}
+    for sheet, entry in entries.items():
+        _check_schema(sheet, entry.url, entry.rows)
+        for name, (column_sheet, row) in BRAND_COLUMNS.items():
+            if column_sheet == sheet:
+                cells = entry.rows[row]
+                values[name] = cells[1].strip() if len(cells) > 1 else ""
+
+    profile = BrandProfile(**values)
+    with _lock:
+        # Only the latest revision of each set of sheets is worth keeping
+        for key in [key for key in _profiles if [part[:2] for part in key] == [part[:2] for part in revision_key]]:
+            del _profiles[key]
+        _profiles[revision_key] = profile
+    return profile
+
+
+# Drop everything cached in memory for these sheets (the on-disk snapshots are kept)
+def forget(*urls):
+    urls = {url for url in urls if url}
+    with _lock:
+        for url in urls:
+            _entries.pop(url, None)
+        for key in [key for key in _profiles if any(part[1] in urls for part in key)]:
+            del _profiles[key]
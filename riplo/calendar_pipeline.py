@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import date, datetime
+
+from riplo import duplicates, storage
+from riplo.ideas import parse_post_idea
+from riplo.llm import aget_chatgpt_response, run_async
+from riplo.scheduler import CALENDAR_TIMEZONE, parse_start_date, schedule, schedule_settings
+
+
+
+# Content calendar pipeline.
+#
+# Building a calendar used to be two long serial generations: one to order,
+# date and describe every post as free text, and a second that round-tripped
+# that whole text through the model again just to get JSON. Now the order and
+# dates come from riplo.scheduler, locally and deterministically, and the
+# model only writes the wording: a short description per post, with the
+# description calls running concurrently. Each post is parsed once into its
+# fields, titles come straight from the Title field, and the model only sees
+# the fields it needs.
+#
+# The built calendar is saved per workspace, one event per row keyed by its
+# UID, with a fingerprint of the post it was made from. Building again only
+# describes and schedules the posts that are new or were edited; unchanged
+# posts keep their date, description and UID, so re-importing the calendar
+# updates events instead of shuffling or duplicating them. An edited post
+# keeps the UID of the event it was made from. Changing the schedule settings
+# re-dates every post but still reuses the descriptions. Each event counts its
+# changes in a SEQUENCE number, and an event whose post is taken off the
+# calendar is kept for a while as cancelled, so exports (riplo.ics) can tell
+# calendar apps to update or remove it. A single event can also be moved by
+# hand; it then keeps its new date through later updates until its post is
+# edited.
+
+
+# Model the calendar descriptions are written with (the one the calendar page has always used)
+CALENDAR_MODEL = "gpt-4"
+
+# An edited post at least this similar to an old one keeps the old event's UID
+EDIT_SIMILARITY = 0.3
+
+# Days a cancelled event is kept so later exports still cancel it
+CANCELLED_RETENTION_DAYS = 90
+
+
+# Summarise Post
+description_prompt_template = """
+Summarise the Content Theme, Purpose, and Media info of the following post idea into a super concise "Description" of one sentence.
+
+Your output should only include the description. Do not include any other text preceding or following it.
+
+Post Idea:
+{post}
+"""
+
+
+
+async def describe_post(post_idea, model=CALENDAR_MODEL, bypass_cache=False):
+    return await aget_chatgpt_response(
+        description_prompt_template.format(post=post_idea.excerpt('title', 'idea', 'purpose', 'media')),
+        model=model,
+        bypass_cache=bypass_cache,
+    )
+
+
+# Fingerprint of a post's content (ignoring whitespace changes)
+def post_fingerprint(post):
+    return hashlib.sha1(" ".join(post.split()).encode("utf-8")).hexdigest()
+
+
+def event_uid(workspace, fingerprint):
+    return hashlib.sha1(f"{workspace}:{fingerprint}".encode("utf-8")).hexdigest()[:24] + "@riplo"
+
+
+# The saved calendar entries, in date order (cancelled ones only if asked for)
+def load_calendar(workspace, include_cancelled=False):
+    events = storage.load_namespace(workspace, 'calendar_events').values()
+    events = [event for event in events if include_cancelled or not event.get("cancelled")]
+    return sorted(events, key=lambda event: event["datetime"])
+
+
+# The saved entries dated (in the calendar's timezone) between first_day and last_day, in date order
+def load_calendar_range(workspace, first_day, last_day):
+    rows = storage.get_connection().execute(
+        "SELECT value FROM kv WHERE workspace = ? AND namespace = 'calendar_events' "
+        "AND substr(json_extract(value, '$.datetime'), 1, 10) BETWEEN ? AND ? "
+        "AND NOT IFNULL(json_extract(value, '$.cancelled'), 0)",
+        (workspace, first_day.isoformat(), last_day.isoformat()),
+    )
+    return sorted((json.loads(value) for value, in rows), key=lambda event: event["datetime"])
+
+
+# (first, last) dates of the saved calendar, or None if it has no events
+def calendar_span(workspace):
+    first, last = storage.get_connection().execute(
+        "SELECT MIN(substr(json_extract(value, '$.datetime'), 1, 10)), MAX(substr(json_extract(value, '$.datetime'), 1, 10)) "
+        "FROM kv WHERE workspace = ? AND namespace = 'calendar_events' AND NOT IFNULL(json_extract(value, '$.cancelled'), 0)",
+        (workspace,),
+    ).fetchone()
+    return (date.fromisoformat(first), date.fromisoformat(last)) if first else None
+
+
+# Move one saved event to another day and time, without touching the rest of the calendar.
+# Returns the updated event, or None if there is no such (live) event.
+def reschedule_event(workspace, uid, day, post_time):
+    when = datetime.combine(day, post_time, tzinfo=CALENDAR_TIMEZONE).isoformat()
+    with storage.transaction():
+        event = storage.get_value(workspace, 'calendar_events', uid)
+        if event is None or event.get("cancelled"):
+            return None
+        if event["datetime"] != when:
+            event = dict(event, datetime=when, moved=True, sequence=event.get("sequence", 0) + 1, updated_at=time.time())
+            storage.save_value(workspace, 'calendar_events', uid, event)
+    return event
+
+
+# Match posts (index -> text) to the old events (uid -> event) they were most likely edited from
+def _match_edits(posts, events):
+    event_signatures = {uid: duplicates.signature(event["post"]) for uid, event in events.items()}
+    matches = {}
+    for post_index, post in posts.items():
+        signature = duplicates.signature(post)
+        scored = [
+            (duplicates.similarity(signature, event_signature), uid)
+            for uid, event_signature in event_signatures.items()
+            if uid not in matches.values() and event_signature is not None and signature is not None
+        ]
+        score, uid = max(scored, default=(0.0, None))
+        if uid is not None and score >= EDIT_SIMILARITY:
+            matches[post_index] = uid
+    return matches
+
+
+async def update_calendar_async(
+    workspace, posts, start_text, frequency_text, times_text="", opening_hours="", key_dates_text="",
+    model=CALENDAR_MODEL, bypass_cache=False,
+):
+    post_ideas = [parse_post_idea(post) for post in posts if post and post.strip()]
+    fingerprints = [post_fingerprint(post_idea.text) for post_idea in post_ideas]
+
+    # An empty or year-less start date is resolved against today; the calendar keeps the date it got
+    # when first built (until the start text changes), so its settings don't change from one day to the next
+    saved_start = storage.get_value(workspace, 'calendar', 'start')
+    if saved_start is not None and saved_start["text"] == start_text and not bypass_cache:
+        start_date = date.fromisoformat(saved_start["date"])
+    else:
+        start_date = parse_start_date(start_text)
+    settings = schedule_settings(start_text, frequency_text, times_text, opening_hours, key_dates_text, start_date)
+    same_settings = storage.get_value(workspace, 'calendar', 'settings') == settings and not bypass_cache
+
+    # Unchanged posts keep their event; edited posts keep the UID of the event they came from
+    # (a post put back on the calendar gets its cancelled event back)
+    previous = {event["uid"]: event for event in load_calendar(workspace, include_cancelled=True)}
+    by_fingerprint = {event["fingerprint"]: event["uid"] for event in previous.values()}
+    matched = {i: by_fingerprint[fingerprint] for i, fingerprint in enumerate(fingerprints) if fingerprint in by_fingerprint}
+    matched.update(_match_edits(
+        {i: post_idea.text for i, post_idea in enumerate(post_ideas) if i not in matched},
+        {uid: event for uid, event in previous.items() if uid not in matched.values() and not event.get("cancelled")},
+    ))
+    unchanged = set() if bypass_cache else {
+        i for i, uid in matched.items() if previous[uid]["fingerprint"] == fingerprints[i] and not previous[uid].get("cancelled")
+    }
+
+    # Only new and edited posts are described, and scheduled around the others (unless the settings changed;
+    # posts moved by hand stay where they were put either way)
+    to_describe = [i for i in range(len(post_ideas)) if i not in unchanged]
+    descriptions = await asyncio.gather(*(describe_post(post_ideas[i], model, bypass_cache) for i in to_describe))
+    descriptions = dict(zip(to_describe, descriptions))
+    fixed = {
+        i: datetime.fromisoformat(previous[matched[i]]["datetime"])
+        for i in unchanged if same_settings or previous[matched[i]].get("moved")
+    }
+    slots = schedule(
+        post_ideas, start_text, frequency_text, times_text, opening_hours, key_dates_text, fixed=fixed, start_date=start_date,
+    )
+
+    now = time.time()
+    events = []
+    for index, when in slots:
+        old = previous.get(matched.get(index))
+        event = {
+            "uid": old["uid"] if old else event_uid(workspace, fingerprints[index]),
+            "fingerprint": fingerprints[index],
+            "title": post_ideas[index].display_title[:80],
+            "description": old["description"] if index in unchanged else descriptions[index],
+            "datetime": when.isoformat(),
+            "post": post_ideas[index].text,
+            "created_at": old["created_at"] if old else now,
+            "updated_at": now,
+            "sequence": 0,
+            "cancelled": False,
+            "moved": index in fixed and old.get("moved", False),
+        }
+        if old is None:
+            event["status"] = "added"
+        elif not old.get("cancelled") and all(event[key] == old[key] for key in ("title", "description", "datetime", "post")):
+            event["status"] = "unchanged"
+            event["updated_at"] = old["updated_at"]
+            event["sequence"] = old.get("sequence", 0)
+        else:
+            event["status"] = "updated"
+            event["sequence"] = old.get("sequence", 0) + 1
+        events.append(event)
+
+    # Two copies of the same post would share a UID; give the later ones their own
+    used_uids = set()
+    for event in events:
+        while event["uid"] in used_uids:
+            event["uid"] = event_uid(workspace, event["uid"])
+        used_uids.add(event["uid"])
+
+    # Events whose post is gone are cancelled, and forgotten once they have been cancelled long enough
+    removed = [event for uid, event in previous.items() if uid not in used_uids and not event.get("cancelled")]
+    cancelled = {
+        event["uid"]: dict(event, cancelled=True, sequence=event.get("sequence", 0) + 1, updated_at=now) for event in removed
+    }
+    expired = [
+        uid for uid, event in previous.items()
+        if uid not in used_uids and event.get("cancelled") and now - event["updated_at"] > CANCELLED_RETENTION_DAYS * 86400
+    ]
+
+    # Save only the events that changed
+    with storage.transaction():
+        for uid in expired:
+            storage.delete_value(workspace, 'calendar_events', uid)
+        storage.save_values(
+            workspace, 'calendar_events',
+            {event["uid"]: {k: v for k, v in event.items() if k != "status"} for event in events} | cancelled,
+        )
+        storage.save_value(workspace, 'calendar', 'settings', settings)
+        storage.save_value(workspace, 'calendar', 'start', {"text": start_text, "date": start_date.isoformat()})
+
+    changes = {status: sum(1 for event in events if event["status"] == status) for status in ("unchanged", "updated", "added")}
+    changes["removed"] = len(removed)
+    return events, changes
+
+
+# Update the saved calendar for the given posts, describing and scheduling only what changed.
+# Returns the entries in date order and counts of unchanged/updated/added/removed events.
+def update_calendar(
+    workspace, posts, start_text, frequency_text, times_text="", opening_hours="", key_dates_text="",
+    model=CALENDAR_MODEL, bypass_cache=False,
+):
+    return run_async(update_calendar_async(
+        workspace, posts, start_text, frequency_text, times_text, opening_hours, key_dates_text, model, bypass_cache
+    ))
+
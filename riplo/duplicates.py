@@ -0,0 +1,159 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+from riplo import storage
+from riplo.ideas import FIELD_PATTERN
+
+
+
+# Near-duplicate detection for post ideas.
+#
+# Each idea gets a MinHash signature over its word 3-grams (field labels like
+# "Title:" are ignored, as every idea has them). Signatures are split into LSH
+# bands and the band hashes are indexed, so checking a new idea against the
+# whole vault is a fixed number of indexed lookups plus a comparison against the
+# few candidates that share a band, however large the vault is. riplo.vault
+# keeps the index up to date alongside the search index. The titles of recent
+# ideas are also passed to idea generation so the model doesn't spend tokens
+# suggesting them again.
+
+
+# Estimated Jaccard similarity at or above which two ideas count as duplicates
+DUPLICATE_THRESHOLD = float(os.getenv("RIPLO_DUPLICATE_THRESHOLD", "0.8"))
+
+# How many existing idea titles to pass to idea generation as "avoid these"
+AVOID_HINTS = int(os.getenv("RIPLO_AVOID_HINTS", "30"))
+
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS_PER_BAND = SIGNATURE_SIZE // BANDS
+
+_PRIME = (1 << 61) - 1
+_random = np.random.RandomState(20241)
+_A = _random.randint(1, 2 ** 31, size=SIGNATURE_SIZE).astype(np.uint64)
+_B = _random.randint(0, 2 ** 31, size=SIGNATURE_SIZE).astype(np.uint64)
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+_indexed_workspaces = set()
+
+
+
+def _shingles(text):
+    words = _WORD_PATTERN.findall(FIELD_PATTERN.sub("", text).lower())
+    if len(words) < 3:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+# MinHash signature of an idea, or None if it has no words
+def signature(text):
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+    hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+# Estimated Jaccard similarity of two ideas' word 3-grams
+def similarity(a, b):
+    signature_a = a if isinstance(a, np.ndarray) else signature(a)
+    signature_b = b if isinstance(b, np.ndarray) else signature(b)
+    if signature_a is None or signature_b is None:
+        return 0.0
+    return float(np.mean(signature_a == signature_b))
+
+
+def _band_keys(sig):
+    rows = sig.reshape(BANDS, ROWS_PER_BAND)
+    return [(band << 32) | zlib.crc32(rows[band].tobytes()) for band in range(BANDS)]
+
+
+
+# Add or replace one idea in the index (called by riplo.vault inside its transaction)
+def index_entry(workspace, entry_id, text):
+    conn = storage.get_connection()
+    remove_entry(entry_id)
+    sig = signature(text)
+    if sig is None:
+        return
+    conn.execute(
+        "INSERT INTO vault_signatures (id, workspace, signature) VALUES (?, ?, ?)", (entry_id, workspace, sig.tobytes())
+    )
+    conn.executemany(
+        "INSERT INTO vault_lsh (workspace, key, id) VALUES (?, ?, ?)", [(workspace, key, entry_id) for key in _band_keys(sig)]
+    )
+
+
+def remove_entry(entry_id):
+    conn = storage.get_connection()
+    conn.execute("DELETE FROM vault_signatures WHERE id = ?", (entry_id,))
+    conn.execute("DELETE FROM vault_lsh WHERE id = ?", (entry_id,))
+
+
+def remove_workspace(workspace):
+    conn = storage.get_connection()
+    conn.execute("DELETE FROM vault_signatures WHERE workspace = ?", (workspace,))
+    conn.execute("DELETE FROM vault_lsh WHERE workspace = ?", (workspace,))
+
+
+# Index any ideas saved before the duplicate index existed (once per workspace per process)
+def ensure_indexed(workspace):
+    if workspace in _indexed_workspaces:
+        return
+    missing = storage.get_connection().execute(
+        "SELECT v.id, v.text FROM vault v LEFT JOIN vault_signatures s ON s.id = v.id "
+        "WHERE v.workspace = ? AND s.id IS NULL", (workspace,)
+    ).fetchall()
+    with storage.transaction():
+        for entry_id, text in missing:
+            index_entry(workspace, entry_id, text)
+    _indexed_workspaces.add(workspace)
+
+
+
+# (entry_id, similarity) of the closest vault idea at or above the threshold, or None
+def find_duplicate(workspace, text, threshold=DUPLICATE_THRESHOLD, exclude=()):
+    sig = signature(text)
+    if sig is None:
+        return None
+    ensure_indexed(workspace)
+    keys = _band_keys(sig)
+    conn = storage.get_connection()
+    candidates = conn.execute(
+        f"SELECT DISTINCT s.id, s.signature FROM vault_lsh l JOIN vault_signatures s ON s.id = l.id "
+        f"WHERE l.workspace = ? AND l.key IN ({', '.join('?' * len(keys))})",
+        (workspace, *keys),
+    ).fetchall()
+
+    best = None
+    for entry_id, blob in candidates:
+        if entry_id in exclude:
+            continue
+        score = similarity(sig, np.frombuffer(blob, dtype=np.uint32))
+        if score >= threshold and (best is None or score > best[1]):
+            best = (entry_id, score)
+    return best
+
+
+# Index of the first text in `texts` that duplicates `text`, or None (for small lists like the calendar)
+def find_duplicate_in(texts, text, threshold=DUPLICATE_THRESHOLD):
+    sig = signature(text)
+    if sig is None:
+        return None
+    for i, other in enumerate(texts):
+        if other and similarity(sig, other) >= threshold:
+            return i
+    return None
+
+
+# Titles of the most recent vault ideas, for the idea prompt's "avoid these" list
+def avoid_hints(workspace, limit=AVOID_HINTS):
+    rows = storage.get_connection().execute(
+        "SELECT json_extract(fields, '$.title') FROM vault WHERE workspace = ? ORDER BY id DESC LIMIT ?", (workspace, limit)
+    )
+    return list(dict.fromkeys(title for title, in rows if title))
@@ -0,0 +1,227 @@
+import hashlib
+import hmac
+import os
+import secrets
+import shutil
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from riplo import ics, storage
+from riplo.calendar_pipeline import load_calendar
+from riplo.post_builder import export_path
+
+
+
+# Subscribable calendar feed.
+#
+# A small HTTP server runs alongside the Streamlit app (in a daemon thread,
+# started once per process by the first page load) and serves each
+# workspace's saved calendar at
+#
+#   http://<host>:RIPLO_FEED_PORT/calendar/<workspace>/<token>.ics
+#
+# The token is a random secret per workspace, so only people given the link
+# can subscribe. The .ics body is built once per calendar change and kept in
+# memory; each request only runs two small indexed queries (the token and the
+# calendar's version), and clients that send back the ETag get a bodiless 304.
+#
+# The same server hands out the zips of built posts saved by the Post Builder
+# (/exports/<name>.zip), streaming them from disk so a long calendar's zip is
+# never held in memory. It can also run on its own:
+#
+#   python -m riplo.feed
+#
+# The app only shows feed and export links once RIPLO_FEED_URL gives the
+# server's public address and the server is running in the app's process.
+# Hosts that route a single port to the app (like the Procfile's web
+# process) need that address set up for the feed port first, e.g. behind a
+# proxy; until then the links are left out rather than pointing nowhere.
+
+
+# Set RIPLO_FEED_PORT=0 to turn the feed off
+FEED_PORT = int(os.getenv("RIPLO_FEED_PORT", "8502"))
+FEED_HOST = os.getenv("RIPLO_FEED_HOST", "0.0.0.0")
+
+# Public address of the feed server, for the links shown in the app (no links without it)
+FEED_URL = os.getenv("RIPLO_FEED_URL", "").rstrip("/")
+
+# How long clients may reuse a feed before asking again
+FEED_MAX_AGE = 300
+
+
+_cache = {}    # workspace -> (version, etag, body)
+_cache_lock = threading.Lock()
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+
+# The workspace's feed token, created the first time it is asked for
+def feed_token(workspace):
+    token = storage.get_value(workspace, 'calendar', 'feed_token')
+    if token is None:
+        with storage.transaction():
+            token = storage.get_value(workspace, 'calendar', 'feed_token')
+            if token is None:
+                token = secrets.token_urlsafe(24)
+                storage.save_value(workspace, 'calendar', 'feed_token', token)
+    return token
+
+
+# Replace the token, so the old link stops working
+def reset_feed_token(workspace):
+    storage.save_value(workspace, 'calendar', 'feed_token', secrets.token_urlsafe(24))
+
+
+def feed_url(workspace):
+    return f"{FEED_URL}/calendar/{workspace}/{feed_token(workspace)}.ics"
+
+
+def export_url(name):
+    return f"{FEED_URL}/exports/{name}"
+
+
+# Whether feed and export links can be shown: the server is up in this process and has a public address
+def feed_available():
+    return bool(FEED_URL) and _server is not None
+
+
+# Cheap stamp that changes whenever any of the workspace's calendar events is saved or deleted,
+# or the workspace is renamed (the name is the feed's calendar name); the name comes last
+def _calendar_version(workspace):
+    return storage.get_connection().execute(
+        "SELECT COUNT(*), MAX(updated_at), TOTAL(length(value)), "
+        "(SELECT name FROM workspaces WHERE id = ?) FROM kv WHERE workspace = ? AND namespace = 'calendar_events'",
+        (workspace, workspace),
+    ).fetchone()
+
+
+# (etag, body) of the workspace's feed, rebuilt only when the calendar or its name has changed
+def cached_feed(workspace):
+    version = _calendar_version(workspace)
+    with _cache_lock:
+        cached = _cache.get(workspace)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    body = ics.to_ics(load_calendar(workspace, include_cancelled=True), name=version[-1] or "")
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    with _cache_lock:
+        _cache[workspace] = (version, etag, body)
+    return etag, body
+
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    server_version = "RiploFeed/1.0"
+
+    # /calendar/<workspace>/<token>.ics -> workspace, or None if the path or token is wrong
+    def _workspace(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "calendar" or not parts[2].endswith(".ics"):
+            return None
+        workspace, token = unquote(parts[1]), unquote(parts[2][:-len(".ics")])
+        stored = storage.get_value(workspace, 'calendar', 'feed_token')
+        if stored is None or not hmac.compare_digest(stored, token):
+            return None
+        return workspace
+
+    def _respond(self, send_body):
+        workspace = self._workspace()
+        if workspace is None:
+            self.send_error(404)
+            return
+
+        etag, body = cached_feed(workspace)
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"private, max-age={FEED_MAX_AGE}")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/calendar; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"private, max-age={FEED_MAX_AGE}")
+        self.send_header("Date", formatdate(usegmt=True))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    # /exports/<name>.zip, streamed from disk
+    def _respond_export(self, send_body):
+        path = export_path(unquote(self.path.split("?")[0][len("/exports/"):]))
+        if path is None:
+            self.send_error(404)
+            return
+        with open(path, "rb") as file:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(os.fstat(file.fileno()).st_size))
+            self.send_header("Content-Disposition", 'attachment; filename="posts.zip"')
+            self.send_header("Cache-Control", "private, no-store")
+            self.end_headers()
+            if send_body:
+                shutil.copyfileobj(file, self.wfile, 64 * 1024)
+
+    def do_GET(self):
+        if self.path.startswith("/exports/"):
+            self._respond_export(send_body=True)
+        else:
+            self._respond(send_body=True)
+
+    def do_HEAD(self):
+        if self.path.startswith("/exports/"):
+            self._respond_export(send_body=False)
+        else:
+            self._respond(send_body=False)
+
+    # Calendar clients poll often; don't print a line per request
+    def log_message(self, format, *args):
+        pass
+
+
+
+# Start the feed server in a daemon thread (once per process; quietly skipped if the port is taken)
+def start_feed_server(host=FEED_HOST, port=FEED_PORT):
+    global _server, _server_started
+    if not port:
+        return None
+    with _server_lock:
+        if _server_started:
+            return _server
+        _server_started = True
+        try:
+            _server = ThreadingHTTPServer((host, port), FeedHandler)
+        except OSError:
+            # Another app process (or `python -m riplo.feed`) is already serving the port
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="riplo-feed", daemon=True).start()
+        return _server
+
+
+def main():
+    server = start_feed_server()
+    if server is None:
+        print(f"Couldn't serve calendar feeds on {FEED_HOST}:{FEED_PORT} (port in use, or RIPLO_FEED_PORT=0)")
+        return 1
+    print(f"Serving calendar feeds on {FEED_HOST}:{FEED_PORT}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
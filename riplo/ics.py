@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+from icalendar import Calendar, Event
+
+
+
+# iCalendar (.ics) export of a saved content calendar (see riplo.calendar_pipeline).
+#
+# Every event keeps the UID it was given when its post was first scheduled,
+# plus a SEQUENCE that goes up each time the event changes and a LAST-MODIFIED
+# time, so importing or subscribing again updates events in place instead of
+# duplicating them. Posts taken off the calendar are exported as cancelled
+# events. The file is produced one event at a time by iter_ics, with no limit
+# on the number of events; pass `since` to export only the events that
+# changed after a given time.
+
+
+PRODID = "-//Riplo//Content Calendar//EN"
+
+_FOOTER = b"END:VCALENDAR\r\n"
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def _event(entry, stamp):
+    event = Event()
+    event.add('uid', entry['uid'])
+    event.add('dtstamp', stamp)
+    event.add('dtstart', datetime.fromisoformat(entry['datetime']).astimezone(timezone.utc))
+    event.add('summary', entry['title'])
+    event.add('description', entry['description'])
+    event.add('sequence', entry.get('sequence', 0))
+    event.add('created', _utc(entry['created_at']))
+    event.add('last-modified', _utc(entry['updated_at']))
+    event.add('status', 'CANCELLED' if entry.get('cancelled') else 'CONFIRMED')
+    return event.to_ical()
+
+
+# The calendar as .ics chunks (bytes); with `since`, only events changed after that time
+def iter_ics(entries, name="", since=None):
+    stamp = datetime.now(timezone.utc)
+    header = Calendar()
+    header.add('prodid', PRODID)
+    header.add('version', '2.0')
+    header.add('calscale', 'GREGORIAN')
+    header.add('method', 'PUBLISH')
+    if name:
+        header.add('x-wr-calname', name)
+    yield header.to_ical().replace(_FOOTER, b"")
+    for entry in entries:
+        if since is None or entry['updated_at'] > since:
+            yield _event(entry, stamp)
+    yield _FOOTER
+
+
+def to_ics(entries, name="", since=None):
+    return b"".join(iter_ics(entries, name, since))
+
+
+# How many events a delta export since `since` would contain
+def count_changes(entries, since):
+    return sum(1 for entry in entries if entry['updated_at'] > since)
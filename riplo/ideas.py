@@ -0,0 +1,242 @@
+import json
+import re
+from dataclasses import asdict, dataclass, fields
+
+from riplo.brand_context import INPUT_TOKENS, relevant_brand_context, truncate_tokens
+
+
+
+# Post idea generation: the prompt, and parsing of the "Post N" blocks the
+# model answers with. IdeaStreamParser does the same parsing on a streamed
+# response, handing back each post as soon as the next "Post N" header (or the
+# end of the stream) shows it is complete.
+#
+# A post idea is parsed once into a PostIdea record (Title, Idea, Purpose and
+# so on as separate fields) when it is saved, and the vault stores the fields
+# next to the raw text, so the vault, search, calendar and Post Builder read
+# fields directly instead of each re-parsing the text.
+
+
+IDEA_COUNT = 10
+
+POST_PATTERN = re.compile(r'Post \d+\n\n(.*?)(?=Post \d+|\Z)', re.DOTALL)
+POST_HEADER_PATTERN = re.compile(r'Post \d+\n\n')
+POST_END_PATTERN = re.compile(r'Post \d+')
+
+# One pass over an idea finds every field label; a field runs until the next label.
+# Labels start a line or follow a semicolon ("Idea: ...; Call-to-Action: ..."), and the
+# usual model drift is tolerated: "Call to Action", "**Title:**", odd capitalisation.
+FIELD_PATTERN = re.compile(
+    r'(?:^|(?<=;))[ \t]*\**[ \t]*(Title|Idea|Call[- ]to[- ]Action|Creative Focus|Date ?/ ?Event|Purpose|Media)[ \t]*\**:\**[ \t]*',
+    re.MULTILINE | re.IGNORECASE,
+)
+
+# Field label (lower case, spaces and punctuation removed) -> PostIdea attribute
+FIELD_NAMES = {
+    "title": "title",
+    "idea": "idea",
+    "calltoaction": "call_to_action",
+    "creativefocus": "creative_focus",
+    "dateevent": "date_event",
+    "purpose": "purpose",
+    "media": "media",
+}
+
+# How each field is labelled when an idea is written back out as text
+FIELD_LABELS = {
+    "title": "Title",
+    "idea": "Idea",
+    "call_to_action": "Call-to-Action",
+    "creative_focus": "Creative Focus",
+    "date_event": "Date/Event",
+    "purpose": "Purpose",
+    "media": "Media",
+}
+
+# Placeholder answers the model gives for a field that doesn't apply
+_EMPTY_VALUES = frozenset({"", "n/a", "na", "none", "-"})
+
+
+# Generate Ideas
+idea_prompt_template = """
+Your Job: Generate {idea_count} social media post ideas for {business_name}, using the brand profile above.
+{relevant_section}
+
+Content Goals: {input_goals}
+Key Upcoming Dates/Events: {input_keydates}
+Media Available: {input_media}
+Past Successes: {past_successes}
+Partnerships: {partnerships}
+{avoid_section}
+The Output:
+
+Start each post idea with its number on its own line, followed by a blank line, like so:
+
+Post 1
+
+Title: [TITLE]
+
+Idea: [ONE OR TWO SENTENCES DESCRIBING THE IDEA]
+
+Call-to-Action: [CALL TO ACTION]
+
+Creative Focus: [Visual-Focused OR Concept-Focused]
+
+Date/Event: [ONLY IF THE IDEA IS TIED TO A DATE OR EVENT]
+
+Purpose: [EG. Increase Foot Traffic, Drive Engagement, Promote Awareness, Build Community]
+
+Media: [A DESCRIPTION OF THE PHOTO, GRAPHIC OR VIDEO FOR THE POST]
+
+Do not use any formatting such as bold text, bullet points, or numbering lists.
+"""
+
+
+
+# More About The Brand
+relevant_section_template = """
+More About The Brand:
+{brand_context}
+"""
+
+
+
+# Ideas We Already Have
+avoid_section_template = """
+Ideas We Already Have (do not repeat these or close variations of them):
+{titles}
+"""
+
+
+
+# The request part of the idea prompt; send it with prefix=brand_prefix(brand) (see riplo.brand_context).
+# Brand sections relevant to the goals and key dates that the profile left out are added here,
+# and each user input is capped at INPUT_TOKENS.
+def build_idea_prompt(brand, inputs, idea_count=IDEA_COUNT, avoid=()):
+    user_inputs = {
+        name: truncate_tokens(inputs.get(key, ''), INPUT_TOKENS)
+        for name, key in (
+            ("input_goals", 'input_goals'),
+            ("input_keydates", 'input_keydates'),
+            ("input_media", 'input_media'),
+            ("past_successes", 'userinputsummary_pastsuccesses'),
+            ("partnerships", 'userinputsummary_partnerships'),
+        )
+    }
+    query = f"{user_inputs['input_goals']}\n{user_inputs['input_keydates']}"
+    brand_context = relevant_brand_context(brand, query)
+    relevant_section = relevant_section_template.format(brand_context=brand_context) if brand_context else ""
+    avoid_section = avoid_section_template.format(titles="\n".join(f"- {title}" for title in avoid)) if avoid else ""
+    return idea_prompt_template.format(
+        avoid_section=avoid_section,
+        idea_count=idea_count,
+        business_name=truncate_tokens(brand.business_name_primary, INPUT_TOKENS),
+        relevant_section=relevant_section,
+        **user_inputs,
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class PostIdea:
+    text: str = ""
+    title: str = ""
+    idea: str = ""
+    call_to_action: str = ""
+    creative_focus: str = ""
+    date_event: str = ""
+    purpose: str = ""
+    media: str = ""
+
+    # Title for display, falling back to the first line of unstructured text
+    @property
+    def display_title(self):
+        if self.title:
+            return self.title
+        return self.text.strip().split("\n")[0][:60] or "Post"
+
+    @property
+    def is_structured(self):
+        return any(getattr(self, name) for name in FIELD_LABELS)
+
+    # "Label: value" lines for the given fields, or the raw text if the idea has no fields
+    def excerpt(self, *names):
+        if not self.is_structured:
+            return self.text.strip()
+        return "\n".join(f"{FIELD_LABELS[name]}: {getattr(self, name)}" for name in names if getattr(self, name))
+
+    # The parsed fields as JSON, for storing next to the raw text
+    def fields_json(self):
+        return json.dumps({name: value for name, value in asdict(self).items() if name != "text" and value})
+
+    @classmethod
+    def from_fields_json(cls, text, fields_json):
+        if fields_json is None:
+            return parse_post_idea(text)
+        return cls(text=text, **json.loads(fields_json))
+
+
+# The JSON field names stored for a PostIdea
+assert set(FIELD_LABELS) == {field.name for field in fields(PostIdea)} - {"text"}
+
+
+# Parse an idea's labelled fields into a PostIdea; unlabelled text is kept only in `text`
+def parse_post_idea(text):
+    values = {}
+    matches = list(FIELD_PATTERN.finditer(text))
+    for match, following in zip(matches, matches[1:] + [None]):
+        name = FIELD_NAMES[re.sub(r'[^a-z]', '', match.group(1).lower())]
+        value = text[match.end():following.start() if following else len(text)].strip().rstrip(";").strip()
+        if name == "title":
+            value = value.split("\n")[0].strip()
+        if name not in values and value.lower() not in _EMPTY_VALUES:
+            values[name] = value
+    return PostIdea(text=text, **values)
+
+
+# Extract individual post ideas as {'postidea_N': ..., 'posttitle_N': ...}
+def extract_post_outputs(response_text):
+    outputs = {}
+    for i, match in enumerate(POST_PATTERN.findall(response_text), start=1):
+        post_idea = parse_post_idea(match.strip())
+        outputs[f'postidea_{i}'] = post_idea.text
+        outputs[f'posttitle_{i}'] = post_idea.title or 'None'
+    return outputs
+
+
+
+class IdeaStreamParser:
+    # Feed streamed text in; get back (number, post, title) for each post once it is complete
+
+    def __init__(self):
+        self.text = ""
+        self.emitted = 0
+
+    def _complete_posts(self, final):
+        headers = list(POST_HEADER_PATTERN.finditer(self.text))
+        # A post is complete once the next header has arrived (or the stream has ended)
+        complete = len(headers) if final else len(headers) - 1
+        posts = []
+        while self.emitted < complete:
+            header = headers[self.emitted]
+            end = headers[self.emitted + 1].start() if self.emitted + 1 < len(headers) else len(self.text)
+            post = self.text[header.end():end]
+            # Match extract_post_outputs, which ends a post at any "Post N"
+            cut = POST_END_PATTERN.search(post)
+            post = (post[:cut.start()] if cut else post).strip()
+            self.emitted += 1
+            posts.append((self.emitted, post, parse_post_idea(post).title or 'None'))
+        return posts
+
+    def feed(self, text):
+        self.text += text
+        return self._complete_posts(final=False)
+
+    def close(self):
+        return self._complete_posts(final=True)
+
+    # The post currently being written, if any
+    def partial(self):
+        headers = list(POST_HEADER_PATTERN.finditer(self.text))
+        if len(headers) <= self.emitted:
+            return ""
+        return self.text[headers[self.emitted].end():]
@@ -0,0 +1,327 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from riplo import autosave, duplicates, storage
+from riplo.brand_context import brand_prefix
+from riplo.calendar_pipeline import load_calendar, update_calendar
+from riplo.ideas import build_idea_prompt, extract_post_outputs
+from riplo.llm import get_chatgpt_response, stream_chatgpt_response
+from riplo.post_builder import build_post, build_posts_zip, new_export
+from riplo.workspaces import get_workspace
+
+
+
+# Background jobs for the model calls behind the app's buttons.
+#
+# A page submits a job (a kind plus JSON parameters) and returns straight
+# away; worker threads started once per process pick jobs up in order and
+# run them, saving their results themselves, so navigating away, another
+# widget interaction or a closed tab no longer throws away a generation
+# half way through. Job state (queued, running, done or failed), progress
+# and results are kept in the app database, and pages poll them (see
+# riplo.session.job_progress). Jobs can also be run by separate worker
+# processes:
+#
+#   python -m riplo.jobs
+#
+# Workers claim a job inside an IMMEDIATE transaction, so each job runs once
+# however many threads and processes are working. Jobs left running by a
+# process that has gone away are queued again when the next one starts.
+
+
+# Worker threads per app process (0 leaves the jobs to `python -m riplo.jobs`)
+JOB_WORKERS = int(os.getenv("RIPLO_JOB_WORKERS", "4"))
+
+# How often (seconds) idle workers look for jobs submitted by other processes
+JOB_POLL_INTERVAL = 1.0
+
+# Progress is written at most this often (seconds)
+PROGRESS_INTERVAL = 0.5
+
+# Finished jobs are kept this long
+JOB_RETENTION_DAYS = 7
+
+# Tries at marking a job failed when its worker hits an error (a second apart)
+FAIL_ATTEMPTS = 30
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+_wakeup = threading.Condition()
+_workers = []
+_workers_lock = threading.Lock()
+
+_COLUMNS = (
+    "id", "workspace", "kind", "params", "status", "progress", "result", "error",
+    "worker", "created_at", "started_at", "finished_at", "updated_at",
+)
+_JSON_COLUMNS = ("params", "progress", "result")
+
+
+
+def _row_to_job(row):
+    job = dict(zip(_COLUMNS, row))
+    for column in _JSON_COLUMNS:
+        job[column] = json.loads(job[column]) if job[column] is not None else None
+    return job
+
+
+def get_job(job_id):
+    if job_id is None:
+        return None
+    row = storage.get_connection().execute(
+        f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    return _row_to_job(row) if row else None
+
+
+# The workspace's most recent queued or running job of a kind, if any
+def active_job(workspace, kind):
+    row = storage.get_connection().execute(
+        f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE workspace = ? AND kind = ? AND status IN ('queued', 'running') "
+        "ORDER BY id DESC LIMIT 1",
+        (workspace, kind),
+    ).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def is_active(job):
+    return job is not None and job["status"] in ACTIVE_STATUSES
+
+
+# Queue a job and return its id. While the workspace already has a job of the
+# same kind queued or running, that job's id is returned instead of starting another.
+def submit(workspace, kind, params):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    with storage.transaction() as conn:
+        existing = active_job(workspace, kind)
+        if existing is not None:
+            return existing["id"]
+        now = time.time()
+        job_id = conn.execute(
+            "INSERT INTO jobs (workspace, kind, params, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (workspace, kind, json.dumps(params), now, now),
+        ).lastrowid
+    with _wakeup:
+        _wakeup.notify()
+    return job_id
+
+
+
+# Take the oldest queued job, returning its id (or None)
+def _claim(worker):
+    with storage.transaction() as conn:
+        row = conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, updated_at = ? WHERE id = ?",
+            (worker, now, now, row[0]),
+        )
+    return row[0]
+
+
+# `result` is the job's result already encoded as JSON
+def _finish(job_id, status, result=None, error=None):
+    now = time.time()
+    storage.get_connection().execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+        (status, result, error, now, now, job_id),
+    )
+
+
+# A progress callback for a job: report(progress) saves it, at most every PROGRESS_INTERVAL seconds
+def _reporter(job_id):
+    last_saved = [0.0]
+
+    def report(progress, force=False):
+        now = time.monotonic()
+        if force or now - last_saved[0] >= PROGRESS_INTERVAL:
+            last_saved[0] = now
+            storage.get_connection().execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?", (json.dumps(progress), time.time(), job_id)
+            )
+
+    return report
+
+
+# Run a job and record how it ended (a result that can't be saved as JSON fails the job)
+def run_job(job):
+    try:
+        result = json.dumps(JOB_HANDLERS[job["kind"]](job["workspace"], job["params"], _reporter(job["id"])))
+    except Exception as e:
+        _finish(job["id"], "failed", error=str(e) or type(e).__name__)
+    else:
+        _finish(job["id"], "done", result=result)
+
+
+# Mark a job failed after its worker hit an error, retrying while the database is busy.
+# The job is otherwise left running under a live worker, where recover_jobs wouldn't requeue it.
+def _fail_job(job_id, error):
+    for attempt in range(FAIL_ATTEMPTS):
+        try:
+            _finish(job_id, "failed", error=str(error) or type(error).__name__)
+            return
+        except Exception as e:
+            print(f"Couldn't mark job {job_id} failed: {e}", file=sys.stderr)
+            time.sleep(JOB_POLL_INTERVAL)
+
+
+# A worker's loop: an error taking, running or finishing a job fails that job, never the worker
+def _work(worker, stop=None):
+    while stop is None or not stop.is_set():
+        job_id = None
+        try:
+            job_id = _claim(worker)
+            if job_id is None:
+                with _wakeup:
+                    _wakeup.wait(JOB_POLL_INTERVAL)
+                continue
+            run_job(get_job(job_id))
+        except Exception as e:
+            print(f"Job worker {worker} failed{f' on job {job_id}' if job_id else ''}: {e!r}", file=sys.stderr)
+            if job_id is not None:
+                _fail_job(job_id, e)
+            time.sleep(JOB_POLL_INTERVAL)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Queue again the jobs left running by processes that have gone away, and forget old finished jobs
+def recover_jobs():
+    conn = storage.get_connection()
+    with storage.transaction():
+        for job_id, worker in conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall():
+            pid = int(worker.split(":")[0]) if worker else 0
+            if pid != os.getpid() and not _process_alive(pid):
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, progress = NULL, updated_at = ? WHERE id = ?",
+                    (time.time(), job_id),
+                )
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - JOB_RETENTION_DAYS * 86400,),
+        )
+
+
+# Start this process's worker threads (once; later calls do nothing)
+def start_workers(count=JOB_WORKERS):
+    with _workers_lock:
+        if _workers or not count:
+            return
+        recover_jobs()
+        for number in range(count):
+            thread = threading.Thread(
+                target=_work, args=(f"{os.getpid()}:{number}",), name=f"riplo-job-{number}", daemon=True
+            )
+            thread.start()
+            _workers.append(thread)
+
+
+
+# Job handlers: (workspace, params, report) -> JSON result. Each saves what it
+# produces itself, so the work is kept even if nobody is watching when it ends.
+
+# params: inputs (the idea generator's saved inputs)
+def _generate_ideas(workspace, params, report):
+    brand = get_workspace(workspace).brand_profile()
+    prompt = build_idea_prompt(brand, params["inputs"], avoid=duplicates.avoid_hints(workspace))
+    response_text = ""
+    # Asking again is how a user gets a different set, so never replay a cached answer
+    for chunk in stream_chatgpt_response(prompt, prefix=brand_prefix(brand), bypass_cache=True):
+        response_text += chunk
+        report({"text": response_text})
+    outputs = extract_post_outputs(response_text)
+
+    # Replace the previous ideas with the new set
+    autosave.flush()
+    with storage.transaction():
+        for key in storage.load_namespace(workspace, 'outputs'):
+            if key.startswith('postidea_') or key.startswith('posttitle_'):
+                storage.delete_value(workspace, 'outputs', key)
+        storage.save_values(workspace, 'outputs', outputs)
+    return {"outputs": outputs}
+
+
+# params: the arguments of calendar_pipeline.update_calendar after the workspace
+def _create_calendar(workspace, params, report):
+    report({"message": f"Describing and scheduling {sum(1 for post in params['posts'] if post.strip())} posts…"}, force=True)
+    events, changes = update_calendar(workspace, **params)
+    return {"changes": changes}
+
+
+# params: prompt, model, and the inputs key the summary is saved under
+def _summarise_input(workspace, params, report):
+    summary = get_chatgpt_response(params["prompt"], model=params["model"])
+    storage.save_value(workspace, 'inputs', params["key"], summary)
+    return {"summary": summary}
+
+
+# params: post_idea, specific_info
+def _build_post(workspace, params, report):
+    brand = get_workspace(workspace).brand_profile()
+    parts, seconds = {}, {}
+    # Like the ideas, a post asked for again is written afresh
+    for part, text, part_seconds in build_post(brand, params["post_idea"], params["specific_info"], bypass_cache=True):
+        parts[part] = text
+        if part_seconds is not None:
+            seconds[part] = part_seconds
+        report({"parts": parts, "seconds": seconds}, force=part_seconds is not None)
+    return {"parts": parts, "seconds": seconds}
+
+
+# Every post on the saved calendar, into a zip saved under post_builder.EXPORT_DIR
+def _build_all_posts(workspace, params, report):
+    brand = get_workspace(workspace).brand_profile()
+    entries = load_calendar(workspace)
+    export_name, zip_path = new_export()
+    with open(zip_path, "wb") as zip_file:
+        manifest = build_posts_zip(
+            brand, entries, zip_file, on_progress=lambda done, total: report({"done": done, "total": total}, force=done == total)
+        )
+    return {"export": export_name, "manifest": manifest}
+
+
+JOB_HANDLERS = {
+    "ideas": _generate_ideas,
+    "calendar": _create_calendar,
+    "summarise_input": _summarise_input,
+    "post": _build_post,
+    "all_posts": _build_all_posts,
+}
+
+
+
+def main():
+    count = max(JOB_WORKERS, 1)
+    recover_jobs()
+    print(f"Running jobs with {count} worker(s)")
+    threads = [
+        threading.Thread(target=_work, args=(f"{os.getpid()}:{number}",), name=f"riplo-job-{number}", daemon=True)
+        for number in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from riplo import prompt_cache
+
+
+
+# Shared gateway for every OpenAI call the app makes.
+#
+# One pooled HTTP client is shared by all pages and sessions. Calls go through
+# token buckets for requests-per-minute and tokens-per-minute, and are retried
+# with jittered exponential backoff on rate limits, timeouts and 5xx errors.
+# When OpenAI answers 429 the whole gateway pauses for the advertised
+# retry-after instead of every caller hammering the API at once.
+#
+# Messages are laid out for the provider's prompt caching, which reuses the
+# longest previously seen start of a prompt: the system message and an
+# optional per-brand `prefix` (riplo.brand_context.brand_prefix) come first
+# and are byte-for-byte the same on every request for a brand, and everything
+# that varies goes last, in the user message. The prompt and cached token
+# counts the API reports are recorded so the effect shows in Settings.
+
+
+load_dotenv()
+
+OPENAI_RPM = int(os.getenv("RIPLO_OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("RIPLO_OPENAI_TPM", "90000"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("RIPLO_OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_TIMEOUT = float(os.getenv("RIPLO_OPENAI_TIMEOUT", "120"))
+OPENAI_MAX_ATTEMPTS = int(os.getenv("RIPLO_OPENAI_MAX_ATTEMPTS", "5"))
+
+# Tokens reserved for the completion when a call doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+SYSTEM_PROMPT = "You are part of a prompt chain sequence. You should follow the instructions and generate the output as instructed. This is not a conversation. Your outputs should not include any introductory or explanatory text. Your outputs should be in plain text with a line break on the first line. Ensure that the output is strictly limited to the content requested."
+
+
+class LLMUnavailable(Exception):
+    pass
+
+
+
+class TokenBucket:
+    # Continuous-refill bucket holding up to `per_minute` units
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take `amount` units if available; otherwise return how long to wait before trying again
+    def try_take(self, amount):
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    # Adjust for the difference between the estimate and what was actually used
+    def settle(self, amount):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+_requests_bucket = TokenBucket(OPENAI_RPM)
+_tokens_bucket = TokenBucket(OPENAI_TPM)
+
+# Set after a 429 so every caller backs off together
+_paused_until = 0.0
+
+_usage = {"responses": 0, "prompt_tokens": 0, "cached_tokens": 0}
+_usage_lock = threading.Lock()
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+_client_lock = threading.Lock()
+
+
+
+def _api_key():
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("API key not found. Please set OPENAI_API_KEY in your .env file.")
+    return api_key
+
+
+def _limits():
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+
+
+def _timeout():
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=10.0)
+
+
+# Shared sync client (retries are handled here, not by the SDK)
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(
+                api_key=_api_key(),
+                max_retries=0,
+                timeout=_timeout(),
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+            )
+    return _client
+
+
+# Shared asyncio client (one per event loop, as pooled connections belong to a loop; run_async closes it)
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=_api_key(),
+                max_retries=0,
+                timeout=_timeout(),
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            )
+            _async_clients[loop] = client
+    return client
+
+
+async def _close_async_client():
+    with _client_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+# Run a coroutine to completion with asyncio.run, closing the loop's pooled client before the loop goes away
+def run_async(coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await _close_async_client()
+
+    return asyncio.run(run())
+
+
+
+def estimate_tokens(messages, max_tokens=None):
+    prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4 + 4 * len(messages)
+    return prompt_tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def _reserve_delay(estimated_tokens):
+    delay = _paused_until - time.monotonic()
+    if delay > 0:
+        return delay
+    delay = _requests_bucket.try_take(1)
+    if delay > 0:
+        return delay
+    delay = _tokens_bucket.try_take(estimated_tokens)
+    if delay > 0:
+        # Give the request slot back; it will be taken again on the next try
+        _requests_bucket.settle(-1)
+    return delay
+
+
+def _settle_usage(response, estimated_tokens):
+    usage = getattr(response, "usage", None)
+    if usage is not None and usage.total_tokens:
+        _tokens_bucket.settle(usage.total_tokens - estimated_tokens)
+    if usage is not None:
+        _record_usage(usage)
+
+
+# Count the prompt tokens of a response, and how many of them the provider served from its prompt cache
+def _record_usage(usage):
+    # Older SDKs hand the details back as a plain dict
+    details = getattr(usage, "prompt_tokens_details", None) or {}
+    cached_tokens = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", 0)
+    with _usage_lock:
+        _usage["responses"] += 1
+        _usage["prompt_tokens"] += usage.prompt_tokens or 0
+        _usage["cached_tokens"] += cached_tokens or 0
+
+
+# Prompt and cached token counts for this process
+def usage_stats():
+    with _usage_lock:
+        snapshot = dict(_usage)
+    snapshot["cached_rate"] = snapshot["cached_tokens"] / snapshot["prompt_tokens"] if snapshot["prompt_tokens"] else 0.0
+    return snapshot
+
+
+def _is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# Full-jitter exponential backoff, or the server's retry-after when it gives one
+def _backoff(attempt, error):
+    global _paused_until
+    delay = _retry_after(error)
+    if delay is None:
+        delay = random.uniform(0, min(60.0, 2.0 ** attempt))
+    if isinstance(error, openai.RateLimitError):
+        _paused_until = max(_paused_until, time.monotonic() + delay)
+    return delay
+
+
+
+# Create a chat completion through the limiter, retrying transient failures
+def chat(messages, model="gpt-4o", **kwargs):
+    estimated_tokens = estimate_tokens(messages, kwargs.get("max_tokens"))
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        delay = _reserve_delay(estimated_tokens)
+        while delay > 0:
+            time.sleep(delay)
+            delay = _reserve_delay(estimated_tokens)
+        try:
+            response = get_client().chat.completions.create(model=model, messages=messages, **kwargs)
+        except openai.APIError as e:
+            if not _is_retryable(e) or attempt == OPENAI_MAX_ATTEMPTS - 1:
+                raise LLMUnavailable(f"OpenAI request failed: {e}") from e
+            time.sleep(_backoff(attempt, e))
+            continue
+        _settle_usage(response, estimated_tokens)
+        return response
+
+
+async def achat(messages, model="gpt-4o", **kwargs):
+    estimated_tokens = estimate_tokens(messages, kwargs.get("max_tokens"))
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        delay = _reserve_delay(estimated_tokens)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = _reserve_delay(estimated_tokens)
+        try:
+            response = await get_async_client().chat.completions.create(model=model, messages=messages, **kwargs)
+        except openai.APIError as e:
+            if not _is_retryable(e) or attempt == OPENAI_MAX_ATTEMPTS - 1:
+                raise LLMUnavailable(f"OpenAI request failed: {e}") from e
+            await asyncio.sleep(_backoff(attempt, e))
+            continue
+        _settle_usage(response, estimated_tokens)
+        return response
+
+
+# Stream a chat completion as text deltas. Failures before the first token are
+# retried like chat(); once text has been yielded an error is raised as-is.
+def stream_chat(messages, model="gpt-4o", **kwargs):
+    estimated_tokens = estimate_tokens(messages, kwargs.get("max_tokens"))
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        delay = _reserve_delay(estimated_tokens)
+        while delay > 0:
+            time.sleep(delay)
+            delay = _reserve_delay(estimated_tokens)
+        started = False
+        try:
+            stream = get_client().chat.completions.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            for chunk in stream:
+                if chunk.usage is not None:
+                    _settle_usage(chunk, estimated_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    started = True
+                    yield chunk.choices[0].delta.content
+            return
+        except openai.APIError as e:
+            if started or not _is_retryable(e) or attempt == OPENAI_MAX_ATTEMPTS - 1:
+                raise LLMUnavailable(f"OpenAI request failed: {e}") from e
+            time.sleep(_backoff(attempt, e))
+
+
+# The stable start of every request: the system message, then the caller's prefix (if any)
+def system_message(system=SYSTEM_PROMPT, prefix=""):
+    return f"{system}\n\n{prefix}" if prefix else system
+
+
+def build_messages(prompt, system=SYSTEM_PROMPT, prefix=""):
+    return [
+        {"role": "system", "content": system_message(system, prefix)},
+        {"role": "user", "content": prompt},
+    ]
+
+
+# Function to get response from OpenAI's Chat API and handle response extraction
+# Identical requests are answered from the prompt cache unless bypass_cache is set.
+# `prefix` is stable per-brand context that goes in the system message, ahead of the prompt.
+def get_chatgpt_response(prompt, model="gpt-4o", system=SYSTEM_PROMPT, prefix="", bypass_cache=False, **kwargs):
+    key = prompt_cache.cache_key(model, system_message(system, prefix), prompt, **kwargs)
+    if not bypass_cache:
+        cached = prompt_cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = chat(build_messages(prompt, system, prefix), model=model, **kwargs)
+    content = response.choices[0].message.content.strip()
+    prompt_cache.put(key, model, content)
+    return content
+
+
+async def aget_chatgpt_response(prompt, model="gpt-4o", system=SYSTEM_PROMPT, prefix="", bypass_cache=False, **kwargs):
+    key = prompt_cache.cache_key(model, system_message(system, prefix), prompt, **kwargs)
+    if not bypass_cache:
+        cached = prompt_cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = await achat(build_messages(prompt, system, prefix), model=model, **kwargs)
+    content = response.choices[0].message.content.strip()
+    prompt_cache.put(key, model, content)
+    return content
+
+
+# Streaming version of get_chatgpt_response: yields text as it arrives and caches the full answer once complete.
+# A cached answer is yielded in one piece.
+def stream_chatgpt_response(prompt, model="gpt-4o", system=SYSTEM_PROMPT, prefix="", bypass_cache=False, **kwargs):
+    key = prompt_cache.cache_key(model, system_message(system, prefix), prompt, **kwargs)
+    if not bypass_cache:
+        cached = prompt_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    for text in stream_chat(build_messages(prompt, system, prefix), model=model, **kwargs):
+        if not parts:
+            text = text.lstrip()
+        parts.append(text)
+        yield text
+    prompt_cache.put(key, model, "".join(parts).strip())
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from riplo.brand_context import brand_prefix
+from riplo.llm import LLMUnavailable, aget_chatgpt_response, run_async, stream_chatgpt_response
+
+
+
+# Post Builder: turn one post idea into a caption, a media description and
+# step-by-step media instructions (built from the media description).
+#
+# build_post writes the caption and the media description at the same time,
+# in two worker threads, and starts the instructions as soon as the
+# description is done, so a post takes about as long as its longest chain
+# instead of all three generations back to back. Progress is handed back to
+# the calling (Streamlit script) thread as it streams in, with how long each
+# part took.
+#
+# build_posts_zip does the same for every post on the content calendar, a few
+# posts at a time, writing each one into a zip file (named by its scheduled
+# date) as soon as it is built, then a manifest. Only the posts being built
+# are held in memory; the zip goes straight to the file it is given. The
+# app saves it under EXPORT_DIR (see new_export), from where riplo.feed
+# streams it to the browser in chunks. Without a feed server the app offers
+# it through st.download_button instead, which reads the whole file into
+# memory, so that is only done for zips up to EXPORT_DOWNLOAD_MAX_BYTES.
+
+
+# The parts of a post, in the order they are shown
+POST_PARTS = ("caption", "media_description", "media_instructions")
+
+# How often (seconds) the caller is handed the latest text while parts are streaming
+PROGRESS_INTERVAL = 0.1
+
+# Posts built at the same time by build_posts_zip (each has up to two requests in flight)
+BULK_POST_WORKERS = int(os.getenv("RIPLO_BULK_POST_WORKERS", "4"))
+
+# Where built zips wait to be downloaded, and for how long (seconds)
+EXPORT_DIR = os.getenv("RIPLO_EXPORT_DIR", os.path.join(".cache", "exports"))
+EXPORT_MAX_AGE = 24 * 3600
+
+# Largest zip offered through st.download_button (which holds it in memory) when there's no feed server
+EXPORT_DOWNLOAD_MAX_BYTES = int(os.getenv("RIPLO_EXPORT_DOWNLOAD_MAX_MB", "50")) * 1024 * 1024
+
+# Export names are random, so knowing one is what allows downloading it
+EXPORT_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]{32}\.zip")
+
+
+# Write Caption
+caption_prompt_template = """
+Your Job: Write the Instagram/Facebook caption for the following post idea for {business_name}.
+
+Post Idea:
+{post_idea}
+
+Specific Information For The Post:
+{specific_info}
+
+Brand Voice: {brand_voice}
+Key Tone: {key_tone}
+Caption Style: {caption_style}
+
+Example Captions:
+{caption_examples}
+
+Your output should only include the caption. Do not include any other text preceding or following it.
+"""
+
+
+# Describe Media
+media_description_prompt_template = """
+Your Job: Describe the media (photo, graphic or video) for the following post idea for {business_name}.
+
+Post Idea:
+{post_idea}
+
+Specific Information For The Post:
+{specific_info}
+
+Brand Visual Elements: {brand_visual_elements}
+Brand Personality: {brand_personality}
+Resources Available: {resources}
+
+Your output should have the following schema:
+
+Media Type: [EG. Single Photo, Photo Carousel, Graphic, Short Video]
+
+Media Overview: [A SHORT OVERVIEW OF THE MEDIA]
+
+Detailed Description: [A DETAILED DESCRIPTION OF THE MEDIA, SCENE BY SCENE FOR VIDEOS, INCLUDING ANY OVERLAY TEXT AND FONTS]
+"""
+
+
+# Write Media Instructions
+media_instructions_prompt_template = """
+Your Job: Write step-by-step instructions for a small business owner with a smartphone to create the following media for {business_name}.
+
+Media Description:
+{media_description}
+
+Your output should have the following sections: Preparation, Capturing the Media, Editing and Final Touches, and Tips.
+
+Do not use any formatting such as bold text.
+"""
+
+
+
+def caption_prompt(brand, post_idea, specific_info=""):
+    return caption_prompt_template.format(
+        business_name=brand.business_name_primary,
+        post_idea=post_idea,
+        specific_info=specific_info,
+        brand_voice=brand.brand_voice_form,
+        key_tone=brand.key_tone_form,
+        caption_style=brand.caption_style_primary,
+        caption_examples=brand.caption_examples_primary,
+    )
+
+
+def media_description_prompt(brand, post_idea, specific_info=""):
+    return media_description_prompt_template.format(
+        business_name=brand.business_name_primary,
+        post_idea=post_idea,
+        specific_info=specific_info,
+        brand_visual_elements=brand.brand_visual_elements,
+        brand_personality=brand.brand_personality_form,
+        resources=brand.resources_form,
+    )
+
+
+def media_instructions_prompt(brand, media_description):
+    return media_instructions_prompt_template.format(
+        business_name=brand.business_name_primary,
+        media_description=media_description,
+    )
+
+
+def post_file(title, caption, media_description, media_instructions):
+    return (
+        f"{title}\n\n"
+        f"Caption:\n\n{caption}\n\n"
+        f"Media Description:\n\n{media_description}\n\n"
+        f"Media Instructions:\n\n{media_instructions}\n"
+    )
+
+
+# File name for a calendar post: its scheduled date and time, then its title
+def post_file_name(when, title):
+    title = re.sub(r'[\\/:*?"<>|\s]+', " ", title).strip()[:60] or "Post"
+    return f"{when:%Y-%m-%d %H%M} {title}.txt"
+
+
+
+class _Cancelled(Exception):
+    pass
+
+
+# Stream one part, reporting its text as it grows and (when finished) how long it took
+def _write_part(events, stop, part, prompt, prefix, bypass_cache=False):
+    started = time.monotonic()
+    text = ""
+    for chunk in stream_chatgpt_response(prompt, prefix=prefix, bypass_cache=bypass_cache):
+        if stop.is_set():
+            raise _Cancelled()
+        text += chunk
+        events.put((part, text, None))
+    text = text.strip()
+    events.put((part, text, time.monotonic() - started))
+    return text
+
+
+def _write_media(events, stop, brand, post_idea, specific_info, prefix, bypass_cache=False):
+    media_description = _write_part(
+        events, stop, "media_description", media_description_prompt(brand, post_idea, specific_info), prefix, bypass_cache
+    )
+    _write_part(events, stop, "media_instructions", media_instructions_prompt(brand, media_description), prefix, bypass_cache)
+
+
+# Write the three parts of a post, yielding (part, text so far, seconds) as they stream in;
+# seconds is None until the part is finished. Failures (e.g. LLMUnavailable) are raised here.
+# With bypass_cache every part is written afresh instead of being replayed from the prompt cache.
+def build_post(brand, post_idea, specific_info="", bypass_cache=False):
+    events = queue.Queue()
+    stop = threading.Event()
+    prefix = brand_prefix(brand)
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="riplo-post")
+    try:
+        futures = [
+            pool.submit(_write_part, events, stop, "caption", caption_prompt(brand, post_idea, specific_info), prefix, bypass_cache),
+            pool.submit(_write_media, events, stop, brand, post_idea, specific_info, prefix, bypass_cache),
+        ]
+        while True:
+            finished = all(future.done() for future in futures)
+
+            # Hand back only the latest text of each part (a finished part's last event is its final text)
+            latest = {}
+            while True:
+                try:
+                    part, text, seconds = events.get_nowait()
+                except queue.Empty:
+                    break
+                latest[part] = (text, seconds)
+            yield from ((part, text, seconds) for part, (text, seconds) in latest.items())
+
+            for future in futures:
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+            if finished:
+                return
+            time.sleep(PROGRESS_INTERVAL)
+    finally:
+        # Stop the other part early if one failed or the page was rerun
+        stop.set()
+        pool.shutdown(wait=False)
+
+
+
+# Build one post without streaming: caption and media description together, then the instructions
+async def abuild_post(brand, post_idea, specific_info=""):
+    prefix = brand_prefix(brand)
+    caption, media_description = await asyncio.gather(
+        aget_chatgpt_response(caption_prompt(brand, post_idea, specific_info), prefix=prefix),
+        aget_chatgpt_response(media_description_prompt(brand, post_idea, specific_info), prefix=prefix),
+    )
+    media_instructions = await aget_chatgpt_response(media_instructions_prompt(brand, media_description), prefix=prefix)
+    return caption, media_description, media_instructions
+
+
+async def abuild_posts_zip(brand, entries, file, workers=BULK_POST_WORKERS, on_progress=None):
+    semaphore = asyncio.Semaphore(workers)
+
+    async def build(entry):
+        async with semaphore:
+            try:
+                return entry, await abuild_post(brand, entry["post"]), None
+            except LLMUnavailable as e:
+                return entry, None, str(e)
+
+    manifest = []
+    names = set()
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for done, finished in enumerate(asyncio.as_completed([build(entry) for entry in entries]), start=1):
+            entry, parts, error = await finished
+            when = datetime.fromisoformat(entry["datetime"])
+            record = {"datetime": entry["datetime"], "title": entry["title"], "uid": entry.get("uid", "")}
+            if parts is None:
+                record["error"] = error
+            else:
+                name = post_file_name(when, entry["title"])
+                copy = 2
+                while name in names:
+                    name = f"{post_file_name(when, entry['title'])[:-len('.txt')]} ({copy}).txt"
+                    copy += 1
+                names.add(name)
+                archive.writestr(name, post_file(entry["title"], *parts))
+                record["file"] = name
+            manifest.append(record)
+            if on_progress is not None:
+                on_progress(done, len(entries))
+
+        manifest.sort(key=lambda record: record["datetime"])
+        archive.writestr("manifest.json", json.dumps({
+            "business": brand.business_name_primary,
+            "built_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "posts": manifest,
+        }, indent=2))
+    return manifest
+
+
+# A fresh (name, path) to save an export under, clearing out expired ones
+def new_export():
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    now = time.time()
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > EXPORT_MAX_AGE:
+                os.remove(path)
+        except OSError:
+            pass
+    name = secrets.token_urlsafe(24) + ".zip"
+    return name, os.path.join(EXPORT_DIR, name)
+
+
+# Path of a saved export, or None if the name isn't one (or it has expired)
+def export_path(name):
+    path = os.path.join(EXPORT_DIR, name)
+    if not EXPORT_NAME_PATTERN.fullmatch(name) or not os.path.isfile(path):
+        return None
+    return path
+
+
+# Build every calendar entry (dicts with post, title and datetime) into a zip written to `file`.
+# Posts that can't be built are listed in the manifest with their error. Returns the manifest entries.
+def build_posts_zip(brand, entries, file, workers=BULK_POST_WORKERS, on_progress=None):
+    return run_async(abuild_posts_zip(brand, entries, file, workers, on_progress))
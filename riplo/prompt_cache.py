@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+
+# On-disk cache of model responses, keyed by a hash of the model, system
+# message, rendered prompt and any options that change the output. Re-sending
+# an identical prompt (e.g. re-clicking 'Create Calendar' with the same posts)
+# is answered from here instead of OpenAI. Entries expire after a TTL and the
+# least recently used ones are evicted once the cache outgrows its limits.
+
+
+PROMPT_CACHE_PATH = os.getenv("RIPLO_PROMPT_CACHE_PATH", os.path.join(".cache", "prompt_cache.db"))
+PROMPT_CACHE_TTL = float(os.getenv("RIPLO_PROMPT_CACHE_TTL", str(7 * 24 * 3600)))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("RIPLO_PROMPT_CACHE_MAX_ENTRIES", "5000"))
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("RIPLO_PROMPT_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Evict every this many writes rather than on each one
+_EVICT_EVERY = 50
+
+
+_local = threading.local()
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+
+def _connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != PROMPT_CACHE_PATH:
+        directory = os.path.dirname(PROMPT_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(PROMPT_CACHE_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at);
+        """)
+        _local.conn = conn
+        _local.path = PROMPT_CACHE_PATH
+    return conn
+
+
+# Content hash of everything that determines the model's answer
+def cache_key(model, system, prompt, **options):
+    payload = json.dumps([model, system, prompt, options], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    conn = _connection()
+    now = time.time()
+    row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+    if row is None or now - row[1] > PROMPT_CACHE_TTL:
+        with _lock:
+            _counters["misses"] += 1
+        return None
+    conn.execute("UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+    with _lock:
+        _counters["hits"] += 1
+    return row[0]
+
+
+def put(key, model, response):
+    conn = _connection()
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used_at, hits) "
+        "VALUES (?, ?, ?, ?, ?, ?, 0)",
+        (key, model, response, len(response.encode("utf-8")), now, now),
+    )
+    with _lock:
+        _counters["writes"] += 1
+        should_evict = _counters["writes"] % _EVICT_EVERY == 0
+    if should_evict:
+        evict()
+
+
+# Drop expired entries, then the least recently used ones until within the limits
+def evict():
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        removed = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - PROMPT_CACHE_TTL,)).rowcount
+        count, total_size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count > PROMPT_CACHE_MAX_ENTRIES or total_size > PROMPT_CACHE_MAX_BYTES:
+            keep, kept_size = 0, 0
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used_at DESC").fetchall():
+                if keep < PROMPT_CACHE_MAX_ENTRIES and kept_size + size <= PROMPT_CACHE_MAX_BYTES:
+                    keep += 1
+                    kept_size += size
+                else:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    removed += 1
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    with _lock:
+        _counters["evictions"] += removed
+    return removed
+
+
+def clear():
+    _connection().execute("DELETE FROM responses")
+
+
+# Hit/miss counters for this process, plus the current size of the cache
+def stats():
+    count, total_size = _connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    with _lock:
+        snapshot = dict(_counters)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+    snapshot["entries"] = count
+    snapshot["bytes"] = total_size
+    return snapshot
@@ -0,0 +1,423 @@
+import bisect
+import math
+import re
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from dateutil import parser
+
+
+
+# Content calendar scheduling, done locally.
+#
+# Posts are dated from the start date, posts per week, preferred posting times
+# and the business's opening hours (no posts on days it is closed), and an
+# idea tied to a key date ("Date/Event: Valentine's Day") is pinned to the slot
+# just before that date. The posting order is then found by a small
+# backtracking search over the calendar rules: no two posts in a row with the
+# same theme, and the first posts use media that is easy to produce. If the
+# rules can't all be met, the theme rule is relaxed first, then the media
+# rule. The same inputs always give the same calendar, instantly and with no
+# model call.
+
+
+CALENDAR_TIMEZONE = ZoneInfo("Pacific/Auckland")
+
+# Posts go out in the early evening unless other times are given
+DEFAULT_POST_TIME = time(19, 0)
+
+DEFAULT_POSTS_PER_WEEK = 3
+
+# How many of the first posts should use easy-to-produce media
+EASY_MEDIA_SLOTS = 2
+
+# A post tied to a key date goes out at most this many days before it
+KEY_DATE_LEAD_DAYS = 7
+
+# Backtracking steps allowed per rule set before relaxing a rule
+SEARCH_LIMIT = 20000
+
+
+_WEEKDAYS = {
+    "mon": 0, "monday": 0, "tue": 1, "tues": 1, "tuesday": 1, "wed": 2, "weds": 2, "wednesday": 2,
+    "thu": 3, "thur": 3, "thurs": 3, "thursday": 3, "fri": 4, "friday": 4,
+    "sat": 5, "saturday": 5, "sun": 6, "sunday": 6,
+}
+_DAY_GROUPS = {
+    "weekdays": range(0, 5), "weekday": range(0, 5), "weekends": range(5, 7), "weekend": range(5, 7),
+    "daily": range(7), "everyday": range(7), "7 days": range(7),
+}
+_DAY_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(list(_WEEKDAYS) + list(_DAY_GROUPS), key=len, reverse=True)) + r")\b\.?"
+    r"(?:\s*(?:-|–|—|to|until)\s*\b(" + "|".join(sorted(_WEEKDAYS, key=len, reverse=True)) + r")\b\.?)?",
+    re.IGNORECASE,
+)
+_TIME_PATTERN = re.compile(r"\b(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?(?![\d/])", re.IGNORECASE)
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset("a an and at day days for in of on the to our week".split())
+
+# Dates written year first (2026-12-05, 2026/12/05) are read as year-month-day; everything else day first (5/12)
+_ISO_DATE_PATTERN = re.compile(r"\b\d{4}[-/.]\d{1,2}[-/.]\d{1,2}\b")
+
+# The date part of a key date line, cut out to leave its name ("Black Friday 2026-11-27" -> "Black Friday")
+_MONTH = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_DATE_TEXT_PATTERN = re.compile(
+    r"\b(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}"
+    r"|\d{1,2}[-/.]\d{1,2}(?:[-/.]\d{2,4})?"
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r"(?:,?\s+\d{4})?"
+    r"|" + _MONTH + r"\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s+\d{4})?)(?!\w)",
+    re.IGNORECASE,
+)
+
+# Theme = the idea's purpose, grouped into the purposes the idea prompt offers
+_PURPOSE_THEMES = {
+    "foot traffic": "foot traffic", "visit": "foot traffic", "sales": "foot traffic",
+    "engagement": "engagement", "engage": "engagement",
+    "awareness": "awareness", "promote": "awareness",
+    "community": "community",
+}
+
+# Media difficulty from the idea's Media field: 1 is easy (a single photo)
+_MEDIA_DIFFICULTY = (
+    (3, ("video", "reel", "tiktok", "animation", "timelapse", "time-lapse", "boomerang")),
+    (2, ("carousel", "series of", "multiple photos", "collage", "graphic", "illustration", "design", "infographic")),
+    (1, ("photo", "image", "picture", "shot", "snap", "selfie")),
+)
+
+
+
+# dateutil's field order for a date in `text`
+def _date_order(text):
+    if _ISO_DATE_PATTERN.search(text):
+        return {"yearfirst": True, "dayfirst": False}
+    return {"dayfirst": True}
+
+
+# Parse the free-text start date (e.g. "May 9 2025", "9th May" or "2025-05-09"); dates without a year roll forward
+def parse_start_date(text, today=None):
+    today = today or datetime.now(CALENDAR_TIMEZONE).date()
+    if not text or not text.strip():
+        return today
+    try:
+        parsed = parser.parse(text, default=datetime(today.year, today.month, today.day), fuzzy=True, **_date_order(text)).date()
+    except (ValueError, OverflowError):
+        return today
+    if parsed < today and not re.search(r'\b\d{4}\b', text):
+        parsed = parsed.replace(year=parsed.year + 1)
+    return parsed
+
+
+# Parse the posting frequency (posts per week) from free text such as "3" or "3 posts per week"
+def parse_frequency(text):
+    match = re.search(r'\d+(?:\.\d+)?', text or "")
+    if not match:
+        return DEFAULT_POSTS_PER_WEEK
+    return min(max(float(match.group()), 0.25), 14.0)
+
+
+def _to_time(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    meridiem = (meridiem or "").lower().replace(".", "")
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+# Parse preferred posting times such as "12pm, 7:30pm"; empty gives the default time
+def parse_post_times(text):
+    times = []
+    for match in _TIME_PATTERN.finditer(text or ""):
+        if not match.group(2) and not match.group(3):
+            continue    # a bare number isn't a time
+        parsed = _to_time(*match.groups())
+        if parsed is not None and parsed not in times:
+            times.append(parsed)
+    return times or [DEFAULT_POST_TIME]
+
+
+# Parse opening hours such as "Mon-Fri 7am-3pm, Sat 8am-2pm, Sun closed" into the
+# set of weekdays the business is open (Monday is 0). Unparseable text means every day.
+def parse_open_days(text):
+    open_days, closed_days = set(), set()
+    for segment in re.split(r"[\n;,]+", text or ""):
+        days = set()
+        for match in _DAY_PATTERN.finditer(segment):
+            first = match.group(1).lower()
+            if first in _DAY_GROUPS:
+                days.update(_DAY_GROUPS[first])
+            elif match.group(2):
+                start, end = _WEEKDAYS[first], _WEEKDAYS[match.group(2).lower()]
+                days.update((start + offset) % 7 for offset in range((end - start) % 7 + 1))
+            else:
+                days.add(_WEEKDAYS[first])
+        if not days:
+            continue
+        if re.search(r"\bclosed\b", segment, re.IGNORECASE):
+            closed_days.update(days)
+        else:
+            open_days.update(days)
+    if not open_days:
+        return set(range(7)) - closed_days or set(range(7))
+    return open_days - closed_days or open_days
+
+
+# The date written in `text` (relative to `start`; dates without a year roll forward), or None
+def _find_date(text, start):
+    try:
+        first, tokens = parser.parse(text, default=datetime(2000, 1, 1), fuzzy_with_tokens=True, **_date_order(text))
+        second = parser.parse(text, default=datetime(2001, 2, 2), fuzzy=True, **_date_order(text))
+    except (ValueError, OverflowError):
+        return None, text
+    if (first.month, first.day) != (second.month, second.day):
+        return None, text    # no day and month in the text
+    # The name is the text around the date (dateutil also swallows weekday and month words like "Friday")
+    date_text = _DATE_TEXT_PATTERN.search(text)
+    if date_text is not None:
+        name = re.sub(r"\s+", " ", f"{text[:date_text.start()]} {text[date_text.end():]}").strip(" -–:,.()")
+    else:
+        name = " ".join(token.strip(" -–:,.()") for token in tokens).strip()
+    if first.year == second.year:
+        return first.date(), name
+    found = date(start.year, first.month, first.day) if (first.month, first.day) != (2, 29) else None
+    if found is None:
+        return None, name
+    if found < start:
+        found = found.replace(year=found.year + 1)
+    return found, name
+
+
+# Parse key dates such as "Valentine's Day - 14 Feb" (one per line) into (date, name) pairs
+def parse_key_dates(text, start):
+    key_dates = []
+    for line in re.split(r"[\n;]+", text or ""):
+        line = line.strip(" -•*\t")
+        if not line:
+            continue
+        found, name = _find_date(line, start)
+        if found is not None:
+            key_dates.append((found, name))
+    return key_dates
+
+
+def _words(text):
+    return {word for word in _WORD_PATTERN.findall(text.lower()) if word not in _STOPWORDS}
+
+
+# The key date a post idea is tied to: a date in its Date/Event field, or a key date with the same name
+def key_date_for(post_idea, key_dates, start):
+    if not post_idea.date_event:
+        return None
+    found, _ = _find_date(post_idea.date_event, start)
+    if found is not None:
+        return found
+    event_words = _words(post_idea.date_event)
+    best, best_overlap = None, 0.0
+    for key_date, name in key_dates:
+        overlap = len(event_words & _words(name)) / max(len(event_words), 1)
+        if overlap >= 0.5 and overlap > best_overlap:
+            best, best_overlap = key_date, overlap
+    return best
+
+
+def post_theme(post_idea):
+    purpose = post_idea.purpose.lower()
+    for keyword, theme in _PURPOSE_THEMES.items():
+        if keyword in purpose:
+            return theme
+    return " ".join(sorted(_words(purpose))[:3]) or None
+
+
+def media_difficulty(post_idea):
+    media = (post_idea.media or post_idea.text).lower()
+    for difficulty, keywords in _MEDIA_DIFFICULTY:
+        if any(keyword in media for keyword in keywords):
+            return difficulty
+    return 2
+
+
+
+# `count` posting slots from the start date at the given posts per week, on open days only,
+# rotating through the preferred times (several posts on one day take successive times)
+def schedule_slots(count, start_date, posts_per_week, post_times=(DEFAULT_POST_TIME,), open_days=range(7), tz=CALENDAR_TIMEZONE):
+    spacing = 7.0 / posts_per_week
+    post_times = sorted(post_times)
+    slots = []
+    for i in range(count):
+        day = start_date + timedelta(days=math.floor(i * spacing + 1e-9))
+        if slots and day < slots[-1].date():
+            day = slots[-1].date()
+        while day.weekday() not in open_days:
+            day += timedelta(days=1)
+
+        used = [slot.time() for slot in slots[-len(post_times) - 24:] if slot.date() == day]
+        if not used:
+            post_time = post_times[i % len(post_times)]
+        else:
+            later = [t for t in post_times if t > used[-1]]
+            post_time = later[0] if later else (datetime.combine(day, used[-1]) + timedelta(hours=1)).time()
+            if post_time <= used[-1]:
+                day += timedelta(days=1)
+                post_time = post_times[0]
+        slots.append(datetime.combine(day, post_time, tzinfo=tz))
+    return slots
+
+
+# Slots a post tied to `key_date` may take: the lead window before it, else the last slot before it
+def _pinned_slots(slots, key_date):
+    before = [i for i, slot in enumerate(slots) if slot.date() <= key_date]
+    window = [i for i in before if (key_date - slots[i].date()).days <= KEY_DATE_LEAD_DAYS]
+    if window:
+        return window
+    return before[-1:] or None
+
+
+
+class _Search:
+    # Depth-first search for a post order, trying posts in their given order at each slot
+
+    def __init__(self, themes, easy, allowed, check_theme, check_media):
+        self.themes = themes
+        self.easy = easy
+        self.allowed = allowed    # post -> set of slots it may take, or None for any
+        self.check_theme = check_theme
+        self.check_media = check_media
+        # Only ask for easy media in the first slots as far as there are easy posts to fill them
+        self.easy_slots = min(EASY_MEDIA_SLOTS, sum(easy)) if check_media else 0
+        # Pinned posts by the last slot each may take
+        self.due = {}
+        for post, slots in enumerate(allowed):
+            if slots is not None:
+                self.due.setdefault(max(slots), []).append(post)
+
+    # True if no order can keep same-theme posts apart (the most common theme fills over half the slots)
+    def theme_rule_impossible(self):
+        counts = {}
+        for theme in self.themes:
+            if theme is not None:
+                counts[theme] = counts.get(theme, 0) + 1
+        return max(counts.values(), default=0) > (len(self.themes) + 1) // 2
+
+    def _fits(self, post, slot, order):
+        if self.allowed[post] is not None and slot not in self.allowed[post]:
+            return False
+        if slot < self.easy_slots and not self.easy[post]:
+            return False
+        if self.check_theme and order and self.themes[post] is not None:
+            return self.themes[order[-1]] != self.themes[post]
+        return True
+
+    # Posts that may go in this slot, from `first` on. A pinned post due here has to go here (two means a
+    # dead end); earlier deadlines were all met on the way here, since every earlier slot did the same.
+    def _candidates(self, slot, placed, first):
+        due = [post for post in self.due.get(slot, ()) if not placed[post]]
+        if len(due) > 1:
+            return []
+        return [post for post in due if post >= first] if due else range(first, len(self.themes))
+
+    def run(self):
+        if self.check_theme and self.theme_rule_impossible():
+            return None
+        count = len(self.themes)
+        order, placed, tried = [], [False] * count, [0]
+        lowest_unplaced = 0
+        steps = 0
+        while len(order) < count:
+            steps += 1
+            if steps > SEARCH_LIMIT:
+                return None
+            slot = len(order)
+            while placed[lowest_unplaced]:
+                lowest_unplaced += 1
+            post = next(
+                (post for post in self._candidates(slot, placed, max(tried[-1], lowest_unplaced))
+                 if not placed[post] and self._fits(post, slot, order)),
+                None,
+            )
+            if post is not None:
+                tried[-1] = post + 1
+                placed[post] = True
+                order.append(post)
+                tried.append(0)
+            else:
+                # Nothing fits here: undo the previous slot and try its next post
+                tried.pop()
+                if not order:
+                    return None
+                post = order.pop()
+                placed[post] = False
+                lowest_unplaced = min(lowest_unplaced, post)
+        return order
+
+
+# Order the post ideas into slots: returns the post index for each slot.
+# `fixed` maps posts that must stay where they are to their slot, whatever rules are relaxed.
+def order_posts(post_ideas, slots, key_dates=(), fixed=None):
+    fixed = fixed or {}
+    themes = [post_theme(post_idea) for post_idea in post_ideas]
+    easy = [media_difficulty(post_idea) == 1 for post_idea in post_ideas]
+    start = slots[0].date() if slots else date.today()
+    allowed = []
+    for post, post_idea in enumerate(post_ideas):
+        key_date = key_date_for(post_idea, key_dates, start) if post not in fixed else None
+        pinned = _pinned_slots(slots, key_date) if key_date is not None else None
+        pinned = [slot for slot in pinned or () if slot not in fixed.values()]
+        allowed.append(set(pinned) if pinned else None)
+    unpinned = [None] * len(post_ideas)
+    for post, slot in fixed.items():
+        allowed[post] = unpinned[post] = {slot}
+
+    # Every rule first, then drop whichever of the theme and media rules can't be met (the theme
+    # rule first), then both, then the key dates
+    relaxations = ((True, True, True), (False, True, True), (True, False, True), (False, False, True), (False, False, False))
+    for check_theme, check_media, use_pins in relaxations:
+        order = _Search(themes, easy, allowed if use_pins else unpinned, check_theme, check_media).run()
+        if order is not None:
+            return order
+    return list(range(len(post_ideas)))
+
+
+# The parsed scheduling inputs, as a JSON-friendly dict (two calendars built from equal settings line up).
+# `start_date` is the start already resolved from start_text, when it shouldn't be resolved against today again.
+def schedule_settings(start_text, frequency_text, times_text="", opening_hours="", key_dates_text="", start_date=None):
+    start_date = start_date or parse_start_date(start_text)
+    return {
+        "start_date": start_date.isoformat(),
+        "posts_per_week": parse_frequency(frequency_text),
+        "post_times": [t.isoformat() for t in parse_post_times(times_text)],
+        "open_days": sorted(parse_open_days(opening_hours)),
+        "key_dates": [[found.isoformat(), name] for found, name in parse_key_dates(key_dates_text, start_date)],
+    }
+
+
+# Date and order post ideas: returns (post index, datetime) pairs in posting order.
+# Posts in `fixed` (post index -> datetime) keep their datetime; the others fill the slots around them.
+def schedule(
+    post_ideas, start_text, frequency_text, times_text="", opening_hours="", key_dates_text="", fixed=None, start_date=None,
+):
+    settings = schedule_settings(start_text, frequency_text, times_text, opening_hours, key_dates_text, start_date)
+    start_date = date.fromisoformat(settings["start_date"])
+    slots = schedule_slots(
+        len(post_ideas), start_date, settings["posts_per_week"],
+        [time.fromisoformat(t) for t in settings["post_times"]], set(settings["open_days"]),
+    )
+
+    # Each fixed post takes the free slot nearest its datetime
+    fixed_slots = {}
+    free = list(range(len(slots)))
+    for post, when in sorted((fixed or {}).items(), key=lambda item: item[1]):
+        position = bisect.bisect_left(free, when, key=lambda slot: slots[slot])
+        nearest = min(
+            (p for p in (position - 1, position) if 0 <= p < len(free)),
+            key=lambda p: abs((slots[free[p]] - when).total_seconds()),
+        )
+        fixed_slots[post] = free.pop(nearest)
+
+    key_dates = [(date.fromisoformat(found), name) for found, name in settings["key_dates"]]
+    order = order_posts(post_ideas, slots, key_dates, fixed_slots)
+    return sorted(
+        ((post, fixed[post] if post in fixed_slots else slot) for post, slot in zip(order, slots)), key=lambda item: item[1]
+    )
@@ -0,0 +1,225 @@
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from riplo import storage
+from riplo.ideas import PostIdea
+
+
+
+# Search over the Idea Vault.
+#
+# Full-text search uses an SQLite FTS5 table (an inverted index ranked with
+# BM25) holding each idea's Title, Purpose, Creative Focus and Date/Event
+# fields (as parsed and stored by riplo.vault) alongside the full text. "Find similar" uses a small local
+# embedding per idea: hashed word and word-pair features projected into a
+# fixed-size unit vector, compared by cosine similarity. Neither needs a
+# network call.
+#
+# riplo.vault keeps both indexes up to date row by row as ideas are added,
+# edited and deleted, in the same transaction as the vault write. Ideas saved
+# before the index existed are indexed the first time a workspace is searched.
+
+
+# Set RIPLO_VAULT_EMBEDDINGS=0 to skip the "find similar" vectors
+EMBEDDINGS_ENABLED = os.getenv("RIPLO_VAULT_EMBEDDINGS", "1") != "0"
+
+EMBEDDING_DIMENSIONS = 256
+
+# BM25 column weights: workspace, title, purpose, creative focus, date/event, body
+_BM25_WEIGHTS = "0.0, 5.0, 2.0, 1.5, 2.0, 1.0"
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our the this that to with your you we".split()
+)
+
+
+_indexed_workspaces = set()
+_vectors = {}    # workspace -> _VectorCache
+_lock = threading.Lock()
+
+
+
+def _words(text):
+    return [word for word in _WORD_PATTERN.findall(text.lower()) if word not in _STOPWORDS]
+
+
+# Local embedding: signed feature hashing of words and adjacent word pairs, L2-normalised
+def embed(text):
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    words = _words(text)
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % EMBEDDING_DIMENSIONS] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+
+# Add or replace one idea (a PostIdea) in the indexes (called by riplo.vault inside its transaction)
+def index_entry(workspace, entry_id, post_idea):
+    conn = storage.get_connection()
+    conn.execute("DELETE FROM vault_fts WHERE rowid = ?", (entry_id,))
+    conn.execute(
+        "INSERT INTO vault_fts (rowid, workspace, title, purpose, creative_focus, date_event, body) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            entry_id, workspace, post_idea.title, post_idea.purpose,
+            post_idea.creative_focus, post_idea.date_event, post_idea.text,
+        ),
+    )
+    if EMBEDDINGS_ENABLED:
+        conn.execute(
+            "INSERT OR REPLACE INTO vault_vectors (id, workspace, vector, updated_at) VALUES (?, ?, ?, ?)",
+            (entry_id, workspace, embed(post_idea.text).tobytes(), time.time()),
+        )
+
+
+def remove_entry(entry_id):
+    conn = storage.get_connection()
+    conn.execute("DELETE FROM vault_fts WHERE rowid = ?", (entry_id,))
+    conn.execute("DELETE FROM vault_vectors WHERE id = ?", (entry_id,))
+
+
+def remove_workspace(workspace):
+    conn = storage.get_connection()
+    conn.execute("DELETE FROM vault_fts WHERE workspace = ?", (workspace,))
+    conn.execute("DELETE FROM vault_vectors WHERE workspace = ?", (workspace,))
+
+
+# Index any ideas saved before the search index existed (once per workspace per process)
+def ensure_indexed(workspace):
+    if workspace in _indexed_workspaces:
+        return
+    conn = storage.get_connection()
+    missing = conn.execute(
+        "SELECT v.id, v.text, v.fields FROM vault v LEFT JOIN vault_fts f ON f.rowid = v.id "
+        "WHERE v.workspace = ? AND f.rowid IS NULL", (workspace,)
+    ).fetchall()
+    if EMBEDDINGS_ENABLED:
+        missing += conn.execute(
+            "SELECT v.id, v.text, v.fields FROM vault v LEFT JOIN vault_vectors x ON x.id = v.id "
+            "WHERE v.workspace = ? AND x.id IS NULL", (workspace,)
+        ).fetchall()
+    with storage.transaction():
+        for entry_id, (text, fields_json) in {row[0]: row[1:] for row in missing}.items():
+            index_entry(workspace, entry_id, PostIdea.from_fields_json(text, fields_json))
+    _indexed_workspaces.add(workspace)
+
+
+
+# Turn free text into an FTS5 query: every word must match, the last one as a prefix.
+# The workspace is matched through the index too, which is much cheaper than filtering matched rows.
+def _match_query(workspace, query):
+    words = _WORD_PATTERN.findall(query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return f'workspace : "{workspace}" AND ({" ".join(terms)})'
+
+
+# Vault entries matching `query`, best match first
+def search(workspace, query, limit=50):
+    match = _match_query(workspace, query)
+    if match is None:
+        return []
+    ensure_indexed(workspace)
+    rows = storage.get_connection().execute(
+        f"SELECT v.id, v.text, v.created_at, v.updated_at, v.fields FROM vault_fts f JOIN vault v ON v.id = f.rowid "
+        f"WHERE vault_fts MATCH ? AND v.workspace = ? ORDER BY bm25(vault_fts, {_BM25_WEIGHTS}) LIMIT ?",
+        (match, workspace, limit),
+    )
+    return [
+        {
+            "id": entry_id, "text": text, "created_at": created_at, "updated_at": updated_at,
+            "post_idea": PostIdea.from_fields_json(text, fields_json),
+        }
+        for entry_id, text, created_at, updated_at, fields_json in rows
+    ]
+
+
+
+class _VectorCache:
+    # In-memory copy of one workspace's vectors, patched with only the rows that changed
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.matrix = np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        self.stamp = None
+        self.count = 0
+
+    def refresh(self, conn, workspace):
+        count, stamp = conn.execute(
+            "SELECT COUNT(*), MAX(updated_at) FROM vault_vectors WHERE workspace = ?", (workspace,)
+        ).fetchone()
+        if (count, stamp) == (self.count, self.stamp):
+            return
+
+        # Rows written since the last refresh (from this process or any other)
+        changed = conn.execute(
+            "SELECT id, vector FROM vault_vectors WHERE workspace = ? AND updated_at >= ?",
+            (workspace, self.stamp if self.stamp is not None else float("-inf")),
+        ).fetchall()
+        positions = {entry_id: i for i, entry_id in enumerate(self.ids.tolist())}
+        appended_ids, appended_vectors = [], []
+        for entry_id, blob in changed:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if entry_id in positions:
+                self.matrix[positions[entry_id]] = vector
+            else:
+                appended_ids.append(entry_id)
+                appended_vectors.append(vector)
+        if appended_ids:
+            self.ids = np.concatenate([self.ids, np.array(appended_ids, dtype=np.int64)])
+            self.matrix = np.vstack([self.matrix, np.array(appended_vectors, dtype=np.float32)])
+
+        # Drop deleted rows
+        if len(self.ids) != count:
+            current = {row[0] for row in conn.execute("SELECT id FROM vault_vectors WHERE workspace = ?", (workspace,))}
+            if not current.issubset(self.ids.tolist()):
+                # A row committed out of timestamp order was missed; reload everything
+                self.__init__()
+                self.refresh(conn, workspace)
+                return
+            keep = np.array([entry_id in current for entry_id in self.ids.tolist()], dtype=bool)
+            self.ids = self.ids[keep]
+            self.matrix = self.matrix[keep]
+
+        self.count, self.stamp = count, stamp
+
+
+def _vector_matrix(workspace):
+    conn = storage.get_connection()
+    with _lock:
+        cache = _vectors.setdefault(workspace, _VectorCache())
+        cache.refresh(conn, workspace)
+        return cache.ids, cache.matrix
+
+
+# (entry_id, score) pairs most similar to `text`, best first
+def similar_to_text(workspace, text, limit=10, exclude=()):
+    if not EMBEDDINGS_ENABLED:
+        return []
+    ensure_indexed(workspace)
+    ids, matrix = _vector_matrix(workspace)
+    if not len(ids):
+        return []
+    scores = matrix @ embed(text)
+    count = min(limit + len(exclude), len(ids))
+    best = np.argpartition(-scores, count - 1)[:count]
+    best = best[np.argsort(-scores[best])]
+    return [(int(ids[i]), float(scores[i])) for i in best if int(ids[i]) not in exclude and scores[i] > 0][:limit]
+
+
+# Vault entries most similar to an existing entry
+def similar(workspace, entry_id, limit=10):
+    row = storage.get_connection().execute(
+        "SELECT text FROM vault WHERE workspace = ? AND id = ?", (workspace, entry_id)
+    ).fetchone()
+    if row is None:
+        return []
+    return similar_to_text(workspace, row[0], limit, exclude={entry_id})
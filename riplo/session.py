@@ -0,0 +1,95 @@
+import streamlit as st
+
+from riplo.feed import start_feed_server
+from riplo.jobs import active_job, get_job, is_active, start_workers, submit
+from riplo.workspaces import DEFAULT_WORKSPACE, WorkspaceNotFound, get_workspace, list_workspaces
+
+
+# How often (seconds) a page re-reads the progress of a background job it is showing
+JOB_REFRESH_SECONDS = 1.0
+
+
+
+# Point this browser session at another workspace
+def switch_workspace(workspace_id):
+    if st.session_state.get('workspace_id') == workspace_id:
+        return
+    st.session_state.workspace_id = workspace_id
+    st.query_params['workspace'] = workspace_id
+
+    # Outputs are per session and belong to the workspace they were generated for
+    st.session_state.pop('outputs', None)
+
+
+# Resolve the workspace for this session (from ?workspace=<id>, then session state)
+# Does not render anything, so it can run before st.set_page_config
+def current_workspace():
+    # Every page starts here, so this is where the calendar feed server and the job workers are brought up (once per process)
+    start_feed_server()
+    start_workers()
+
+    requested = st.query_params.get('workspace')
+    if requested:
+        switch_workspace(requested)
+
+    workspace_id = st.session_state.get('workspace_id', DEFAULT_WORKSPACE)
+    try:
+        return get_workspace(workspace_id)
+    except WorkspaceNotFound:
+        switch_workspace(DEFAULT_WORKSPACE)
+        return get_workspace(DEFAULT_WORKSPACE)
+
+
+def _on_workspace_picked():
+    switch_workspace(st.session_state.workspace_picker)
+
+
+# Workspace switcher shown in the sidebar of every page
+def workspace_sidebar(workspace):
+    workspaces = list_workspaces()
+    ids = [w.id for w in workspaces]
+    names = {w.id: w.name for w in workspaces}
+    st.sidebar.selectbox(
+        'Workspace',
+        ids,
+        index=ids.index(workspace.id) if workspace.id in ids else 0,
+        format_func=lambda workspace_id: names.get(workspace_id, workspace_id),
+        key='workspace_picker',
+        on_change=_on_workspace_picked,
+    )
+
+
+
+# The background job of `kind` this session is following: the one it last started or,
+# when there is none (a new tab, a reload), one still running for the workspace
+def follow_job(workspace_id, kind):
+    job = get_job(st.session_state.get(f'job_{kind}'))
+    if job is None or job['workspace'] != workspace_id:
+        job = active_job(workspace_id, kind)
+        st.session_state[f'job_{kind}'] = job['id'] if job else None
+    return job
+
+
+# Queue a background job and follow it in this session
+def start_job(workspace_id, kind, params):
+    st.session_state[f'job_{kind}'] = submit(workspace_id, kind, params)
+
+
+# True the first time this session sees the job finished, so its result is shown or applied once
+def job_newly_finished(kind, job):
+    if job is None or is_active(job) or st.session_state.get(f'job_{kind}_seen') == job['id']:
+        return False
+    st.session_state[f'job_{kind}_seen'] = job['id']
+    return True
+
+
+# A queued or running job's progress, re-read every JOB_REFRESH_SECONDS without rerunning the page.
+# `show` renders the job's progress dict; the whole page reruns once the job has finished.
+@st.fragment(run_every=JOB_REFRESH_SECONDS)
+def job_progress(job_id, label, show=None):
+    job = get_job(job_id)
+    if not is_active(job):
+        st.rerun()
+    st.caption(label if job['status'] == 'running' else f"{label} (waiting for a free worker)")
+    if show is not None and job['progress']:
+        show(job['progress'])
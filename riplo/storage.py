@@ -0,0 +1,349 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from riplo.ideas import parse_post_idea
+
+
+
+# SQLite-backed storage for the app state that used to live in sessiondata.json.
+#
+# State is kept as one row per (workspace, namespace, key). A workspace is one
+# business; the namespaces are the old top-level keys of sessiondata.json
+# (inputs, outputs, cal). Saving an edit upserts only the rows that changed, so
+# write cost scales with the size of the edit, and two browser sessions
+# editing different keys no longer overwrite each other. The database runs in
+# WAL mode so readers never block the writer. Saved post ideas (the old repo)
+# live in their own table, see riplo.vault.
+
+
+DB_PATH = os.getenv("RIPLO_DB_PATH", "riplo.db")
+
+# The old whole-file store, imported once into the database
+LEGACY_JSON_PATH = "sessiondata.json"
+
+# Workspace the old single-tenant data is migrated into
+DEFAULT_WORKSPACE = "default"
+
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialised = set()
+
+
+
+_MIGRATION_V1 = """
+        CREATE TABLE IF NOT EXISTS kv (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        );
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+"""
+
+
+# Partition the key-value rows by workspace and add the workspace registry
+_MIGRATION_V2 = f"""
+        CREATE TABLE kv_v2 (
+            workspace TEXT NOT NULL,
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (workspace, namespace, key)
+        );
+        INSERT INTO kv_v2 (workspace, namespace, key, value, updated_at)
+            SELECT '{DEFAULT_WORKSPACE}', namespace, key, value, updated_at FROM kv ORDER BY rowid;
+        DROP TABLE kv;
+        ALTER TABLE kv_v2 RENAME TO kv;
+
+        CREATE TABLE IF NOT EXISTS workspaces (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            primary_sheet_url TEXT NOT NULL DEFAULT '',
+            questionnaire_sheet_url TEXT NOT NULL DEFAULT '',
+            summaries_sheet_url TEXT NOT NULL DEFAULT '',
+            created_at REAL NOT NULL
+        );
+"""
+
+
+# Move the old fixed repopostidea_N slots (slot 1 newest) into the vault, oldest first so IDs follow age
+_MOVE_REPO_SLOTS_TO_VAULT = """
+        INSERT INTO vault (workspace, text, created_at, updated_at)
+            SELECT workspace, json_extract(value, '$'), updated_at, updated_at FROM kv
+            WHERE namespace = 'repo' AND key LIKE 'repopostidea~_%' ESCAPE '~'
+                AND json_type(value) = 'text' AND trim(json_extract(value, '$')) <> ''
+            ORDER BY workspace, CAST(substr(key, 14) AS INTEGER) DESC;
+        DELETE FROM kv WHERE namespace = 'repo';
+"""
+
+
+# Keep the Idea Vault as one row per idea instead of 40 fixed slots
+_MIGRATION_V3 = f"""
+        CREATE TABLE vault (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            workspace TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX vault_workspace ON vault (workspace, id);
+        {_MOVE_REPO_SLOTS_TO_VAULT}
+"""
+
+
+# Search indexes over the vault (maintained by riplo.search)
+_MIGRATION_V4 = """
+        CREATE VIRTUAL TABLE vault_fts USING fts5(
+            workspace, title, purpose, creative_focus, date_event, body,
+            tokenize = 'porter unicode61'
+        );
+        CREATE TABLE vault_vectors (
+            id INTEGER PRIMARY KEY,
+            workspace TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX vault_vectors_workspace ON vault_vectors (workspace, updated_at);
+"""
+
+
+# Near-duplicate index over the vault (maintained by riplo.duplicates)
+_MIGRATION_V5 = """
+        CREATE TABLE vault_signatures (
+            id INTEGER PRIMARY KEY,
+            workspace TEXT NOT NULL,
+            signature BLOB NOT NULL
+        );
+        CREATE TABLE vault_lsh (
+            workspace TEXT NOT NULL,
+            key INTEGER NOT NULL,
+            id INTEGER NOT NULL
+        );
+        CREATE INDEX vault_lsh_key ON vault_lsh (workspace, key);
+        CREATE INDEX vault_lsh_id ON vault_lsh (id);
+"""
+
+
+# Store each vault idea's parsed fields (a PostIdea as JSON) next to its text
+def _parse_vault_fields(conn):
+    rows = conn.execute("SELECT id, text FROM vault WHERE fields IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE vault SET fields = ? WHERE id = ?", [(parse_post_idea(text).fields_json(), entry_id) for entry_id, text in rows]
+    )
+
+
+def _migration_v6(conn):
+    conn.execute("ALTER TABLE vault ADD COLUMN fields TEXT")
+    _parse_vault_fields(conn)
+
+
+# Background jobs (see riplo.jobs); params, progress and result are JSON
+_MIGRATION_V7 = """
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY,
+            workspace TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX jobs_status ON jobs (status, id);
+        CREATE INDEX jobs_workspace ON jobs (workspace, kind, id);
+"""
+
+
+# Schema migrations, applied in order; PRAGMA user_version records how many have run.
+# A migration is an SQL script, or a function for steps that need Python.
+MIGRATIONS = [_MIGRATION_V1, _MIGRATION_V2, _MIGRATION_V3, _MIGRATION_V4, _MIGRATION_V5, _migration_v6, _MIGRATION_V7]
+
+
+# Import the old sessiondata.json layout ({namespace: {key: value}}) into the database
+def migrate_legacy_json(conn, path=LEGACY_JSON_PATH):
+    done = conn.execute("SELECT value FROM meta WHERE key = 'legacy_json_migrated'").fetchone()
+    if done or not os.path.exists(path):
+        return 0
+
+    try:
+        with open(path, "r") as file:
+            content = file.read().strip()
+            legacy = json.loads(content) if content else {}
+    except json.JSONDecodeError:
+        legacy = {}
+
+    now = time.time()
+    rows = [
+        (DEFAULT_WORKSPACE, namespace, key, json.dumps(value), now)
+        for namespace, values in legacy.items() if isinstance(values, dict)
+        for key, value in values.items()
+    ]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # INSERT OR IGNORE so a value saved after a half-finished migration always wins
+        conn.executemany(
+            "INSERT OR IGNORE INTO kv (workspace, namespace, key, value, updated_at) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        for statement in _MOVE_REPO_SLOTS_TO_VAULT.split(";")[:-1]:
+            conn.execute(statement)
+        _parse_vault_fields(conn)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_json_migrated', ?)", (str(now),))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def _initialise(conn):
+    with _init_lock:
+        if DB_PATH in _initialised:
+            return
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            try:
+                if callable(migration):
+                    conn.execute("BEGIN IMMEDIATE")
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version = {number}")
+                    conn.execute("COMMIT")
+                else:
+                    conn.executescript(f"BEGIN IMMEDIATE; {migration} PRAGMA user_version = {number}; COMMIT;")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        migrate_legacy_json(conn)
+        _initialised.add(DB_PATH)
+
+
+
+# One connection per thread (Streamlit runs each session's script on its own thread)
+def get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        # Autocommit mode: transactions are opened explicitly by `transaction()`
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA busy_timeout = 30000")
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.depth = 0
+        _initialise(conn)
+    return conn
+
+
+# Group several reads/writes into one atomic transaction (nested calls join the outer one)
+@contextmanager
+def transaction():
+    conn = get_connection()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth = 0
+        conn.execute("ROLLBACK")
+        raise
+    _local.depth = 0
+    conn.execute("COMMIT")
+
+
+
+# Read every key of a namespace, in the order the keys were first saved (like a dict)
+def load_namespace(workspace, namespace):
+    rows = get_connection().execute(
+        "SELECT key, value FROM kv WHERE workspace = ? AND namespace = ? ORDER BY rowid", (workspace, namespace)
+    )
+    return {key: json.loads(value) for key, value in rows}
+
+
+def get_value(workspace, namespace, key, default=None):
+    row = get_connection().execute(
+        "SELECT value FROM kv WHERE workspace = ? AND namespace = ? AND key = ?", (workspace, namespace, key)
+    ).fetchone()
+    return json.loads(row[0]) if row else default
+
+
+_UPSERT = (
+    "INSERT INTO kv (workspace, namespace, key, value, updated_at) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (workspace, namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"
+)
+
+
+# Upsert a single key
+def save_value(workspace, namespace, key, value):
+    get_connection().execute(_UPSERT, (workspace, namespace, key, json.dumps(value), time.time()))
+
+
+# Upsert the keys of `values` whose stored value actually differs; returns the keys written
+def save_values(workspace, namespace, values):
+    with transaction() as conn:
+        stored = dict(conn.execute(
+            "SELECT key, value FROM kv WHERE workspace = ? AND namespace = ?", (workspace, namespace)
+        ))
+        changed = {key: json.dumps(value) for key, value in values.items()}
+        changed = {key: value for key, value in changed.items() if stored.get(key) != value}
+        now = time.time()
+        conn.executemany(_UPSERT, [(workspace, namespace, key, value, now) for key, value in changed.items()])
+    return list(changed)
+
+
+def delete_value(workspace, namespace, key):
+    get_connection().execute(
+        "DELETE FROM kv WHERE workspace = ? AND namespace = ? AND key = ?", (workspace, namespace, key)
+    )
+
+
+
+# Workspace registry
+_WORKSPACE_COLUMNS = ("id", "name", "primary_sheet_url", "questionnaire_sheet_url", "summaries_sheet_url")
+
+
+def list_workspaces():
+    rows = get_connection().execute(
+        f"SELECT {', '.join(_WORKSPACE_COLUMNS)} FROM workspaces ORDER BY name COLLATE NOCASE"
+    )
+    return [dict(zip(_WORKSPACE_COLUMNS, row)) for row in rows]
+
+
+def get_workspace_config(workspace):
+    row = get_connection().execute(
+        f"SELECT {', '.join(_WORKSPACE_COLUMNS)} FROM workspaces WHERE id = ?", (workspace,)
+    ).fetchone()
+    return dict(zip(_WORKSPACE_COLUMNS, row)) if row else None
+
+
+def save_workspace_config(workspace, name, primary_sheet_url="", questionnaire_sheet_url="", summaries_sheet_url=""):
+    get_connection().execute(
+        "INSERT INTO workspaces (id, name, primary_sheet_url, questionnaire_sheet_url, summaries_sheet_url, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET name = excluded.name, "
+        "primary_sheet_url = excluded.primary_sheet_url, questionnaire_sheet_url = excluded.questionnaire_sheet_url, "
+        "summaries_sheet_url = excluded.summaries_sheet_url",
+        (workspace, name, primary_sheet_url, questionnaire_sheet_url, summaries_sheet_url, time.time()),
+    )
@@ -0,0 +1,94 @@
+import time
+
+from riplo import duplicates, search, storage
+from riplo.ideas import PostIdea, parse_post_idea
+
+
+
+# The Idea Vault: every saved post idea for a workspace, one row each.
+#
+# Entries have stable integer IDs in insertion order and are listed newest
+# first. Adding, editing or deleting an idea touches only that idea's row, and
+# there is no cap on how many ideas a workspace can keep (this replaces the 40
+# fixed repopostidea_N slots, which are migrated in by storage). Each idea is
+# parsed once when it is written and its fields are stored with it; entries
+# come back with a "post_idea" PostIdea. The search and duplicate indexes are
+# updated in the same transaction as each write.
+
+
+_COLUMNS = ("id", "text", "created_at", "updated_at", "fields")
+
+
+
+def _row(row):
+    if not row:
+        return None
+    entry = dict(zip(_COLUMNS, row))
+    entry["post_idea"] = PostIdea.from_fields_json(entry["text"], entry.pop("fields"))
+    return entry
+
+
+# Add an idea (it becomes the newest entry); returns its ID
+def add(workspace, text):
+    now = time.time()
+    post_idea = parse_post_idea(text)
+    with storage.transaction() as conn:
+        entry_id = conn.execute(
+            "INSERT INTO vault (workspace, text, fields, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (workspace, text, post_idea.fields_json(), now, now),
+        ).lastrowid
+        search.index_entry(workspace, entry_id, post_idea)
+        duplicates.index_entry(workspace, entry_id, text)
+    return entry_id
+
+
+# Add several ideas so that the first one ends up newest; returns their IDs in the given order
+def add_many(workspace, texts):
+    with storage.transaction():
+        ids = [add(workspace, text) for text in reversed(texts)]
+    return ids[::-1]
+
+
+def get(workspace, entry_id):
+    return _row(storage.get_connection().execute(
+        f"SELECT {', '.join(_COLUMNS)} FROM vault WHERE workspace = ? AND id = ?", (workspace, entry_id)
+    ).fetchone())
+
+
+def update(workspace, entry_id, text):
+    post_idea = parse_post_idea(text)
+    with storage.transaction() as conn:
+        updated = conn.execute(
+            "UPDATE vault SET text = ?, fields = ?, updated_at = ? WHERE workspace = ? AND id = ?",
+            (text, post_idea.fields_json(), time.time(), workspace, entry_id),
+        ).rowcount
+        if updated:
+            search.index_entry(workspace, entry_id, post_idea)
+            duplicates.index_entry(workspace, entry_id, text)
+
+
+def delete(workspace, entry_id):
+    with storage.transaction() as conn:
+        if conn.execute("DELETE FROM vault WHERE workspace = ? AND id = ?", (workspace, entry_id)).rowcount:
+            search.remove_entry(entry_id)
+            duplicates.remove_entry(entry_id)
+
+
+def clear(workspace):
+    with storage.transaction() as conn:
+        conn.execute("DELETE FROM vault WHERE workspace = ?", (workspace,))
+        search.remove_workspace(workspace)
+        duplicates.remove_workspace(workspace)
+
+
+def count(workspace):
+    return storage.get_connection().execute("SELECT COUNT(*) FROM vault WHERE workspace = ?", (workspace,)).fetchone()[0]
+
+
+# Entries newest first; pass limit/offset to read one page
+def entries(workspace, limit=None, offset=0):
+    rows = storage.get_connection().execute(
+        f"SELECT {', '.join(_COLUMNS)} FROM vault WHERE workspace = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+        (workspace, -1 if limit is None else limit, offset),
+    )
+    return [_row(row) for row in rows]
@@ -0,0 +1,116 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from riplo import brand_profile, storage
+from riplo.storage import DEFAULT_WORKSPACE
+
+
+
+# Workspaces: one per business.
+#
+# Each workspace has its own inputs/outputs/repo/cal state in the app database
+# and its own brand sheets. Workspaces are loaded lazily the first time a
+# session asks for one, and only the most recently used ones are kept in
+# memory (together with their parsed brand sheets), so one process can host
+# hundreds of clients.
+
+
+# How many workspaces to keep loaded in memory
+HOT_WORKSPACES = int(os.getenv("RIPLO_HOT_WORKSPACES", "64"))
+
+# Brand sheets used by the default workspace until it is configured in Settings
+DEFAULT_SHEETS = {
+    "primary_sheet_url": "https://docs.google.com/spreadsheets/d/1saYSGXsYJqnGQ5jIoH_feXgBKk41aDEMZIRuQEQXl6c/export?format=csv&gid=78226312",
+    "questionnaire_sheet_url": "https://docs.google.com/spreadsheets/d/1saYSGXsYJqnGQ5jIoH_feXgBKk41aDEMZIRuQEQXl6c/export?format=csv&gid=470780055",
+    "summaries_sheet_url": "https://docs.google.com/spreadsheets/d/1saYSGXsYJqnGQ5jIoH_feXgBKk41aDEMZIRuQEQXl6c/export?format=csv&gid=1055847394",
+}
+
+WORKSPACE_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class WorkspaceNotFound(KeyError):
+    pass
+
+
+class Workspace:
+    __slots__ = ("id", "name", "primary_sheet_url", "questionnaire_sheet_url", "summaries_sheet_url")
+
+    def __init__(self, id, name, primary_sheet_url="", questionnaire_sheet_url="", summaries_sheet_url=""):
+        self.id = id
+        self.name = name
+        self.primary_sheet_url = primary_sheet_url
+        self.questionnaire_sheet_url = questionnaire_sheet_url
+        self.summaries_sheet_url = summaries_sheet_url
+
+    @property
+    def sheet_urls(self):
+        return (self.primary_sheet_url, self.questionnaire_sheet_url, self.summaries_sheet_url)
+
+    # Brand profile for this workspace (built once per sheet revision)
+    def brand_profile(self):
+        return brand_profile.load_brand_profile(*self.sheet_urls)
+
+
+_hot = OrderedDict()
+_lock = threading.Lock()
+
+
+
+def _ensure_default_workspace():
+    if storage.get_workspace_config(DEFAULT_WORKSPACE) is None:
+        storage.save_workspace_config(DEFAULT_WORKSPACE, "Default", **DEFAULT_SHEETS)
+
+
+def _evict(workspace):
+    # Free the parsed brand sheets as well, unless another hot workspace shares them
+    shared = {url for other in _hot.values() for url in other.sheet_urls}
+    brand_profile.forget(*[url for url in workspace.sheet_urls if url not in shared])
+
+
+# Return a workspace, loading it on first use and keeping it in the hot LRU
+def get_workspace(workspace_id):
+    with _lock:
+        workspace = _hot.get(workspace_id)
+        if workspace is not None:
+            _hot.move_to_end(workspace_id)
+            return workspace
+
+    if workspace_id == DEFAULT_WORKSPACE:
+        _ensure_default_workspace()
+    config = storage.get_workspace_config(workspace_id)
+    if config is None:
+        raise WorkspaceNotFound(workspace_id)
+    workspace = Workspace(**config)
+
+    with _lock:
+        _hot[workspace_id] = workspace
+        _hot.move_to_end(workspace_id)
+        while len(_hot) > HOT_WORKSPACES:
+            _, evicted = _hot.popitem(last=False)
+            _evict(evicted)
+    return workspace
+
+
+def list_workspaces():
+    _ensure_default_workspace()
+    return [Workspace(**config) for config in storage.list_workspaces()]
+
+
+# Create or update a workspace's name and brand sheets
+def save_workspace(workspace_id, name, primary_sheet_url="", questionnaire_sheet_url="", summaries_sheet_url=""):
+    if not WORKSPACE_ID_PATTERN.match(workspace_id):
+        raise ValueError("Workspace IDs may only contain lowercase letters, numbers, '-' and '_'.")
+    storage.save_workspace_config(workspace_id, name, primary_sheet_url, questionnaire_sheet_url, summaries_sheet_url)
+    with _lock:
+        previous = _hot.pop(workspace_id, None)
+        if previous is not None:
+            _evict(previous)
+    return get_workspace(workspace_id)
+
+
+def create_workspace(workspace_id, name):
+    if storage.get_workspace_config(workspace_id) is not None:
+        raise ValueError(f"A workspace called '{workspace_id}' already exists.")
+    return save_workspace(workspace_id, name)
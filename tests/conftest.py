@@ -0,0 +1,48 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+
+
+# Tests run the app against a throwaway database and sheet snapshots (no Google or OpenAI),
+# from the repository root so the pages find their images.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_scratch = tempfile.mkdtemp(prefix="riplo-tests-")
+os.environ.setdefault("RIPLO_DB_PATH", os.path.join(_scratch, "riplo.db"))
+os.environ.setdefault("RIPLO_SNAPSHOT_DIR", os.path.join(_scratch, "sheets"))
+os.environ.setdefault("RIPLO_PROMPT_CACHE_PATH", os.path.join(_scratch, "prompt_cache.db"))
+os.environ.setdefault("RIPLO_EXPORT_DIR", os.path.join(_scratch, "exports"))
+os.environ.setdefault("RIPLO_SHEET_TTL", "86400")
+os.environ.setdefault("RIPLO_FEED_PORT", "0")
+os.environ.setdefault("RIPLO_JOB_WORKERS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+
+# A brand sheet's snapshot, so the brand profile loads without downloading anything
+def seed_sheet(url, business_name="Test Cafe"):
+    os.makedirs(os.environ["RIPLO_SNAPSHOT_DIR"], exist_ok=True)
+    rows = [f'"Question {i}","{business_name if i == 0 else f"Answer {i}"}"' for i in range(40)]
+    path = os.path.join(os.environ["RIPLO_SNAPSHOT_DIR"], hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+    with open(path, "w") as file:
+        json.dump({"url": url, "text": "\n".join(rows) + "\n", "etag": None, "last_modified": None}, file)
+
+
+# Two workspaces ("default" and "other") on the same seeded brand sheets
+@pytest.fixture(scope="session")
+def workspaces():
+    from riplo.workspaces import DEFAULT_SHEETS, get_workspace, save_workspace
+
+    for url in DEFAULT_SHEETS.values():
+        seed_sheet(url)
+    get_workspace("default")
+    save_workspace("other", "Other", **DEFAULT_SHEETS)
+    return ("default", "other")
@@ -0,0 +1,37 @@
+from datetime import date
+
+from riplo import calendar_pipeline
+from riplo.calendar_pipeline import load_calendar, update_calendar
+
+
+POSTS = [
+    f"Title: Post {number}\n\nIdea: Post {number}\n\nPurpose: Build community\n\nMedia: iPhone photo"
+    for number in range(1, 4)
+]
+
+
+async def _describe(post_idea, model=None, bypass_cache=False):
+    return f"About {post_idea.title}"
+
+
+# A calendar with no start date starts on the day it is built, and stays put on the days after
+def test_calendar_without_start_date_is_stable_across_days(monkeypatch, workspaces):
+    workspace = "calendar-start"
+    monkeypatch.setattr(calendar_pipeline, "describe_post", _describe)
+
+    monkeypatch.setattr(calendar_pipeline, "parse_start_date", lambda text: date(2030, 3, 1))
+    events, changes = update_calendar(workspace, POSTS, "", "7")
+    assert changes["added"] == 3
+    first = {event["uid"]: (event["datetime"], event["sequence"]) for event in load_calendar(workspace)}
+    assert min(datetime for datetime, sequence in first.values()).startswith("2030-03-01")
+
+    monkeypatch.setattr(calendar_pipeline, "parse_start_date", lambda text: date(2030, 3, 2))
+    events, changes = update_calendar(workspace, POSTS, "", "7")
+    assert changes["unchanged"] == 3 and changes["updated"] == 0
+    assert {event["uid"]: (event["datetime"], event["sequence"]) for event in load_calendar(workspace)} == first
+
+    # A new start date is used as soon as the text changes
+    monkeypatch.undo()
+    monkeypatch.setattr(calendar_pipeline, "describe_post", _describe)
+    events, changes = update_calendar(workspace, POSTS, "2030-04-01", "7")
+    assert min(event["datetime"] for event in load_calendar(workspace)).startswith("2030-04-01")
@@ -0,0 +1,15 @@
+from riplo import feed
+from riplo.workspaces import save_workspace
+
+
+# Renaming a workspace changes its feed's calendar name and ETag, with no calendar change
+def test_feed_follows_workspace_rename(workspaces):
+    save_workspace("feed-rename", "Old Name")
+    etag, body = feed.cached_feed("feed-rename")
+    assert b"X-WR-CALNAME:Old Name" in body
+    assert feed.cached_feed("feed-rename") == (etag, body)
+
+    save_workspace("feed-rename", "New Name")
+    new_etag, new_body = feed.cached_feed("feed-rename")
+    assert b"X-WR-CALNAME:New Name" in new_body
+    assert new_etag != etag
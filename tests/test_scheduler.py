@@ -0,0 +1,138 @@
+from datetime import date
+
+import pytest
+
+from riplo.ideas import parse_post_idea
+from riplo.scheduler import _find_date, key_date_for, media_difficulty, parse_key_dates, parse_start_date, post_theme, schedule
+
+
+TODAY = date(2026, 10, 18)
+
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2026-12-05", date(2026, 12, 5)),
+    ("2026/12/05", date(2026, 12, 5)),
+    ("Start 2027-01-04", date(2027, 1, 4)),
+    ("5/12/2026", date(2026, 12, 5)),
+    ("5/12", date(2026, 12, 5)),
+    ("9th May", date(2027, 5, 9)),
+    ("May 9 2027", date(2027, 5, 9)),
+    ("Dec 5", date(2026, 12, 5)),
+    ("", TODAY),
+    ("whenever", TODAY),
+])
+def test_parse_start_date(text, expected):
+    assert parse_start_date(text, today=TODAY) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Launch 2026-11-03", date(2026, 11, 3)),
+    ("Black Friday 2026-11-27", date(2026, 11, 27)),
+    ("Valentine's Day - 14 Feb", date(2027, 2, 14)),
+    ("Christmas Day 25th December", date(2026, 12, 25)),
+    ("Easter Monday 6/4", date(2027, 4, 6)),
+    ("Mother's Day: May 10, 2027", date(2027, 5, 10)),
+    ("Nothing here", None),
+])
+def test_find_date(text, expected):
+    found, name = _find_date(text, TODAY)
+    assert found == expected
+
+
+# A key date's name is the line without its date (weekday and month words in the name stay)
+@pytest.mark.parametrize("text, expected", [
+    ("Black Friday 2026-11-27", "Black Friday"),
+    ("Valentine's Day - 14 Feb", "Valentine's Day"),
+    ("Easter Monday 6/4", "Easter Monday"),
+    ("Mother's Day: May 10, 2027", "Mother's Day"),
+    ("Anniversary (3 March)", "Anniversary"),
+    ("Labour Day Monday 26 October", "Labour Day Monday"),
+])
+def test_key_date_name(text, expected):
+    found, name = _find_date(text, TODAY)
+    assert name == expected
+
+
+def test_idea_matches_key_date_by_name():
+    key_dates = parse_key_dates("Black Friday 2026-11-27\nValentine's Day - 14 Feb", TODAY)
+    post_idea = parse_post_idea("Title: Deals\n\nIdea: Our Black Friday deals\n\nDate/Event: Black Friday")
+    assert key_date_for(post_idea, key_dates, TODAY) == date(2026, 11, 27)
+
+
+
+def _idea(title, purpose, media, event=""):
+    text = f"Title: {title}\n\nIdea: {title}\n\nPurpose: {purpose}\n\nMedia: {media}"
+    return parse_post_idea(text + (f"\n\nDate/Event: {event}" if event else ""))
+
+
+def _themes(post_ideas, scheduled):
+    return [post_theme(post_ideas[post]) for post, when in scheduled]
+
+
+def _easy(post_ideas, scheduled):
+    return [media_difficulty(post_ideas[post]) == 1 for post, when in scheduled]
+
+
+def _no_repeats(themes):
+    return all(first != second for first, second in zip(themes, themes[1:]))
+
+
+def test_schedule_keeps_every_rule_when_it_can():
+    post_ideas = [
+        _idea("a", "Drive foot traffic", "professional video"),
+        _idea("b", "Drive foot traffic", "iPhone photo"),
+        _idea("c", "Build community", "iPhone photo"),
+        _idea("d", "Raise awareness", "professional video"),
+    ]
+    scheduled = schedule(post_ideas, "2030-02-04", "7")
+    assert [when.date() for post, when in scheduled] == [date(2030, 2, 4 + day) for day in range(4)]
+    assert _no_repeats(_themes(post_ideas, scheduled))
+    assert _easy(post_ideas, scheduled)[:2] == [True, True]
+
+
+# Three foot-traffic posts out of four can't be kept apart: the theme rule goes first, the media rule stays
+def test_schedule_relaxes_the_theme_rule_first():
+    post_ideas = [
+        _idea("a", "Drive foot traffic", "professional video"),
+        _idea("b", "Drive foot traffic", "professional video"),
+        _idea("c", "Drive foot traffic", "iPhone photo"),
+        _idea("d", "Build community", "iPhone photo"),
+    ]
+    scheduled = schedule(post_ideas, "2030-02-04", "7")
+    assert _easy(post_ideas, scheduled)[:2] == [True, True]
+
+
+# The launch post (a video) is pinned to the first slot, so easy media first is impossible;
+# the theme rule alone can still be met and is kept
+def test_schedule_keeps_the_theme_rule_when_only_the_media_rule_fails():
+    post_ideas = [
+        _idea("a", "Drive foot traffic", "iPhone photo"),
+        _idea("b", "Drive foot traffic", "iPhone photo"),
+        _idea("c", "Build community", "professional video"),
+        _idea("launch", "Raise awareness", "professional video", "Launch"),
+    ]
+    scheduled = schedule(post_ideas, "2030-02-04", "7", key_dates_text="Launch 2030-02-04")
+    assert scheduled[0][0] == 3
+    assert _no_repeats(_themes(post_ideas, scheduled))
+
+
+# Key dates are only given up when nothing else works: here the pin holds while the theme rule goes
+def test_schedule_keeps_key_dates_over_the_calendar_rules():
+    post_ideas = [
+        _idea("a", "Drive foot traffic", "iPhone photo"),
+        _idea("b", "Drive foot traffic", "iPhone photo"),
+        _idea("c", "Drive foot traffic", "iPhone photo", "Launch"),
+    ]
+    scheduled = schedule(post_ideas, "2030-02-04", "7", key_dates_text="Launch 2030-02-05")
+    assert dict((post, when.date()) for post, when in scheduled)[2] == date(2030, 2, 5)
+
+
+# Two posts pinned to the same single slot can't both have it, and still get scheduled
+def test_schedule_drops_key_dates_last():
+    post_ideas = [
+        _idea("a", "Drive foot traffic", "iPhone photo", "Launch"),
+        _idea("b", "Build community", "iPhone photo", "Launch"),
+    ]
+    scheduled = schedule(post_ideas, "2030-02-04", "7", key_dates_text="Launch 2030-02-04")
+    assert sorted(post for post, when in scheduled) == [0, 1]
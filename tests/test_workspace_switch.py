@@ -0,0 +1,28 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+
+PAGES = [
+    "Home.py",
+    "pages/1_idea_generator.py",
+    "pages/2_idea_vault.py",
+    "pages/3_content_calendar.py",
+    "pages/4_settings.py",
+]
+
+
+
+# Picking another workspace in the sidebar reruns the page for it
+@pytest.mark.parametrize("page", PAGES)
+def test_switch_workspace(page, workspaces):
+    default, other = workspaces
+    app = AppTest.from_file(page, default_timeout=30).run()
+    assert not app.exception
+
+    app.sidebar.selectbox(key="workspace_picker").set_value(other).run()
+    assert not app.exception
+    assert app.session_state.workspace_id == other
+
+    app.sidebar.selectbox(key="workspace_picker").set_value(default).run()
+    assert not app.exception
+    assert app.session_state.workspace_id == default